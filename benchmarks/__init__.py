@@ -0,0 +1,4 @@
+"""Performance measurements for the vault's storage and crypto layers.
+
+Run a module directly, e.g. ``python -m benchmarks.storage``.
+"""
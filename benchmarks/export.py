@@ -0,0 +1,62 @@
+"""Measures encrypted export, verification and restore throughput.
+
+Usage: ``python -m benchmarks.export [--entries N]``
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.export import export_file, import_export_file, read_export
+from vault.security import SCRYPT_MIN_N, SCRYPT, KdfParams, encrypt
+
+# The KDF runs once per file; a fixed minimum keeps it out of the numbers.
+_PARAMS = KdfParams(SCRYPT, n=SCRYPT_MIN_N)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "source.db"
+        database = VaultDatabase(source)
+        token = encrypt(fernet, "correct horse battery staple")
+        database.add_entries(
+            (f"Site {i}", f"user{i}@example.com", token, f"https://site{i}.example.com", None)
+            for i in range(args.entries)
+        )
+        database.close()
+
+        target = Path(tmp) / "vault.kpvx"
+        started = time.perf_counter()
+        exported = export_file(source, fernet, target, "benchmark", params=_PARAMS)
+        export_seconds = time.perf_counter() - started
+        size = target.stat().st_size
+
+        started = time.perf_counter()
+        verified = sum(1 for _ in read_export(target, "benchmark"))
+        verify_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        report = import_export_file(target, "benchmark", Path(tmp) / "restored.db", fernet)
+        restore_seconds = time.perf_counter() - started
+
+    print(f"file size: {size / 1e6:.1f} MB for {exported:,} entries")
+    for label, count, seconds in (
+        ("export", exported, export_seconds),
+        ("verify + decrypt", verified, verify_seconds),
+        ("restore", report.imported, restore_seconds),
+    ):
+        print(f"{label:18}{seconds:8.2f} s{count / seconds:12,.0f} entries/s{size / seconds / 1e6:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Generates synthetic vaults of realistic-looking entries.
+
+Usage: ``python -m benchmarks.generate PATH [--entries N] [--seed N]``
+
+Entries go through :meth:`VaultDatabase.add_entries` with passwords sealed
+by :func:`vault.security.encrypt`, exactly as the importer stores them. The
+same seed always yields the same titles, users and sites.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import string
+import time
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.security import encrypt
+
+BATCH_SIZE = 5000
+
+_WORDS = (
+    "acme alpha atlas aurora beacon blue bright cedar cloud cobalt comet coral crest delta echo ember "
+    "falcon fern forge galaxy garnet harbor helix indigo iris jade juniper kepler lumen maple meadow "
+    "nebula nova oak onyx orbit pine polar prism quartz raven ridge river sage sierra solar spruce "
+    "stone summit tango terra tidal topaz umber vector velvet willow zenith"
+).split()
+_KINDS = ("Mail", "Bank", "Shop", "Cloud", "Forum", "VPN", "Router", "Work", "Games", "News")
+_TLDS = ("com", "org", "net", "io", "de", "co.uk", "fr", "app")
+_ALPHABET = string.ascii_letters + string.digits + "!@#$%^&*-_"
+
+Row = Tuple[str, str, bytes, str, str]
+
+
+def synthetic_entries(fernet: Fernet, count: int, seed: int = 0) -> Iterator[Row]:
+    """Yields ``(title, username, password_encrypted, url, notes)`` rows."""
+    rng = random.Random(seed)
+    for index in range(count):
+        site = f"{rng.choice(_WORDS)}{rng.choice(_WORDS)}"
+        title = f"{site.capitalize()} {rng.choice(_KINDS)}"
+        if rng.random() < 0.3:
+            title += f" #{index}"
+        username = f"{rng.choice(_WORDS)}.{rng.choice(_WORDS)}{rng.randrange(100)}@{rng.choice(_WORDS)}.com"
+        password = "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(12, 24)))
+        url = f"https://{'www.' if rng.random() < 0.5 else ''}{site}.{rng.choice(_TLDS)}/login"
+        notes = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(0, 12)))
+        yield title, username, encrypt(fernet, password), url, notes
+
+
+def generate_vault(path: Path, count: int, fernet: Fernet, seed: int = 0) -> VaultDatabase:
+    """Creates a vault at ``path`` holding ``count`` synthetic entries and returns it open."""
+    database = VaultDatabase(path)
+    rows = synthetic_entries(fernet, count, seed)
+    remaining = count
+    while remaining > 0:
+        batch = min(BATCH_SIZE, remaining)
+        database.add_entries(row for _, row in zip(range(batch), rows))
+        remaining -= batch
+    return database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    key = Fernet.generate_key()
+    started = time.perf_counter()
+    generate_vault(args.path, args.entries, Fernet(key), args.seed).close()
+    print(f"wrote {args.entries:,} entries to {args.path} in {time.perf_counter() - started:.1f} s")
+    print(f"data key: {key.decode('ascii')}")
+
+
+if __name__ == "__main__":
+    main()
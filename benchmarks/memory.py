@@ -0,0 +1,87 @@
+"""Measures the memory an open vault holds per entry, with ``tracemalloc``.
+
+Usage: ``python -m benchmarks.memory [--sizes 10000 100000]``
+
+For each size a synthetic vault is generated (see :mod:`benchmarks.generate`)
+and the structures the app keeps in memory are built one at a time:
+
+* ``entries`` – every :class:`VaultEntry`, ciphertext included, as
+  :meth:`VaultDatabase.list_entries` returns them;
+* ``summaries`` – every :class:`EntrySummary` plus the id lookup the table
+  model keeps once the whole list has been scrolled through;
+* ``index`` – the :class:`TrigramIndex` behind quick filtering;
+* ``open vault`` – summaries and index together, which is what the main
+  window holds for a fully scrolled vault.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.search import TrigramIndex
+
+from .generate import generate_vault
+
+SIZES = (10_000, 100_000)
+
+
+def _traced_bytes(build: Callable[[], object]) -> int:
+    """Bytes still allocated by ``build`` while its result is alive."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def _summaries(database: VaultDatabase) -> object:
+    entries = list(database.iter_summaries())
+    return entries, {entry.id: entry for entry in entries}
+
+
+def _open_vault(database: VaultDatabase) -> object:
+    return _summaries(database), TrigramIndex.build(database.iter_summaries())
+
+
+def measure(database: VaultDatabase) -> Dict[str, int]:
+    return {
+        "entries": _traced_bytes(database.list_entries),
+        "summaries": _traced_bytes(lambda: _summaries(database)),
+        "index": _traced_bytes(lambda: TrigramIndex.build(database.iter_summaries())),
+        "open vault": _traced_bytes(lambda: _open_vault(database)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    print(f"{'entries':>9} {'structure':12}{'total MiB':>12}{'bytes/entry':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            database = generate_vault(Path(tmp) / f"vault-{size}.db", size, fernet)
+            try:
+                results = measure(database)
+            finally:
+                database.close()
+            for name, allocated in results.items():
+                print(f"{size:>9,} {name:12}{allocated / 2**20:12.1f}{allocated / size:14.0f}")
+
+
+if __name__ == "__main__":
+    main()
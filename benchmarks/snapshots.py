@@ -0,0 +1,64 @@
+"""Measures the cost of full and incremental deduplicated snapshots.
+
+Usage: ``python -m benchmarks.snapshots [--entries N] [--edits N]``
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from vault.config import ConfigManager
+from vault.database import VaultDatabase
+from vault.security import create_master_config, encrypt, unlock
+from vault.snapshots import SnapshotStore
+
+
+def _stored_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = ConfigManager(Path(tmp) / "config.json")
+        config.write(create_master_config("benchmark"))
+        fernet = unlock("benchmark", config.read())[0]
+        source = Path(tmp) / "vault.db"
+        database = VaultDatabase(source)
+        database.add_entries(
+            (f"Site {i}", f"user{i}@example.com", encrypt(fernet, f"pw{i}"), f"https://site{i}.example.com", None)
+            for i in range(args.entries)
+        )
+        store = SnapshotStore(Path(tmp) / "snapshots")
+        rows = []
+
+        started = time.perf_counter()
+        first = store.snapshot(source, config.path, fernet)
+        rows.append(("full snapshot", time.perf_counter() - started, first))
+
+        step = max(args.entries // max(args.edits, 1), 1)
+        for entry_id in range(1, args.entries + 1, step):
+            database.update_entry(entry_id, f"Edited {entry_id}", "someone", encrypt(fernet, "new"), None, None)
+        started = time.perf_counter()
+        second = store.snapshot(source, config.path, fernet)
+        rows.append((f"after {args.edits} edits", time.perf_counter() - started, second))
+
+        started = time.perf_counter()
+        store.restore(second.id, Path(tmp) / "restored", fernet)
+        restore_seconds = time.perf_counter() - started
+        database.close()
+
+        print(f"database size: {source.stat().st_size / 1e6:.1f} MB, store size: {_stored_bytes(store.directory) / 1e6:.1f} MB")
+        for label, seconds, info in rows:
+            print(f"{label:18}{seconds:8.2f} s{info.new_chunks:8}/{info.chunks} chunks{info.new_bytes / 1e6:9.2f} MB new")
+        print(f"{'restore':18}{restore_seconds:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
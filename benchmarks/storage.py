@@ -0,0 +1,87 @@
+"""Compares write and read throughput of SQLite's defaults with the vault's storage profile.
+
+Usage: ``python -m benchmarks.storage [--entries N] [--readers N]``
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+
+from vault.database import DEFAULT_STORAGE, SQLITE_DEFAULTS, StorageProfile, VaultDatabase
+
+_CIPHERTEXT = os.urandom(120)
+
+
+def _populate(database: VaultDatabase, entries: int) -> float:
+    """Adds ``entries`` rows one transaction at a time, like the UI does."""
+    started = time.perf_counter()
+    for i in range(entries):
+        database.add_entry(f"Site {i:06d}", f"user{i}@example.com", _CIPHERTEXT, f"https://site{i}.example.com", None)
+    return time.perf_counter() - started
+
+
+def _scan(database: VaultDatabase) -> int:
+    return sum(1 for _ in database.iter_summaries())
+
+
+def _search(database: VaultDatabase, rounds: int) -> int:
+    return sum(len(database.search(f"site {i % 1000:03d}", 50)) for i in range(rounds))
+
+
+def run_profile(profile: StorageProfile, entries: int, readers: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        database = VaultDatabase(Path(tmp) / "bench.db", profile)
+        try:
+            write_seconds = _populate(database, entries)
+
+            started = time.perf_counter()
+            rows = _scan(database)
+            scan_seconds = time.perf_counter() - started
+
+            # Readers search while the writer keeps committing single rows.
+            rounds = 200
+            with ThreadPoolExecutor(readers) as pool:
+                started = time.perf_counter()
+                searches = [pool.submit(_search_on_reader, database, rounds) for _ in range(readers)]
+                _populate(database, 200)
+                for future in searches:
+                    future.result()
+                mixed_seconds = time.perf_counter() - started
+        finally:
+            database.close()
+    return {
+        "inserts_per_second": entries / write_seconds,
+        "rows_scanned_per_second": rows / scan_seconds,
+        "searches_per_second_under_writes": readers * rounds / mixed_seconds,
+    }
+
+
+def _search_on_reader(database: VaultDatabase, rounds: int) -> int:
+    with database.reader() as reader:
+        return _search(reader, rounds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=DEFAULT_STORAGE.readers)
+    args = parser.parse_args()
+
+    profiles = {
+        "sqlite defaults": StorageProfile(**{**SQLITE_DEFAULTS.__dict__, "readers": args.readers}),
+        "vault profile": StorageProfile(**{**DEFAULT_STORAGE.__dict__, "readers": args.readers}),
+    }
+    results = {name: run_profile(profile, args.entries, args.readers) for name, profile in profiles.items()}
+    metrics = list(next(iter(results.values())))
+    print(f"{'metric':36}" + "".join(f"{name:>18}" for name in results))
+    for metric in metrics:
+        print(f"{metric:36}" + "".join(f"{result[metric]:>18,.0f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""End-to-end benchmark suite over synthetic vaults, with JSON results.
+
+Usage::
+
+    python -m benchmarks.suite run [--sizes 1000 10000 100000 1000000] [--output results.json]
+    python -m benchmarks.suite compare baseline.json results.json [--threshold 20]
+
+``run`` generates one vault per size (see :mod:`benchmarks.generate`) and
+times CRUD, listing and the table refresh on each, plus unlock and crypto
+throughput once. The table refresh runs a real :class:`EntryTableModel`
+behind a ``QTableView`` on Qt's offscreen platform. Metrics ending in
+``_seconds`` are better when lower, those ending in ``_per_second`` when
+higher. ``compare`` prints the change of every metric and exits with status
+1 if any got worse by more than ``--threshold`` percent.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hmac
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from hashlib import pbkdf2_hmac
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.security import (
+    PBKDF2_ITERATIONS,
+    SCRYPT,
+    KdfParams,
+    create_master_config,
+    decrypt,
+    encrypt,
+    generate_salt,
+    unlock,
+)
+
+from .generate import generate_vault, synthetic_entries
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+CRUD_OPERATIONS = 200
+CRYPTO_OPERATIONS = 20_000
+REPEATS = 5
+
+_PASSWORD = "correct horse battery staple"
+# Calibration picks different costs from run to run; a fixed cost keeps
+# unlock timings comparable.
+_UNLOCK_KDF = KdfParams(SCRYPT, n=2**16)
+
+Metrics = Dict[str, float]
+
+
+def _median_seconds(fn: Callable[[], object], repeats: int = REPEATS) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _median_per_call(fn: Callable[[Any], object], arguments: List[Any]) -> float:
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        fn(argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _legacy_pbkdf2(salt: bytes) -> bytes:
+    return pbkdf2_hmac("sha256", _PASSWORD.encode("utf-8"), salt, PBKDF2_ITERATIONS, dklen=32)
+
+
+def bench_crypto() -> Metrics:
+    salt = generate_salt()
+    expected = _legacy_pbkdf2(salt)
+
+    def legacy_unlock() -> None:
+        # The version 1 unlock, kept only as a baseline: one PBKDF2 run to
+        # check the stored hash and a second one for the Fernet key.
+        hmac.compare_digest(_legacy_pbkdf2(salt), expected)
+        Fernet(base64.urlsafe_b64encode(_legacy_pbkdf2(salt)))
+
+    config = create_master_config(_PASSWORD, _UNLOCK_KDF)
+    fernet = Fernet(Fernet.generate_key())
+    tokens = [encrypt(fernet, f"password-{i}") for i in range(CRYPTO_OPERATIONS)]
+    encrypt_seconds = _median_seconds(
+        lambda: [encrypt(fernet, f"password-{i}") for i in range(CRYPTO_OPERATIONS)], 3
+    )
+    decrypt_seconds = _median_seconds(lambda: [decrypt(fernet, token) for token in tokens], 3)
+    return {
+        "unlock_legacy_seconds": _median_seconds(legacy_unlock, 3),
+        "unlock_seconds": _median_seconds(lambda: unlock(_PASSWORD, config), 3),
+        "encrypt_per_second": CRYPTO_OPERATIONS / encrypt_seconds,
+        "decrypt_per_second": CRYPTO_OPERATIONS / decrypt_seconds,
+    }
+
+
+def bench_database(database: VaultDatabase, fernet: Fernet, size: int) -> Metrics:
+    rng = random.Random(size)
+    metrics: Metrics = {}
+    # Listing everything is too slow to repeat at a million entries.
+    metrics["list_entries_seconds"] = _median_seconds(database.list_entries, 1 if size >= 1_000_000 else 3)
+    metrics["first_page_seconds"] = _median_seconds(lambda: database.list_summaries(None, 256))
+    metrics["search_seconds"] = _median_seconds(lambda: database.search("nova", 50))
+
+    rows = list(synthetic_entries(fernet, CRUD_OPERATIONS, seed=size + 1))
+    targets = rng.sample(range(1, size + 1), min(CRUD_OPERATIONS, size))
+    added: List[int] = []
+    # Per-operation medians: a WAL checkpoint lands in whichever run it
+    # happens to, and would swing a mean by tens of percent.
+    metrics["add_seconds"] = _median_per_call(lambda row: added.append(database.add_entry(*row)), rows)
+    metrics["update_seconds"] = _median_per_call(
+        lambda pair: database.update_entry(pair[0], *pair[1]), list(zip(targets, rows))
+    )
+    metrics["delete_seconds"] = _median_per_call(database.delete_entry, added)
+    return metrics
+
+
+def bench_table_refresh(path: Path, size: int) -> Metrics:
+    """Times a full model reload until the first page is on screen, offscreen."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtCore import Qt
+    from PyQt6.QtWidgets import QApplication, QTableView
+
+    from vault.ui.models import EntryTableModel
+    from vault.worker import AsyncVaultDatabase
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    database = AsyncVaultDatabase(path)
+    model = EntryTableModel(database)
+    view = QTableView()
+    view.setModel(model)
+    view.resize(900, 600)
+    view.show()
+    expected = min(EntryTableModel.BATCH_SIZE, size)
+
+    def refresh(action: Callable[[], None]) -> None:
+        action()
+        deadline = time.perf_counter() + 60
+        while model.rowCount() < expected and time.perf_counter() < deadline:
+            app.processEvents()
+        app.processEvents()
+
+    try:
+        refresh(model.reload)
+        return {
+            "table_refresh_seconds": _median_seconds(lambda: refresh(model.reload), 11),
+            "table_sort_seconds": _median_seconds(
+                lambda: refresh(lambda: model.sort(1, Qt.SortOrder.DescendingOrder)), 11
+            ),
+        }
+    finally:
+        view.close()
+        database.close()
+
+
+def run(sizes: List[int], workdir: Path) -> Dict[str, object]:
+    results: Dict[str, Metrics] = {"crypto": bench_crypto()}
+    for size in sizes:
+        path = workdir / f"vault-{size}.db"
+        key = Fernet.generate_key()
+        fernet = Fernet(key)
+        started = time.perf_counter()
+        database = generate_vault(path, size, fernet)
+        metrics: Metrics = {"generate_seconds": time.perf_counter() - started}
+        try:
+            metrics.update(bench_database(database, fernet, size))
+        finally:
+            database.close()
+        metrics.update(bench_table_refresh(path, size))
+        results[str(size)] = metrics
+        print(f"{size:>9,} entries: " + ", ".join(f"{name}={value:.4g}" for name, value in metrics.items()))
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, object], current: Dict[str, object], threshold: float) -> List[str]:
+    """Prints both runs side by side and returns the metrics that regressed."""
+    regressions = []
+    print(f"{'group':>10} {'metric':28}{'baseline':>14}{'current':>14}{'change':>10}")
+    for group, metrics in current["results"].items():
+        for name, value in metrics.items():
+            before = baseline["results"].get(group, {}).get(name)
+            if before is None or name == "generate_seconds":
+                continue
+            change = (value - before) / before * 100 if before else 0.0
+            worse = change > threshold if name.endswith("_seconds") else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{group:>10} {name:28}{before:14.6g}{value:14.6g}{change:+9.1f}%{flag}")
+            if worse:
+                regressions.append(f"{group}/{name}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    run_parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run(args.sizes, Path(tmp))
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"results written to {args.output}")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    current = json.loads(args.current.read_text(encoding="utf-8"))
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
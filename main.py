@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import sys
+from vault import tracing
 from vault.app import VaultApp
 from vault.config import APP_DIR
 from vault.ui.icon_assets import load_app_icon
@@ -9,6 +10,7 @@ from vault.ui.main_window import MainWindow
 
 
 def main() -> int:
+    tracing.enable_from_environment()
     app = VaultApp(sys.argv)
     APP_DIR.mkdir(parents=True, exist_ok=True)
     app_icon = load_app_icon()
@@ -20,7 +22,7 @@ def main() -> int:
     def handle_authenticated(fernet) -> None:
         app.set_fernet(fernet)
         app.initialize_database()
-        window = MainWindow(app.database, fernet)
+        window = MainWindow(app.database, fernet, app.config)
         window.setWindowIcon(app_icon)
         window.show()
         login.close()
@@ -0,0 +1,10 @@
+import pytest
+
+from vault import security
+from vault.security import SCRYPT, KdfParams
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    """Skips KDF calibration; the scrypt floor is slow enough for tests."""
+    monkeypatch.setattr(security, "calibrate_kdf", lambda *args, **kwargs: KdfParams(SCRYPT, n=security.SCRYPT_MIN_N))
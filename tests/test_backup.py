@@ -0,0 +1,58 @@
+import sqlite3
+
+from vault.backup import BackupScheduler, config_backup, list_backups
+from vault.config import ConfigManager
+from vault.database import VaultDatabase
+from vault.rekey import change_master_password
+from vault.security import create_master_config, decrypt, encrypt, unlock
+
+
+def _vault(tmp_path, password="old password"):
+    config = ConfigManager(tmp_path / "config.json")
+    config.write(create_master_config(password))
+    fernet = unlock(password, config.read())[0]
+    path = tmp_path / "vault.db"
+    database = VaultDatabase(path)
+    database.add_entry("Mail", "me", encrypt(fernet, "hunter2"), None, None)
+    database.close()
+    return path, config
+
+
+def _scheduler(tmp_path, path, config, keep=7):
+    return BackupScheduler(path, tmp_path / "backups", keep=keep, step_sleep=0, config=config.path)
+
+
+def test_backups_in_the_same_second_do_not_overwrite_each_other(tmp_path):
+    path, config = _vault(tmp_path)
+    scheduler = _scheduler(tmp_path, path, config)
+    first = scheduler.backup_now()
+    second = scheduler.backup_now()
+    assert first != second
+    assert list_backups(tmp_path / "backups") == [first, second]
+    assert config_backup(first).exists() and config_backup(second).exists()
+
+
+def test_backup_stays_readable_after_a_password_change(tmp_path):
+    path, config = _vault(tmp_path)
+    backup = _scheduler(tmp_path, path, config).backup_now()
+    assert change_master_password(path, config, "old password", "new password").completed
+
+    # The live config no longer unlocks the backup's entries; the saved one does.
+    saved = ConfigManager(config_backup(backup)).read()
+    fernet = unlock("old password", saved)[0]
+    conn = sqlite3.connect(backup)
+    try:
+        (token,) = conn.execute("SELECT password_encrypted FROM entries").fetchone()
+    finally:
+        conn.close()
+    assert decrypt(fernet, token) == "hunter2"
+
+
+def test_prune_removes_the_config_copies(tmp_path):
+    path, config = _vault(tmp_path)
+    scheduler = _scheduler(tmp_path, path, config, keep=2)
+    backups = [scheduler.backup_now() for _ in range(4)]
+    assert list_backups(tmp_path / "backups") == backups[2:]
+    assert sorted(p.name for p in (tmp_path / "backups").iterdir()) == sorted(
+        name for backup in backups[2:] for name in (backup.name, config_backup(backup).name)
+    )
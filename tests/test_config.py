@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from vault import config as config_module
+from vault.config import ConfigManager
+
+
+def test_write_replaces_the_file(tmp_path):
+    config = ConfigManager(tmp_path / "config.json")
+    config.write({"salt": "a"})
+    config.write({"salt": "b"})
+    assert config.read() == {"salt": "b"}
+    assert [path.name for path in tmp_path.iterdir()] == ["config.json"]
+
+
+def test_failed_write_keeps_the_previous_config(tmp_path, monkeypatch):
+    config = ConfigManager(tmp_path / "config.json")
+    config.write({"wrapped_key": "original"})
+
+    def crash(data, fp, **kwargs):
+        fp.write('{"wrapped_key": ')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(config_module.json, "dump", crash)
+    with pytest.raises(OSError):
+        config.write({"wrapped_key": "new"})
+    assert json.loads((tmp_path / "config.json").read_text()) == {"wrapped_key": "original"}
+    assert not (tmp_path / "config.json.partial").exists()
@@ -0,0 +1,139 @@
+import json
+import struct
+import threading
+
+import pytest
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.export import MAGIC, export_vault, import_export_file, read_header
+from vault.security import SCRYPT, KdfParams, decrypt, encrypt
+
+ENTRIES = 5000
+FAST_KDF = KdfParams(SCRYPT, n=2**14)
+
+
+@pytest.fixture
+def fernet():
+    return Fernet(Fernet.generate_key())
+
+
+@pytest.fixture
+def export_path(tmp_path, fernet):
+    source = VaultDatabase(tmp_path / "source.db")
+    path = tmp_path / "vault.kpvx"
+    try:
+        source.add_entries((f"Site {i}", f"user{i}", encrypt(fernet, f"pw{i}"), None, None) for i in range(ENTRIES))
+        export_vault(source, fernet, path, "export password", params=FAST_KDF, chunk_size=4096)
+    finally:
+        source.close()
+    return path
+
+
+@pytest.fixture
+def target(tmp_path):
+    path = tmp_path / "target.db"
+    database = VaultDatabase(path)
+    database.add_entry("Existing", "me", b"token", None, None)
+    database.close()
+    return path
+
+
+def _titles(path):
+    database = VaultDatabase(path)
+    try:
+        return [summary.title for summary in database.iter_summaries()]
+    finally:
+        database.close()
+
+
+def test_restore_adds_every_entry(export_path, target, fernet):
+    report = import_export_file(export_path, "export password", target, fernet)
+    assert report.imported == ENTRIES
+    database = VaultDatabase(target)
+    try:
+        assert database.count_entries() == ENTRIES + 1
+        entry = database.search("Site 4321", 1)[0]
+        assert decrypt(fernet, database.get_entry(entry.id).password_encrypted) == "pw4321"
+    finally:
+        database.close()
+    assert not [path for path in target.parent.iterdir() if ".restore" in path.name]
+
+
+def test_restore_keeps_entry_times(tmp_path, export_path, target, fernet):
+    source = VaultDatabase(tmp_path / "source.db")
+    try:
+        expected = {entry.title: (entry.created_at, entry.updated_at) for entry in source.iter_entries()}
+    finally:
+        source.close()
+    import_export_file(export_path, "export password", target, fernet)
+    database = VaultDatabase(target)
+    try:
+        restored = {
+            entry.title: (entry.created_at, entry.updated_at) for entry in database.iter_entries() if entry.id > 1
+        }
+    finally:
+        database.close()
+    assert restored == expected
+
+
+@pytest.mark.parametrize(
+    "kdf",
+    [
+        {"name": SCRYPT, "n": 2**30, "r": 8, "p": 1},
+        {"name": SCRYPT, "n": 2**14, "r": 8, "p": 64},
+        {"name": SCRYPT, "n": 2**10, "r": 8, "p": 1},
+        {"name": "pbkdf2-sha256", "iterations": 10**12},
+        {"name": SCRYPT, "n": 2**14, "cost": 1},
+    ],
+)
+def test_header_with_unacceptable_kdf_is_rejected(export_path, kdf):
+    data = export_path.read_bytes()
+    position = len(MAGIC)
+    (header_length,) = struct.unpack(">I", data[position : position + 4])
+    header = json.loads(data[position + 4 : position + 4 + header_length])
+    header["kdf"] = kdf
+    raw = json.dumps(header).encode("utf-8")
+    export_path.write_bytes(MAGIC + struct.pack(">I", len(raw)) + raw + data[position + 4 + header_length :])
+    with export_path.open("rb") as fp, pytest.raises(ValueError):
+        read_header(fp)
+
+
+def test_truncated_export_restores_nothing(export_path, target, fernet):
+    data = export_path.read_bytes()
+    export_path.write_bytes(data[: int(len(data) * 0.8)])
+    with pytest.raises(ValueError):
+        import_export_file(export_path, "export password", target, fernet)
+    assert _titles(target) == ["Existing"]
+    assert not target.with_name(target.name + ".restore").exists()
+
+
+def test_missing_final_chunk_restores_nothing(export_path, target, fernet):
+    data = export_path.read_bytes()
+    # Drop the last sealed chunk exactly, so every remaining chunk still authenticates.
+    export_path.write_bytes(_without_last_chunk(data))
+    with pytest.raises(ValueError, match="incomplete"):
+        import_export_file(export_path, "export password", target, fernet)
+    assert _titles(target) == ["Existing"]
+
+
+def test_cancelled_restore_restores_nothing(export_path, target, fernet):
+    cancel = threading.Event()
+    report = import_export_file(
+        export_path, "export password", target, fernet, cancel, lambda done, total: cancel.set()
+    )
+    assert report.cancelled
+    assert report.imported == 0
+    assert _titles(target) == ["Existing"]
+
+
+def _without_last_chunk(data):
+    position = len(MAGIC)
+    (header_length,) = struct.unpack(">I", data[position : position + 4])
+    position += 4 + header_length
+    last = position
+    while position < len(data):
+        last = position
+        (length,) = struct.unpack(">I", data[position : position + 4])
+        position += 4 + length
+    return data[:last]
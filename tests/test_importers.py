@@ -0,0 +1,30 @@
+import io
+import xml.etree.ElementTree as ElementTree
+
+from vault.importers import ImportRecord, read_keepass_xml
+
+KEEPASS = b"""<KeePassFile><Root><Group><Name>Root</Name>
+<Entry><String><Key>Title</Key><Value>Mail</Value></String>
+<String><Key>Password</Key><Value>new</Value></String>
+<History><Entry><String><Key>Title</Key><Value>Mail</Value></String>
+<String><Key>Password</Key><Value>old</Value></String></Entry></History></Entry>
+<Group><Name>Work</Name><Entry><String><Key>Title</Key><Value>VPN</Value></String></Entry></Group>
+</Group></Root></KeePassFile>"""
+
+
+def test_keepass_history_is_skipped_and_finished_elements_are_dropped(monkeypatch):
+    roots = []
+    iterparse = ElementTree.iterparse
+
+    def spy(*args, **kwargs):
+        for event, element in iterparse(*args, **kwargs):
+            if not roots:
+                roots.append(element)
+            yield event, element
+
+    monkeypatch.setattr(ElementTree, "iterparse", spy)
+    records = list(read_keepass_xml(io.BytesIO(KEEPASS)))
+
+    assert [(record.title, record.password) for record in records] == [("Mail", "new"), ("VPN", "")]
+    assert all(isinstance(record, ImportRecord) for record in records)
+    assert len(list(roots[0].iter("Entry"))) == 0 and len(list(roots[0].iter("Group"))) == 0
@@ -0,0 +1,130 @@
+import shutil
+
+import pytest
+from cryptography.fernet import Fernet
+
+from vault.database import VaultDatabase
+from vault.merge import LOCAL, REMOTE, merge_files, merge_vaults
+from vault.migrations import SYNC_PREFIX, sync_leaf
+from vault.security import decrypt, encrypt
+
+
+@pytest.fixture
+def fernet():
+    return Fernet(Fernet.generate_key())
+
+
+@pytest.fixture
+def copies(tmp_path, fernet):
+    """Two copies of one vault, merged once so each entry has a common ancestor."""
+    local = VaultDatabase(tmp_path / "local.db")
+    local.add_entries((f"Site {i}", f"user{i}", encrypt(fernet, f"pw{i}"), None, None) for i in range(20))
+    local.close()
+    shutil.copy(tmp_path / "local.db", tmp_path / "remote.db")
+    local, remote = VaultDatabase(tmp_path / "local.db"), VaultDatabase(tmp_path / "remote.db")
+    merge_vaults(local, remote)
+    yield local, remote
+    local.close()
+    remote.close()
+
+
+def _edit(database, fernet, entry_id, password):
+    entry = database.get_entry(entry_id)
+    database.update_entry(entry_id, entry.title, entry.username, encrypt(fernet, password), entry.url, entry.notes)
+
+
+def test_unequal_edit_counts_are_a_conflict(copies, fernet):
+    local, remote = copies
+    _edit(local, fernet, 1, "local 1")
+    _edit(local, fernet, 1, "local 2")
+    _edit(remote, fernet, 1, "remote 1")
+
+    report = merge_vaults(local, remote)
+
+    assert [conflict.title for conflict in report.conflicts] == ["Site 0"]
+    assert decrypt(fernet, local.get_entry(1).password_encrypted) == decrypt(
+        fernet, remote.get_entry(1).password_encrypted
+    )
+
+
+def test_change_on_one_side_wins_without_conflict(copies, fernet):
+    local, remote = copies
+    for _ in range(3):
+        _edit(remote, fernet, 2, "remote")
+
+    report = merge_vaults(local, remote)
+
+    assert report.conflicts == [] and report.pulled == 1
+    assert decrypt(fernet, local.get_entry(2).password_encrypted) == "remote"
+    assert merge_vaults(local, remote).conflicts == []
+
+
+def test_delete_against_edit_is_a_conflict(copies, fernet):
+    local, remote = copies
+    local.delete_entry(3)
+    _edit(remote, fernet, 3, "remote")
+
+    report = merge_vaults(local, remote)
+
+    assert len(report.conflicts) == 1
+    assert report.conflicts[0].kept in (LOCAL, REMOTE)
+    assert local.sync_state() == remote.sync_state()
+
+
+def test_second_merge_of_settled_copies_finds_nothing(copies, fernet):
+    local, remote = copies
+    _edit(local, fernet, 4, "local")
+    merge_vaults(local, remote)
+    _edit(remote, fernet, 4, "remote again")
+
+    report = merge_vaults(local, remote)
+
+    assert report.conflicts == []
+    assert decrypt(fernet, local.get_entry(4).password_encrypted) == "remote again"
+
+
+def test_buckets_follow_every_write(copies, fernet):
+    local, _ = copies
+    _edit(local, fernet, 5, "local")
+    local.delete_entry(6)
+    local.apply_sync_records(local.get_sync_records([state[0] for state in local.sync_state()[:3]]))
+    expected = {}
+    for uuid, revision, modified_at, deleted in local.sync_state():
+        expected[uuid[:SYNC_PREFIX]] = expected.get(uuid[:SYNC_PREFIX], 0) ^ sync_leaf(
+            uuid, revision, modified_at, deleted
+        )
+    assert local.sync_buckets() == {prefix: value for prefix, value in expected.items() if value}
+
+
+def test_merging_a_file_only_reads_it(copies, fernet, tmp_path):
+    local, remote = copies
+    _edit(local, fernet, 8, "local")
+    _edit(remote, fernet, 9, "remote")
+    remote.close()
+    path = tmp_path / "remote.db"
+    before = path.read_bytes()
+    siblings = sorted(tmp_path.iterdir())
+
+    report = merge_files(tmp_path / "local.db", path, fernet)
+
+    assert report.pulled == 1 and report.kept == 1 and report.pushed == 0
+    assert path.read_bytes() == before and sorted(tmp_path.iterdir()) == siblings
+    local.close()
+    local = VaultDatabase(tmp_path / "local.db")
+    assert decrypt(fernet, local.get_entry(9).password_encrypted) == "remote"
+    assert decrypt(fernet, local.get_entry(8).password_encrypted) == "local"
+    local.close()
+
+
+def test_merging_both_ways_one_side_at_a_time_converges(copies, fernet):
+    local, remote = copies
+    _edit(remote, fernet, 10, "remote")
+    merge_vaults(local, remote, push=False)
+    _edit(local, fernet, 10, "local")
+    local.delete_entry(11)
+
+    report = merge_vaults(remote, local, push=False)
+
+    assert report.conflicts == [] and report.pulled == 2
+    assert merge_vaults(local, remote, push=False).pulled == 0
+    assert local.sync_state() == remote.sync_state()
@@ -0,0 +1,182 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import Qt  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from vault.database import VaultDatabase  # noqa: E402
+from vault.ui.models import EntryTableModel  # noqa: E402
+from vault.worker import AsyncVaultDatabase  # noqa: E402
+
+ENTRIES = 3000
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def database(tmp_path, app):
+    path = tmp_path / "vault.db"
+    titles = [f"Site {i:04d}" for i in range(ENTRIES)]
+    random.Random(7).shuffle(titles)
+    seed = VaultDatabase(path)
+    seed.add_entries((title, "user", b"token", None, None) for title in titles)
+    seed.close()
+    database = AsyncVaultDatabase(path)
+    yield database
+    database.close()
+
+
+def _model(database, **kwargs):
+    model = EntryTableModel(database, **kwargs)
+    database.entry_changed.connect(model.apply_change)
+    return model
+
+
+def _settle(app, database, model=None):
+    """Lets every queued read and write finish and their results reach the model.
+
+    A write waiting for evicted rows costs one more round trip, so this runs
+    until the model has applied every change.
+    """
+    for _ in range(1000):
+        database.call(lambda db: None).result(timeout=10)
+        app.processEvents()
+        if model is None or not model._steps:
+            break
+
+
+def _rows(app, database, model):
+    rows = []
+    for row in range(model.rowCount()):
+        entry = model.entry_at(row)
+        if entry is None:
+            _settle(app, database, model)
+            entry = model.entry_at(row)
+        rows.append(entry.id)
+    return rows
+
+
+def _listing(database, descending=False):
+    listing = database.call(lambda db: db.list_summaries(None, 10 * ENTRIES, "title", descending)).result()
+    return [entry.id for entry in listing]
+
+
+def test_rows_past_the_first_page_are_read_on_demand(app, database):
+    model = _model(database)
+    model.reload()
+    _settle(app, database)
+    assert model.rowCount() == ENTRIES
+    assert model.entry_at(2900) is None
+    _settle(app, database)
+    assert model.entry_at(2900).title == "Site 2900"
+    assert _rows(app, database, model) == _listing(database)
+
+
+@pytest.mark.parametrize("write_first", [True, False])
+def test_write_during_reload_is_counted_once(app, database, write_first):
+    model = _model(database)
+    model.reload()
+    _settle(app, database)
+    gate = threading.Event()
+    database.call(lambda db: gate.wait())
+    if write_first:
+        database.request("add_entry", "New", "user", b"token", None, None)
+        model.reload()
+    else:
+        model.reload()
+        database.request("add_entry", "New", "user", b"token", None, None)
+    gate.set()
+    _settle(app, database)
+    assert model.rowCount() == ENTRIES + 1
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_writes_keep_rows_in_listing_order(app, database, descending):
+    model = _model(database, cache_size=0)
+    model.sort(0, Qt.SortOrder.DescendingOrder if descending else Qt.SortOrder.AscendingOrder)
+    _settle(app, database)
+    _rows(app, database, model)
+    # Only the last pages read still have their rows cached.
+    database.request("add_entry", "Site 0000a", "user", b"token", None, None)
+    database.request("add_entry", "Site 9999", "user", b"token", None, None)
+    database.request("update_entry", 5, "Site 1500a", "user", b"token", None, None)
+    database.request("update_entry", 6, "Site 2999a", "user", b"token", None, None)
+    database.request("delete_entry", 7)
+    _settle(app, database, model)
+    assert model.rowCount() == ENTRIES + 1
+    assert _rows(app, database, model) == _listing(database, descending)
+
+
+def test_writes_past_the_loaded_rows_only_move_the_count(app, database):
+    model = _model(database)
+    model.reload()
+    _settle(app, database)
+    database.request("add_entry", "Zzz", "user", b"token", None, None)
+    database.request("delete_entry", 1)
+    _settle(app, database)
+    assert model.rowCount() == ENTRIES
+    assert _rows(app, database, model) == _listing(database)
+
+
+@pytest.mark.parametrize("column", [0, 1])
+def test_interleaved_writes_and_page_ins_match_the_listing(app, database, column):
+    rnd = random.Random(column)
+    model = _model(database, cache_size=0)
+    model.sort(column, Qt.SortOrder.AscendingOrder)
+    _settle(app, database)
+    live = list(range(1, ENTRIES + 1))
+    for _ in range(300):
+        roll = rnd.random()
+        if roll < 0.3:
+            title, username = f"Site {rnd.randrange(10000):04d}x", f"u{rnd.randrange(99)}"
+            database.request("add_entry", title, username, b"t", None, None)
+        elif roll < 0.6:
+            entry_id = rnd.choice(live)
+            database.request("update_entry", entry_id, f"Site {rnd.randrange(10000):04d}y", "u", b"t", None, None)
+        elif roll < 0.7:
+            database.request("delete_entry", live.pop(rnd.randrange(len(live))))
+        else:
+            model.entry_at(rnd.randrange(model.rowCount()))
+        if rnd.random() < 0.2:
+            app.processEvents()
+    _settle(app, database, model)
+    listing = database.call(lambda db: db.list_summaries(None, 10 * ENTRIES, model._order_by)).result()
+    assert _rows(app, database, model) == [entry.id for entry in listing]
+
+
+def test_ids_of_evicted_rows_stay_known(app, database):
+    model = _model(database, cache_size=0)
+    model.reload()
+    _settle(app, database)
+    listing = _rows(app, database, model)
+    assert model.entry_at(0) is None
+    assert [model.id_at(row) for row in range(model.rowCount())] == listing
+
+
+def test_search_sees_writes_queued_before_it(app, database):
+    model = _model(database)
+    model.reload()
+    _settle(app, database)
+    gate = threading.Event()
+    database.call(lambda db: gate.wait())
+    database.request("update_entry", 1, "Renamed", "user", b"token", None, None)
+    model.set_search("renamed")
+    database.request("delete_entry", 2)
+    # Long enough for a search that did not wait for the update to finish.
+    time.sleep(0.2)
+    gate.set()
+    for _ in range(200):
+        _settle(app, database)
+        if not model._reloading:
+            break
+        time.sleep(0.01)
+    assert [model.entry_at(row).title for row in range(model.rowCount())] == ["Renamed"]
@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+import pytest
+
+from vault.querylog import ProfiledConnection, QueryLog
+
+ROWS = 1000
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:", factory=ProfiledConnection)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO items (id) VALUES (?)", [(i,) for i in range(ROWS)])
+    conn.create_function("pause", 1, lambda value: time.sleep(0.002) or value)
+    yield conn
+    conn.close()
+
+
+def _attach(conn, threshold_ms=1000.0):
+    log = QueryLog(threshold_ms, log_dir=None)
+    log.attach(conn)
+    return log
+
+
+def _stats(log, prefix):
+    return next(stats for stats in log.stats() if stats.sql.startswith(prefix))
+
+
+def test_unfetched_cursor_is_recorded(conn):
+    log = _attach(conn)
+    conn.execute("SELECT id FROM items")
+    stats = _stats(log, "SELECT id")
+    assert stats.calls == 1 and stats.rows == 0
+
+
+def test_iteration_fetches_lazily(conn):
+    log = _attach(conn)
+    for _ in conn.execute("SELECT id FROM items"):
+        break
+    partial = _stats(log, "SELECT id")
+    assert partial.calls == 1 and 0 < partial.rows < ROWS
+
+    log.reset()
+    assert sum(1 for _ in conn.execute("SELECT id FROM items")) == ROWS
+    full = _stats(log, "SELECT id")
+    assert full.calls == 1 and full.rows == ROWS
+
+
+def test_slow_fetches_are_logged_once(conn):
+    log = _attach(conn, threshold_ms=20.0)
+    cursor = conn.execute("SELECT pause(id) FROM items WHERE id < 40")
+    assert _stats(log, "SELECT pause").slow == 0
+    cursor.fetchall()
+    stats = _stats(log, "SELECT pause")
+    assert stats.calls == 1 and stats.rows == 40
+    assert stats.slow == 1 and stats.max_ms >= 20.0 and stats.plan
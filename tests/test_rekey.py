@@ -0,0 +1,101 @@
+import base64
+import threading
+from hashlib import pbkdf2_hmac
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+from vault.config import ConfigManager
+from vault.database import VaultDatabase
+from vault.rekey import change_master_password, resume_master_password_change
+from vault.security import PBKDF2_ITERATIONS, PENDING_REKEY, create_master_config, decrypt, encrypt, unlock
+
+
+@pytest.fixture
+def vault(tmp_path):
+    config = ConfigManager(tmp_path / "config.json")
+    config.write(create_master_config("old password"))
+    fernet = unlock("old password", config.read())[0]
+    path = tmp_path / "vault.db"
+    database = VaultDatabase(path)
+    try:
+        database.add_entries((f"Site {i}", "user", encrypt(fernet, f"pw{i}"), None, None) for i in range(1200))
+    finally:
+        database.close()
+    return path, config
+
+
+def _passwords(path, fernet):
+    database = VaultDatabase(path)
+    try:
+        return [decrypt(fernet, entry.password_encrypted) for entry in database.iter_entries(order_by="updated_at")]
+    finally:
+        database.close()
+
+
+def _pause_after_first_batch(path, config, new_password):
+    cancel = threading.Event()
+    job = change_master_password(path, config, "old password", new_password, cancel, lambda done, total: cancel.set())
+    assert not job.completed
+    return job
+
+
+def test_change_completes(vault):
+    path, config = vault
+    job = change_master_password(path, config, "old password", "new password")
+    assert job.completed
+    fernet = unlock("new password", config.read())[0]
+    assert sorted(_passwords(path, fernet)) == sorted(f"pw{i}" for i in range(1200))
+
+
+def test_paused_change_refuses_a_second_change_and_resumes(vault):
+    path, config = vault
+    _pause_after_first_batch(path, config, "new password")
+
+    with pytest.raises(ValueError):
+        change_master_password(path, config, "old password", "other password")
+
+    # Next session: the old password still unlocks and the first change resumes.
+    fernet = unlock("old password", config.read())[0]
+    job = resume_master_password_change(path, config, fernet)
+    assert job.completed
+    assert unlock("old password", config.read()) is None
+    assert unlock("other password", config.read()) is None
+    fernet = unlock("new password", config.read())[0]
+    assert sorted(_passwords(path, fernet)) == sorted(f"pw{i}" for i in range(1200))
+
+
+def test_paused_change_resumes_with_the_key_the_job_hands_back(vault):
+    path, config = vault
+    job = _pause_after_first_batch(path, config, "new password")
+    # The paused job's fernet reads entries under either key, which is what
+    # the window uses until the change resumes.
+    assert len(_passwords(path, job.fernet)) == 1200
+    job = resume_master_password_change(path, config, job.old_fernet)
+    assert job.completed
+    assert len(_passwords(path, unlock("new password", config.read())[0])) == 1200
+
+
+def test_upgraded_version_1_vault_moves_off_the_legacy_key(tmp_path):
+    salt = b"0123456789abcdef"
+    legacy_hash = pbkdf2_hmac("sha256", b"old password", salt, PBKDF2_ITERATIONS, dklen=32)
+    legacy_fernet = Fernet(base64.urlsafe_b64encode(legacy_hash))
+    config = ConfigManager(tmp_path / "config.json")
+    config.write({"salt": base64.b64encode(salt).decode(), "password_hash": base64.b64encode(legacy_hash).decode()})
+    path = tmp_path / "vault.db"
+    database = VaultDatabase(path)
+    try:
+        database.add_entries((f"Site {i}", "user", encrypt(legacy_fernet, f"pw{i}"), None, None) for i in range(600))
+    finally:
+        database.close()
+
+    fernet, upgraded = unlock("old password", config.read())
+    assert PENDING_REKEY in upgraded
+    config.write(upgraded)
+    job = resume_master_password_change(path, config, fernet)
+
+    assert job.completed and PENDING_REKEY not in config.read()
+    fernet = unlock("old password", config.read())[0]
+    assert sorted(_passwords(path, fernet)) == sorted(f"pw{i}" for i in range(600))
+    with pytest.raises(InvalidToken):
+        _passwords(path, legacy_fernet)
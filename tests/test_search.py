@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from vault.database import VaultDatabase
+from vault.migrations import MIGRATIONS, migrate
+from vault.search import TrigramIndex, sort_text
+
+
+@pytest.mark.parametrize(
+    "expected",
+    [
+        ["Ежевика", "Ель", "Ёж", "Жук", "Яблоко"],
+        ["Гора", "Ґанок", "Дім", "Ехо", "Євро", "Жито", "Инь", "Іва", "Їжа", "Йод", "Кит", "Яма"],
+        ["Дом", "Ђак", "Ѓавол", "Зима", "Ѕвезда", "Извор", "Јабука", "Лист", "Љубав", "Ћерка", "Ќерамида", "Ушка", "Ўсход"],
+        ["apple", "École", "Zebra", "Аист", "Ёлка", "Яхта"],
+    ],
+)
+def test_sort_text_orders_letters_by_alphabet(expected):
+    assert sorted(reversed(expected), key=sort_text) == expected
+
+
+def test_sort_text_folds_case_width_and_accents():
+    assert sort_text("ＡＢＣ") == sort_text("abc") == sort_text("ABC")
+    assert sort_text("École") == sort_text("ecole")
+    assert sort_text("Молоко́") == sort_text("МОЛОКО")
+    assert sort_text("Й") != sort_text("и")
+    assert sort_text("Ё") != sort_text("е")
+
+
+def test_decomposed_cyrillic_sorts_like_precomposed():
+    assert sort_text("\u0438\u0306\u043e\u0434") == sort_text("\u0439\u043e\u0434")
+    assert sort_text("\u0435\u0308\u0436") == sort_text("\u0451\u0436")
+
+
+def test_upgrade_stores_title_keys_in_alphabet_order(tmp_path):
+    path = tmp_path / "vault.db"
+    conn = sqlite3.connect(path)
+    migrate(conn, MIGRATIONS[:3])
+    titles = ["Яхта", "Ёлка", "Їжак", "Єнот", "Жираф"]
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO entries (title, username, password_encrypted, created_at, updated_at)
+            VALUES (?, 'user', x'00', '2024-01-01', '2024-01-01')
+            """,
+            [(title,) for title in titles],
+        )
+    conn.close()
+
+    database = VaultDatabase(path)
+    try:
+        assert database.schema_version == len(MIGRATIONS)
+        listed = [summary.title for summary in database.list_summaries(limit=10)]
+    finally:
+        database.close()
+    assert listed == ["Ёлка", "Єнот", "Жираф", "Їжак", "Яхта"]
+
+
+def test_index_keeps_postings_sorted_through_updates():
+    index = TrigramIndex()
+    for entry_id in (5, 3, 9, 1):
+        index.add(entry_id, "GitHub", "alice", "https://github.com")
+    index.add(3, "GitLab", "alice", None)
+    index.remove(9)
+
+    assert list(index._entries["github"]) == [1, 5]
+    assert list(index._entries["alice"]) == [1, 3, 5]
+    assert sorted(index.search("github")) == [1, 5]
+    assert sorted(index.search("gitlab")) == [3]
+
+
+def test_search_ranks_every_match(tmp_path):
+    database = VaultDatabase(tmp_path / "vault.db")
+    try:
+        database.add_entries((f"Site {i}", "user", b"token", None, "mailbox login") for i in range(2000))
+        database.add_entry("Mailbox", "user", b"token", None, None)
+        assert database.search("mailbox", limit=5)[0].title == "Mailbox"
+    finally:
+        database.close()
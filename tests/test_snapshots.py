@@ -0,0 +1,113 @@
+import pytest
+
+from vault.config import ConfigManager
+from vault.database import VaultDatabase
+from vault.rekey import change_master_password
+from vault.security import create_master_config, decrypt, encrypt, unlock
+from vault.snapshots import SnapshotStore
+
+ENTRIES = 3000
+
+
+@pytest.fixture
+def vault(tmp_path):
+    config = ConfigManager(tmp_path / "config.json")
+    config.write(create_master_config("old password"))
+    fernet = unlock("old password", config.read())[0]
+    path = tmp_path / "vault.db"
+    database = VaultDatabase(path)
+    database.add_entries(
+        (f"Site {i}", f"user{i}@example.com", encrypt(fernet, f"pw{i}"), f"https://site{i}.example.com", None)
+        for i in range(ENTRIES)
+    )
+    database.close()
+    return path, config, fernet, SnapshotStore(tmp_path / "snapshots")
+
+
+def _contents(path, fernet):
+    database = VaultDatabase(path)
+    try:
+        return sorted(
+            (entry.title, decrypt(fernet, entry.password_encrypted), entry.created_at, entry.updated_at)
+            for entry in database.iter_entries()
+        )
+    finally:
+        database.close()
+
+
+def test_snapshot_after_a_few_edits_stores_only_their_chunks(vault):
+    path, config, fernet, store = vault
+    first = store.snapshot(path, config.path, fernet)
+    database = VaultDatabase(path)
+    for entry_id in (10, 1500, 2990):
+        database.update_entry(entry_id, f"Edited {entry_id}", "someone", encrypt(fernet, "new"), None, None)
+    database.delete_entry(20)
+    database.add_entry("Added", "someone", encrypt(fernet, "added"), None, None)
+    database.close()
+
+    second = store.snapshot(path, config.path, fernet)
+
+    assert first.new_chunks == first.chunks > 10
+    assert second.new_chunks <= 2 * 5
+    # One entry deleted and one added, plus the tombstone of the deleted one.
+    assert second.records == ENTRIES + 1
+
+
+def test_restore_rebuilds_the_vault_of_that_moment(vault, tmp_path):
+    path, config, fernet, store = vault
+    before = _contents(path, fernet)
+    info = store.snapshot(path, config.path, fernet)
+    database = VaultDatabase(path)
+    database.delete_entry(1)
+    database.close()
+
+    restored = store.restore(info.id, tmp_path / "restored", fernet)
+
+    assert _contents(restored, fernet) == before
+    assert ConfigManager(restored.with_name("config.json")).read() == config.read()
+    with pytest.raises(ValueError):
+        store.restore(info.id, tmp_path / "restored", fernet)
+
+
+def test_snapshots_taken_before_a_password_change_restore_with_the_old_password(vault, tmp_path):
+    path, config, fernet, store = vault
+    before = _contents(path, fernet)
+    old = store.snapshot(path, config.path, fernet)
+    assert change_master_password(path, config, "old password", "new password").completed
+    new_fernet = unlock("new password", config.read())[0]
+    store.snapshot(path, config.path, new_fernet)
+
+    with pytest.raises(ValueError):
+        store.restore(old.id, tmp_path / "wrong", new_fernet)
+    restored = store.restore(old.id, tmp_path / "restored", password="old password")
+
+    assert _contents(restored, fernet) == before
+    assert unlock("old password", ConfigManager(restored.with_name("config.json")).read()) is not None
+
+
+def test_tampered_chunks_are_rejected_and_nothing_is_left_behind(vault, tmp_path):
+    path, config, fernet, store = vault
+    info = store.snapshot(path, config.path, fernet)
+    chunk = next((store.directory / "chunks").glob("*/*"))
+    sealed = bytearray(chunk.read_bytes())
+    sealed[-1] ^= 1
+    chunk.write_bytes(bytes(sealed))
+
+    with pytest.raises(ValueError):
+        store.restore(info.id, tmp_path / "restored", fernet)
+    assert list((tmp_path / "restored").iterdir()) == []
+
+
+def test_garbage_collection_keeps_chunks_of_remaining_snapshots(vault, tmp_path):
+    path, config, fernet, store = vault
+    first = store.snapshot(path, config.path, fernet)
+    database = VaultDatabase(path)
+    database.update_entry(5, "Edited", "someone", encrypt(fernet, "new"), None, None)
+    database.close()
+    second = store.snapshot(path, config.path, fernet)
+
+    assert store.prune(1) == [first.id]
+    report = store.collect_garbage()
+
+    assert 0 < report.chunks <= second.new_chunks
+    assert _contents(store.restore(second.id, tmp_path / "restored", fernet), fernet) == _contents(path, fernet)
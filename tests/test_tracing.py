@@ -0,0 +1,19 @@
+import importlib
+
+from vault import tracing
+
+
+def test_import_leaves_tracing_off(monkeypatch):
+    monkeypatch.setenv(tracing.ENV_VAR, "1")
+    importlib.reload(tracing)
+    assert not tracing.is_enabled()
+
+
+def test_disable_writes_the_summary_and_closes_the_log(tmp_path):
+    tracing.enable(tmp_path)
+    with tracing.span("test.span"):
+        pass
+    tracing.disable()
+    assert not tracing.is_enabled() and tracing._handler is None
+    assert "summary test.span" in (tmp_path / "trace.log").read_text()
+    tracing.reset()
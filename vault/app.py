@@ -7,8 +7,9 @@ from typing import Optional
 from PyQt6.QtGui import QPalette, QColor
 from PyQt6.QtWidgets import QApplication
 
+from .backup import BackupScheduler
 from .config import ConfigManager
-from .database import VaultDatabase
+from .worker import AsyncVaultDatabase
 
 
 class VaultApp(QApplication):
@@ -18,13 +19,18 @@ class VaultApp(QApplication):
         self.setStyle("Fusion")
         self._apply_palette()
         self.config = ConfigManager()
-        self.database: Optional[VaultDatabase] = None
+        self.database: Optional[AsyncVaultDatabase] = None
+        self.backups: Optional[BackupScheduler] = None
         self.fernet = None
         self._load_stylesheet()
 
     def initialize_database(self) -> None:
         if self.database is None:
-            self.database = VaultDatabase()
+            self.database = AsyncVaultDatabase(parent=self)
+            self.aboutToQuit.connect(self.database.close)
+            self.backups = BackupScheduler(self.database.path, config=self.config.path)
+            self.backups.start()
+            self.aboutToQuit.connect(self.backups.stop)
 
     def set_fernet(self, fernet) -> None:
         self.fernet = fernet
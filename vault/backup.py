@@ -0,0 +1,225 @@
+"""Online backups of ``vault.db`` on a background thread.
+
+Backups use SQLite's backup API a few pages at a time, sleeping between
+steps so the copy never hogs the disk. The source connection holds one read
+transaction for the whole copy: under WAL that pins a consistent snapshot,
+while the app's writer keeps committing. Without it, every write from
+another connection would restart the copy from the first page. Each copy
+goes to a timestamped file in ``BACKUP_DIR``; only the newest ``keep`` are
+retained.
+
+Entries are encrypted with a data key that only ``config.json`` holds, in
+wrapped form, and a master password change replaces both. Each backup
+therefore keeps the ``config.json`` of its moment next to it, as
+``<backup>.config.json``.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .config import BACKUP_DIR, CONFIG_PATH, DB_PATH
+
+BACKUP_PREFIX = "vault-"
+BACKUP_SUFFIX = ".db"
+CONFIG_SUFFIX = ".config.json"
+_TIMESTAMP = "%Y%m%d-%H%M%S-%f"
+# Backups written before names carried microseconds.
+_LEGACY_TIMESTAMP = "%Y%m%d-%H%M%S"
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+def list_backups(directory: Path = BACKUP_DIR) -> List[Path]:
+    """Returns the backups in ``directory``, oldest first."""
+    if not directory.exists():
+        return []
+    stamped = [(_backup_time(path), path) for path in directory.glob(f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}")]
+    return [path for stamp, path in sorted(item for item in stamped if item[0] is not None)]
+
+
+def config_backup(path: Path) -> Path:
+    """The copy of ``config.json`` that unlocks the backup at ``path``."""
+    return path.with_name(path.name[: -len(BACKUP_SUFFIX)] + CONFIG_SUFFIX)
+
+
+def _backup_time(path: Path) -> Optional[datetime]:
+    stamp = path.name[len(BACKUP_PREFIX) : -len(BACKUP_SUFFIX)]
+    for pattern in (_TIMESTAMP, _LEGACY_TIMESTAMP):
+        try:
+            return datetime.strptime(stamp, pattern)
+        except ValueError:
+            continue
+    return None
+
+
+def _read_config(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def backup_database(
+    source: Path,
+    target: Path,
+    pages: int = 256,
+    step_sleep: float = 0.005,
+    cancel: Optional[threading.Event] = None,
+) -> None:
+    """Copies ``source`` to ``target`` ``pages`` pages at a time.
+
+    Raises :class:`BackupCancelled` if ``cancel`` is set mid-copy; no file
+    is left at ``target`` in that case.
+    """
+
+    def step(status: int, remaining: int, total: int) -> None:
+        if cancel is not None and cancel.is_set():
+            raise BackupCancelled()
+        if remaining:
+            time.sleep(step_sleep)
+
+    partial = target.with_name(target.name + ".partial")
+    src = sqlite3.connect(f"{source.resolve().as_uri()}?mode=ro", uri=True)
+    dst = sqlite3.connect(partial)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=step)
+        # A rollback journal keeps the copy a single self-contained file.
+        dst.execute("PRAGMA journal_mode = DELETE")
+        dst.close()
+        os.replace(partial, target)
+    finally:
+        src.close()
+        dst.close()
+        if partial.exists():
+            partial.unlink()
+
+
+class BackupScheduler:
+    """Backs up ``source`` and ``config`` every ``interval`` seconds until :meth:`stop`.
+
+    The first backup runs as soon as the newest one on disk is older than
+    ``interval``. :attr:`last_backup_at` and :attr:`last_duration` describe
+    the most recent backup this process finished; at startup the former
+    comes from the newest file on disk. A failed attempt is kept in
+    :attr:`last_error` and retried after at most 15 minutes.
+    """
+
+    CONFIG_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        source: Path = DB_PATH,
+        directory: Path = BACKUP_DIR,
+        interval: float = 24 * 60 * 60,
+        keep: int = 7,
+        pages: int = 256,
+        step_sleep: float = 0.005,
+        config: Path = CONFIG_PATH,
+    ) -> None:
+        self.source = source
+        self.config = config
+        self.directory = directory
+        self.interval = interval
+        self.keep = max(keep, 1)
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.last_path: Optional[Path] = None
+        self.last_backup_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+        existing = list_backups(directory)
+        if existing:
+            self.last_path = existing[-1]
+            self.last_backup_at = _backup_time(existing[-1])
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="vault-backup", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the thread, abandoning a backup in progress."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request_backup(self) -> None:
+        """Asks the background thread to back up now instead of waiting."""
+        self._wake.set()
+
+    def backup_now(self) -> Path:
+        """Runs a backup on the calling thread and returns the new database file.
+
+        ``config.json`` is read before and after the copy. If a master
+        password change replaced it meanwhile, the copy is taken again, so
+        a backup never pairs entries with a key that cannot read them.
+        """
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            started_at = datetime.now()
+            target = self.directory / f"{BACKUP_PREFIX}{started_at.strftime(_TIMESTAMP)}{BACKUP_SUFFIX}"
+            started = time.perf_counter()
+            for _ in range(self.CONFIG_ATTEMPTS):
+                config = _read_config(self.config)
+                backup_database(self.source, target, self.pages, self.step_sleep, self._stop)
+                if _read_config(self.config) == config:
+                    break
+            else:
+                target.unlink()
+                raise RuntimeError("The vault configuration kept changing during the backup.")
+            if config is not None:
+                copy = config_backup(target)
+                partial = copy.with_name(copy.name + ".partial")
+                partial.write_bytes(config)
+                os.replace(partial, copy)
+            self.last_duration = time.perf_counter() - started
+            self.last_backup_at = started_at
+            self.last_path = target
+            self._prune()
+            return target
+
+    def _prune(self) -> None:
+        for path in list_backups(self.directory)[: -self.keep]:
+            path.unlink()
+            config_backup(path).unlink(missing_ok=True)
+
+    def _seconds_until_due(self) -> float:
+        if self.last_backup_at is None:
+            return 0.0
+        return self.interval - (datetime.now() - self.last_backup_at).total_seconds()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(max(self._seconds_until_due(), 0.0))
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            try:
+                self.backup_now()
+                self.last_error = None
+            except BackupCancelled:
+                return
+            except Exception as exc:
+                # Keep the schedule alive and retry later; the UI can show
+                # ``last_error`` meanwhile.
+                self.last_error = exc
+                self._wake.wait(min(self.interval, 15 * 60))
+
+
+__all__ = ["BackupCancelled", "BackupScheduler", "backup_database", "config_backup", "list_backups"]
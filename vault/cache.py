@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Iterable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SecretCache:
+    """Bounded LRU cache of decrypted secrets that expire after ``ttl`` seconds.
+
+    Python strings cannot be zeroed in place, so ``clear`` drops every
+    reference and leaves the memory to the allocator. That is still far
+    shorter-lived than keeping plaintext around for the whole session.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 32,
+        ttl: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._items: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, entry_id: int) -> Optional[str]:
+        item = self._items.get(entry_id)
+        if item is None or item[0] <= self._clock():
+            if item is not None:
+                del self._items[entry_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(entry_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, entry_id: int, secret: str) -> None:
+        self._items[entry_id] = (self._clock() + self.ttl, secret)
+        self._items.move_to_end(entry_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, entry_id: int) -> None:
+        self._items.pop(entry_id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+
+class EntryCache(Generic[T]):
+    """Bounded LRU cache of rows keyed by entry id.
+
+    Holds at most ``max_size`` rows however large the vault is; the least
+    recently read rows make way for new ones. Writes evict or replace single
+    ids, so a change never costs more than the row it touches.
+    """
+
+    def __init__(self, max_size: int = 4096) -> None:
+        self.max_size = max_size
+        self._items: "OrderedDict[int, T]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._items
+
+    def get(self, entry_id: int) -> Optional[T]:
+        item = self._items.get(entry_id)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(entry_id)
+        self.hits += 1
+        return item
+
+    def put(self, entry_id: int, item: T) -> None:
+        self._items[entry_id] = item
+        self._items.move_to_end(entry_id)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def put_many(self, items: Iterable[Tuple[int, T]]) -> None:
+        for entry_id, item in items:
+            self.put(entry_id, item)
+
+    def ids(self) -> frozenset:
+        return frozenset(self._items)
+
+    def invalidate(self, entry_id: int) -> None:
+        self._items.pop(entry_id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+
+__all__ = ["EntryCache", "SecretCache"]
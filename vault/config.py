@@ -18,6 +18,9 @@ def _default_app_dir() -> Path:
 APP_DIR = _default_app_dir()
 CONFIG_PATH = APP_DIR / "config.json"
 DB_PATH = APP_DIR / "vault.db"
+BACKUP_DIR = APP_DIR / "backups"
+SNAPSHOT_DIR = APP_DIR / "snapshots"
+LOG_DIR = APP_DIR / "logs"
 
 
 class ConfigManager:
@@ -37,6 +40,27 @@ class ConfigManager:
             return json.load(fp)
 
     def write(self, data: Dict[str, Any]) -> None:
+        """Replaces the configuration atomically.
+
+        The file holds the only wrapped copy of the data key, so it is never
+        truncated in place: the new contents are written and flushed to disk
+        next to it, then renamed over it.
+        """
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w", encoding="utf-8") as fp:
-            json.dump(data, fp, indent=2)
+        partial = self.path.with_name(self.path.name + ".partial")
+        try:
+            with partial.open("w", encoding="utf-8") as fp:
+                json.dump(data, fp, indent=2)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(partial, self.path)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        if os.name == "posix":
+            # Makes the rename itself durable; Windows cannot open directories.
+            directory = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
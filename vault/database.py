@@ -1,15 +1,33 @@
 from __future__ import annotations
 
+import json
+import queue
+import re
 import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from sys import intern
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 from .config import DB_PATH
+from .migrations import (
+    ENTRY_SYNC_INSERT_TRIGGER,
+    add_sync_leaves,
+    migrate,
+    refresh_sort_keys,
+    register_functions,
+    schema_version,
+)
+from .querylog import ProfiledConnection, QueryLog, QueryStats
+from .search import sort_text, url_host
+from .tracing import traced
 
 
-@dataclass
+@dataclass(slots=True)
 class VaultEntry:
     id: int
     title: str
@@ -21,38 +39,523 @@ class VaultEntry:
     updated_at: str
 
 
+@dataclass(slots=True)
+class EntrySummary:
+    """The columns the entry list displays, without ciphertext or notes."""
+
+    id: int
+    title: str
+    username: str
+    url: Optional[str]
+    updated_at: str
+
+
+@dataclass(slots=True)
+class EntryChange:
+    """One committed write, as delivered to :meth:`VaultDatabase.add_listener` callbacks.
+
+    ``summary`` holds the row as it now reads and is ``None`` for deletions.
+    """
+
+    kind: str
+    entry_id: int
+    summary: Optional[EntrySummary]
+
+
+INSERTED = "inserted"
+UPDATED = "updated"
+DELETED = "deleted"
+# Many rows changed at once (bulk import); listeners should re-read.
+RELOADED = "reloaded"
+
+ChangeListener = Callable[[EntryChange], None]
+
+
+@dataclass(slots=True)
+class SyncRecord:
+    """An entry, or the tombstone of a deleted one, as exchanged by ``vault.merge``.
+
+    ``modified_at`` is ``updated_at`` for entries and the deletion time for
+    tombstones, which carry no other fields. ``synced_revision`` is the
+    revision at the end of the last merge, or ``None`` before the first.
+    """
+
+    uuid: str
+    revision: int
+    modified_at: str
+    deleted: bool
+    title: str = ""
+    username: str = ""
+    password_encrypted: bytes = b""
+    url: Optional[str] = None
+    notes: Optional[str] = None
+    created_at: str = ""
+    synced_revision: Optional[int] = None
+
+
+SyncState = Tuple[str, int, str, bool]
+
+# (title, username, password_encrypted, url, notes), optionally followed by
+# (created_at, updated_at).
+NewEntryRow = Union[
+    Tuple[str, str, bytes, Optional[str], Optional[str]],
+    Tuple[str, str, bytes, Optional[str], Optional[str], Optional[str], Optional[str]],
+]
+
+
+@dataclass
+class RekeyState:
+    """Progress of an interrupted master password change (see ``vault.rekey``)."""
+
+    new_config: str
+    bridge_key: bytes
+    last_id: int
+    completed: bool
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """Connection settings applied to every connection a database opens.
+
+    ``cache_size`` follows SQLite's convention: negative values are KiB.
+    ``readers`` caps the pool of read-only connections behind
+    :meth:`VaultDatabase.reader`.
+    """
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 64 * 1024 * 1024
+    cache_size: int = -16000
+    temp_store: str = "MEMORY"
+    busy_timeout_ms: int = 5000
+    readers: int = 2
+
+
+DEFAULT_STORAGE = StorageProfile()
+
+# What sqlite3.connect() gives you out of the box; kept for benchmarks.
+SQLITE_DEFAULTS = StorageProfile(
+    journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size=-2000, temp_store="DEFAULT", readers=1
+)
+
+
+PageKey = Tuple[Any, int]
+
+SORT_COLUMNS = {
+    "title": "title_key",
+    "username": "username COLLATE NOCASE",
+    "url": "IFNULL(url, '') COLLATE NOCASE",
+    "updated_at": "updated_at",
+}
+
+_ENTRY_COLUMNS = "id, title, username, password_encrypted, url, notes, created_at, updated_at"
+_SUMMARY_COLUMNS = "id, title, username, url, updated_at"
+
+_SEARCH_TERM = re.compile(r"\w+")
+
+# Stays below SQLITE_MAX_VARIABLE_NUMBER on older SQLite builds.
+_MAX_VARIABLES = 900
+
+# A one- or two-character prefix such as "g" matches most of a large vault and
+# ranking all of it costs hundreds of milliseconds, so queries made only of such
+# short terms score just the first SHORT_PREFIX_CANDIDATES matches, in rowid
+# order, and can miss the best one. Longer queries rank every match.
+SHORT_PREFIX = 2
+SHORT_PREFIX_CANDIDATES = 1000
+
+_FTS_INSERT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, title, username, url, notes)
+    VALUES (new.id, new.title, new.username, new.url, new.notes);
+END
+"""
+
+# The stored rank weights title, username, URL and notes, so ORDER BY rank
+# LIMIT lets FTS5 score every match while keeping only the best few rows.
+_FTS_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    title, username, url, notes,
+    content='entries', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+INSERT INTO entries_fts (entries_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 2.0, 1.0)');
+{_FTS_INSERT_TRIGGER};
+CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, title, username, url, notes)
+    VALUES ('delete', old.id, old.title, old.username, old.url, old.notes);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF title, username, url, notes ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, title, username, url, notes)
+    VALUES ('delete', old.id, old.title, old.username, old.url, old.notes);
+    INSERT INTO entries_fts (rowid, title, username, url, notes)
+    VALUES (new.id, new.title, new.username, new.url, new.notes);
+END;
+"""
+
+
+def page_key(entry: Union[VaultEntry, EntrySummary], order_by: str = "title") -> PageKey:
+    """Returns the keyset cursor that resumes a listing right after ``entry``."""
+    value = getattr(entry, order_by)
+    if order_by == "title":
+        return (sort_text(value), entry.id)
+    return (value if value is not None else "", entry.id)
+
+
+_ASCII_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def sort_key(entry: Union[VaultEntry, EntrySummary], order_by: str = "title") -> PageKey:
+    """Returns the key SQLite orders ``entry`` by under ``SORT_COLUMNS[order_by]``.
+
+    ``COLLATE NOCASE`` folds ASCII letters only, so ``str.lower`` would
+    disagree with the database for accented usernames.
+    """
+    value = getattr(entry, order_by) or ""
+    if order_by == "title":
+        value = sort_text(value)
+    elif order_by != "updated_at":
+        value = value.translate(_ASCII_FOLD)
+    return (value, entry.id)
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Vaults reuse a handful of usernames and login URLs across many entries;
+    # interning stores each of them once however many rows are loaded.
+    return intern(value) if value else value
+
+
+def _entry(row: Sequence[Any]) -> VaultEntry:
+    """Builds a VaultEntry from a row of ``_ENTRY_COLUMNS``."""
+    return VaultEntry(row[0], row[1], _intern(row[2]), row[3], _intern(row[4]), row[5], row[6], row[7])
+
+
+def _summary(row: Sequence[Any]) -> EntrySummary:
+    """Builds an EntrySummary from a row of ``_SUMMARY_COLUMNS``."""
+    return EntrySummary(row[0], row[1], _intern(row[2]), _intern(row[3]), row[4])
+
+
+def _configure(conn: sqlite3.Connection, profile: StorageProfile) -> None:
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout_ms)}")
+    conn.execute(f"PRAGMA synchronous = {profile.synchronous}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+    conn.execute(f"PRAGMA temp_store = {profile.temp_store}")
+
+
+class _ReaderPool:
+    """Hands out read-only connections, opening at most ``profile.readers`` of them."""
+
+    def __init__(self, path: Path, profile: StorageProfile, query_log: QueryLog) -> None:
+        self._uri = f"{path.resolve().as_uri()}?mode=ro"
+        self._profile = profile
+        self._query_log = query_log
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(profile.readers, 1))
+        self._opened: List[sqlite3.Connection] = []
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False, factory=ProfiledConnection)
+                self._query_log.attach(conn)
+                _configure(conn, self._profile)
+                self._opened.append(conn)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+
+    def close(self) -> None:
+        for conn in self._opened:
+            conn.close()
+        self._opened.clear()
+
+
 class VaultDatabase:
-    def __init__(self, path: Path = DB_PATH) -> None:
+    @traced("db.open")
+    def __init__(
+        self, path: Path = DB_PATH, profile: StorageProfile = DEFAULT_STORAGE, query_log: Optional[QueryLog] = None
+    ) -> None:
         self.path = path
+        self.profile = profile
+        # Shared by the writer and every pooled reader; see vault.querylog.
+        self.query_log = query_log or QueryLog()
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(self.path)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = sqlite3.connect(self.path, factory=ProfiledConnection)
+        self.query_log.attach(self.conn)
+        _configure(self.conn, profile)
+        register_functions(self.conn)
+        # WAL lets the reader pool keep reading while this connection writes.
+        self.conn.execute(f"PRAGMA journal_mode = {profile.journal_mode}")
         self._ensure_schema()
+        self._readers: Optional[_ReaderPool] = _ReaderPool(path, profile, self.query_log)
+        self._listeners: List[ChangeListener] = []
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Calls ``listener`` after each entry write commits on this connection."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: ChangeListener) -> None:
+        self._listeners.remove(listener)
+
+    def _notify(self, kind: str, entry_id: int, summary: Optional[EntrySummary] = None) -> None:
+        change = EntryChange(kind, entry_id, summary)
+        for listener in list(self._listeners):
+            listener(change)
+
+    @contextmanager
+    def reader(self) -> Iterator["VaultDatabase"]:
+        """Borrows a read-only view backed by a pooled connection.
+
+        The view offers every query method of this class and may be used from
+        any single thread until the ``with`` block exits. Writing through it
+        raises :class:`sqlite3.OperationalError`.
+        """
+        with self._readers.connection() as conn:
+            yield self._view(self.path, self.profile, self.query_log, conn, self.fts_enabled)
+
+    @classmethod
+    def open_read_only(
+        cls, path: Path, profile: StorageProfile = DEFAULT_STORAGE, query_log: Optional[QueryLog] = None
+    ) -> "VaultDatabase":
+        """Opens another vault file for reading only.
+
+        Nothing is migrated and the journal mode is left as it is, so the file
+        is never changed; nothing else may write to it while it is open.
+        ``schema_version`` tells whether its queries match this app's. Writes
+        raise :class:`sqlite3.OperationalError`.
+        """
+        if not path.exists():
+            raise FileNotFoundError(f"{path} does not exist.")
+        query_log = query_log or QueryLog()
+        uri = f"{path.resolve().as_uri()}?mode=ro"
+        # A read-only connection to a WAL database still creates -wal and
+        # -shm files next to it. With no -wal left over, every commit is in
+        # the main file and it can be read as immutable, touching nothing.
+        if not path.with_name(f"{path.name}-wal").exists():
+            uri += "&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, factory=ProfiledConnection)
+        query_log.attach(conn)
+        _configure(conn, profile)
+        fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'"
+        ).fetchone()
+        view = cls._view(path, profile, query_log, conn, fts_enabled is not None)
+        view.schema_version = schema_version(conn)
+        return view
+
+    @classmethod
+    def _view(
+        cls, path: Path, profile: StorageProfile, query_log: QueryLog, conn: sqlite3.Connection, fts_enabled: bool
+    ) -> "VaultDatabase":
+        view = cls.__new__(cls)
+        view.path = path
+        view.profile = profile
+        view.query_log = query_log
+        view.conn = conn
+        view.fts_enabled = fts_enabled
+        view._readers = None
+        view._listeners = []
+        return view
+
+    def query_stats(self) -> List[QueryStats]:
+        """Per-statement counters for this vault's connections, most total time first."""
+        return self.query_log.stats()
 
     def _ensure_schema(self) -> None:
-        with self.conn:
-            self.conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS entries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    username TEXT NOT NULL,
-                    password_encrypted BLOB NOT NULL,
-                    url TEXT,
-                    notes TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-                """
-            )
+        self.schema_version = migrate(self.conn)
+        refresh_sort_keys(self.conn)
+        # FTS5 is optional, so it is set up outside the versioned migrations.
+        self.fts_enabled = self._ensure_search_index()
+
+    def _ensure_search_index(self) -> bool:
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'"
+        ).fetchone()
+        try:
+            with self.conn:
+                self.conn.executescript(_FTS_SCHEMA)
+                if not exists:
+                    self.conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            # SQLite builds without FTS5 fall back to LIKE matching in search().
+            return False
+        return True
 
-    def list_entries(self) -> List[VaultEntry]:
+    @traced("db.count_entries")
+    def count_entries(self, up_to_id: Optional[int] = None) -> int:
+        if up_to_id is None:
+            cur = self.conn.execute("SELECT COUNT(*) FROM entries")
+        else:
+            cur = self.conn.execute("SELECT COUNT(*) FROM entries WHERE id <= ?", (up_to_id,))
+        return int(cur.fetchone()[0])
+
+    @traced("db.list_entries")
+    def list_entries(self, order_by: str = "title", descending: bool = False) -> List[VaultEntry]:
+        direction = "DESC" if descending else "ASC"
         cur = self.conn.execute(
-            "SELECT id, title, username, password_encrypted, url, notes, created_at, updated_at FROM entries ORDER BY title COLLATE NOCASE"
+            f"SELECT {_ENTRY_COLUMNS} FROM entries ORDER BY {_sort_expression(order_by)} {direction}, id {direction}"
         )
         rows = cur.fetchall()
-        return [VaultEntry(**dict(row)) for row in rows]
+        return [_entry(row) for row in rows]
+
+    @traced("db.list_page")
+    def list_page(
+        self,
+        after_key: Optional[PageKey] = None,
+        limit: int = 200,
+        order_by: str = "title",
+        descending: bool = False,
+    ) -> List[VaultEntry]:
+        """Returns up to ``limit`` entries that sort after ``after_key``.
+
+        ``after_key`` is the :func:`page_key` of the last entry of the previous
+        page, so every page is a single index range scan regardless of depth.
+        """
+        rows = self._select_page(_ENTRY_COLUMNS, after_key, limit, order_by, descending)
+        return [_entry(row) for row in rows]
+
+    @traced("db.list_summaries")
+    def list_summaries(
+        self,
+        after_key: Optional[PageKey] = None,
+        limit: int = 200,
+        order_by: str = "title",
+        descending: bool = False,
+    ) -> List[EntrySummary]:
+        """Same paging as :meth:`list_page` but skips ciphertext and notes."""
+        rows = self._select_page(_SUMMARY_COLUMNS, after_key, limit, order_by, descending)
+        return [_summary(row) for row in rows]
+
+    @traced("db.list_summaries_by_id")
+    def list_summaries_by_id(self, after_id: int, limit: int) -> List[EntrySummary]:
+        """Returns up to ``limit`` summaries with ids above ``after_id``, in id order."""
+        cur = self.conn.execute(
+            f"SELECT {_SUMMARY_COLUMNS} FROM entries WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        )
+        return [_summary(row) for row in cur.fetchall()]
+
+    @traced("db.list_ids")
+    def list_ids(
+        self,
+        after_key: Optional[PageKey] = None,
+        limit: int = 200,
+        order_by: str = "title",
+        descending: bool = False,
+    ) -> List[int]:
+        """Same paging as :meth:`list_page` but returns ids only.
+
+        Every sort column has an index that also carries the id, so a deep
+        page is one range scan of the index that never touches the table.
+        """
+        return [row[0] for row in self._select_page("id", after_key, limit, order_by, descending)]
+
+    @traced("db.search")
+    def search(self, query: str, limit: int = 50) -> List[EntrySummary]:
+        """Ranks entries whose title, username, URL or notes start with every query term."""
+        terms = _SEARCH_TERM.findall(query)
+        if not terms:
+            return []
+        if self.fts_enabled:
+            match = " ".join(f'"{term}"*' for term in terms)
+            if max(len(term) for term in terms) > SHORT_PREFIX:
+                hits = "SELECT rowid, rank FROM entries_fts WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?"
+                arguments = (match, limit)
+            else:
+                hits = "SELECT rowid, rank FROM entries_fts WHERE entries_fts MATCH ? LIMIT ?"
+                arguments = (match, SHORT_PREFIX_CANDIDATES)
+            cur = self.conn.execute(
+                f"""
+                SELECT e.id, e.title, e.username, e.url, e.updated_at
+                FROM ({hits}) AS hits
+                JOIN entries AS e ON e.id = hits.rowid
+                ORDER BY hits.rank
+                LIMIT ?
+                """,
+                (*arguments, limit),
+            )
+        else:
+            clause = " AND ".join(
+                "(title LIKE ? OR username LIKE ? OR url LIKE ? OR notes LIKE ?)" for _ in terms
+            )
+            params: list = [f"%{term}%" for term in terms for _ in range(4)]
+            cur = self.conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM entries WHERE {clause} ORDER BY title_key LIMIT ?",
+                (*params, limit),
+            )
+        return [_summary(row) for row in cur.fetchall()]
 
+    @traced("db.get_summaries")
+    def get_summaries(self, entry_ids: Sequence[int]) -> List[EntrySummary]:
+        """Returns the summaries of ``entry_ids`` in the order the ids were given."""
+        found: Dict[int, EntrySummary] = {}
+        for start in range(0, len(entry_ids), _MAX_VARIABLES):
+            chunk = entry_ids[start : start + _MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            cur = self.conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM entries WHERE id IN ({placeholders})", tuple(chunk)
+            )
+            for row in cur.fetchall():
+                found[row["id"]] = _summary(row)
+        return [found[entry_id] for entry_id in entry_ids if entry_id in found]
+
+    @traced("db.list_by_host")
+    def list_by_host(self, url: str) -> List[EntrySummary]:
+        """Returns the entries for the same site as ``url``, which may also be a bare host."""
+        host = url_host(url)
+        if not host:
+            return []
+        cur = self.conn.execute(
+            f"SELECT {_SUMMARY_COLUMNS} FROM entries WHERE url_host = ? ORDER BY id", (host,)
+        )
+        return [_summary(row) for row in cur.fetchall()]
+
+    @traced("db.get_entry")
+    def get_entry(self, entry_id: int) -> Optional[VaultEntry]:
+        cur = self.conn.execute(f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE id = ?", (entry_id,))
+        row = cur.fetchone()
+        return _entry(row) if row is not None else None
+
+    def _select_page(
+        self,
+        columns: str,
+        after_key: Optional[PageKey],
+        limit: int,
+        order_by: str,
+        descending: bool,
+    ) -> List[sqlite3.Row]:
+        expression = _sort_expression(order_by)
+        direction = "DESC" if descending else "ASC"
+        query = f"SELECT {columns} FROM entries"
+        params: list = []
+        if after_key is not None:
+            # The leading single-column bound lets SQLite turn the row-value
+            # comparison into an index range search instead of a scan.
+            operator = "<" if descending else ">"
+            query += f" WHERE {expression} {operator}= ? AND ({expression}, id) {operator} (?, ?)"
+            params.extend((after_key[0], *after_key))
+        query += f" ORDER BY {expression} {direction}, id {direction} LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(query, params).fetchall()
+
+    def iter_entries(
+        self, order_by: str = "title", descending: bool = False, batch_size: int = 500
+    ) -> Iterator[VaultEntry]:
+        """Streams every entry page by page without loading the whole vault."""
+        return _iter_pages(self.list_page, order_by, descending, batch_size)
+
+    def iter_summaries(
+        self, order_by: str = "title", descending: bool = False, batch_size: int = 2000
+    ) -> Iterator[EntrySummary]:
+        return _iter_pages(self.list_summaries, order_by, descending, batch_size)
+
+    @traced("db.add_entry")
     def add_entry(
         self,
         title: str,
@@ -65,13 +568,125 @@ class VaultDatabase:
         with self.conn:
             cur = self.conn.execute(
                 """
-                INSERT INTO entries (title, username, password_encrypted, url, notes, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO entries (
+                    uuid, title, title_key, username, password_encrypted, url, url_host, notes, created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (title, username, password_encrypted, url, notes, timestamp, timestamp),
+                (
+                    uuid.uuid4().hex,
+                    title,
+                    sort_text(title),
+                    username,
+                    password_encrypted,
+                    url,
+                    url_host(url),
+                    notes,
+                    timestamp,
+                    timestamp,
+                ),
             )
-        return int(cur.lastrowid)
+        entry_id = int(cur.lastrowid)
+        self._notify(INSERTED, entry_id, EntrySummary(entry_id, title, _intern(username), _intern(url), timestamp))
+        return entry_id
 
+    @traced("db.add_entries")
+    def add_entries(self, rows: Iterable[NewEntryRow]) -> int:
+        """Inserts ``(title, username, password_encrypted, url, notes)`` rows in one transaction.
+
+        Rows may add ``created_at`` and ``updated_at``, as a restore does to
+        keep the original times; missing times are set to now. Listeners get
+        a single ``RELOADED`` change rather than one per row. Returns the
+        number of rows inserted.
+        """
+        timestamp = datetime.utcnow().isoformat()
+
+        def values() -> Iterator[tuple]:
+            for title, username, ciphertext, url, notes, *times in rows:
+                created_at, updated_at = times or (None, None)
+                yield (
+                    uuid.uuid4().hex,
+                    title,
+                    sort_text(title),
+                    username,
+                    ciphertext,
+                    url,
+                    url_host(url),
+                    notes,
+                    created_at or timestamp,
+                    updated_at or timestamp,
+                )
+
+        with self._bulk_insert():
+            cur = self.conn.executemany(
+                """
+                INSERT INTO entries (
+                    uuid, title, title_key, username, password_encrypted, url, url_host, notes, created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                values(),
+            )
+        count = max(cur.rowcount, 0)
+        if count:
+            self._notify(RELOADED, 0)
+        return count
+
+    @traced("db.add_entries_from")
+    def add_entries_from(self, path: Path) -> int:
+        """Copies every entry of the vault file at ``path`` as new entries, in one transaction.
+
+        Both vaults must use the same data key. Returns the number of rows copied.
+        """
+        self.conn.execute("ATTACH DATABASE ? AS source", (str(path),))
+        try:
+            with self._bulk_insert():
+                cur = self.conn.execute(
+                    """
+                    INSERT INTO entries (
+                        uuid, title, title_key, username, password_encrypted, url, url_host, notes,
+                        created_at, updated_at
+                    )
+                    SELECT lower(hex(randomblob(16))), title, title_key, username, password_encrypted, url,
+                        url_host, notes, created_at, updated_at
+                    FROM source.entries ORDER BY id
+                    """
+                )
+        finally:
+            self.conn.execute("DETACH DATABASE source")
+        count = max(cur.rowcount, 0)
+        if count:
+            self._notify(RELOADED, 0)
+        return count
+
+    @contextmanager
+    def _bulk_insert(self) -> Iterator[None]:
+        """Runs the enclosed inserts as one transaction and indexes them for FTS and merges at the end."""
+        with self.conn:
+            # Indexing the batch with one INSERT ... SELECT is about five
+            # times faster than firing the per-row triggers. Schema changes
+            # are transactional, so other connections never see the triggers
+            # missing.
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DROP TRIGGER entries_sync_insert")
+            if self.fts_enabled:
+                self.conn.execute("DROP TRIGGER entries_fts_insert")
+            first_id = self.conn.execute("SELECT IFNULL(MAX(id), 0) FROM entries").fetchone()[0]
+            yield
+            if self.fts_enabled:
+                self.conn.execute(
+                    """
+                    INSERT INTO entries_fts (rowid, title, username, url, notes)
+                    SELECT id, title, username, url, notes FROM entries WHERE id > ?
+                    """,
+                    (first_id,),
+                )
+                self.conn.execute(_FTS_INSERT_TRIGGER)
+            rows = self.conn.execute("SELECT uuid, revision, updated_at FROM entries WHERE id > ?", (first_id,))
+            add_sync_leaves(self.conn, ((row[0], row[1], row[2], False) for row in rows))
+            self.conn.execute(ENTRY_SYNC_INSERT_TRIGGER)
+
+    @traced("db.update_entry")
     def update_entry(
         self,
         entry_id: int,
@@ -83,18 +698,223 @@ class VaultDatabase:
     ) -> None:
         timestamp = datetime.utcnow().isoformat()
         with self.conn:
-            self.conn.execute(
+            cur = self.conn.execute(
                 """
                 UPDATE entries
-                SET title = ?, username = ?, password_encrypted = ?, url = ?, notes = ?, updated_at = ?
+                SET title = ?, title_key = ?, username = ?, password_encrypted = ?, url = ?, url_host = ?,
+                    notes = ?, updated_at = ?, revision = revision + 1
                 WHERE id = ?
                 """,
-                (title, username, password_encrypted, url, notes, timestamp, entry_id),
+                (title, sort_text(title), username, password_encrypted, url, url_host(url), notes, timestamp, entry_id),
             )
+        if cur.rowcount:
+            self._notify(UPDATED, entry_id, EntrySummary(entry_id, title, _intern(username), _intern(url), timestamp))
 
+    @traced("db.delete_entry")
     def delete_entry(self, entry_id: int) -> None:
+        """Deletes an entry and leaves a tombstone so merges propagate the deletion."""
         with self.conn:
-            self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            self.conn.execute(
+                """
+                INSERT INTO tombstones (uuid, revision, deleted_at, synced_revision)
+                SELECT uuid, revision + 1, ?, synced_revision FROM entries WHERE id = ?
+                ON CONFLICT (uuid) DO UPDATE SET
+                    revision = excluded.revision, deleted_at = excluded.deleted_at,
+                    synced_revision = excluded.synced_revision
+                """,
+                (datetime.utcnow().isoformat(), entry_id),
+            )
+            cur = self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+        if cur.rowcount:
+            self._notify(DELETED, entry_id)
+
+    @traced("db.sync_state")
+    def sync_state(self, prefix: str = "") -> List[SyncState]:
+        """Returns ``(uuid, revision, modified_at, deleted)`` for entries and tombstones, by uuid.
+
+        ``prefix`` limits the result to UUIDs that start with it.
+        """
+        # Lowercase hex UUIDs sort before "g", so this bounds the prefix range.
+        bounds = (prefix, prefix + "g")
+        cur = self.conn.execute(
+            """
+            SELECT uuid, revision, updated_at, 0 FROM entries WHERE uuid >= ? AND uuid < ?
+            UNION ALL
+            SELECT uuid, revision, deleted_at, 1 FROM tombstones WHERE uuid >= ? AND uuid < ?
+            ORDER BY 1
+            """,
+            bounds + bounds,
+        )
+        return [(row[0], row[1], row[2], bool(row[3])) for row in cur]
+
+    @traced("db.sync_buckets")
+    def sync_buckets(self) -> Dict[str, int]:
+        """Returns the XOR of the leaf hashes under each UUID prefix of ``SYNC_PREFIX`` digits.
+
+        Triggers keep the table current on every write, so this reads a few
+        thousand rows however large the vault is. Empty buckets are left out.
+        """
+        cur = self.conn.execute("SELECT prefix, hash FROM sync_buckets WHERE hash != 0")
+        return {row[0]: row[1] for row in cur}
+
+    @traced("db.get_sync_records")
+    def get_sync_records(self, uuids: Sequence[str]) -> List[SyncRecord]:
+        records: List[SyncRecord] = []
+        for start in range(0, len(uuids), _MAX_VARIABLES):
+            chunk = tuple(uuids[start : start + _MAX_VARIABLES])
+            placeholders = ", ".join("?" * len(chunk))
+            cur = self.conn.execute(
+                f"""
+                SELECT uuid, revision, updated_at, title, username, password_encrypted, url, notes, created_at,
+                    synced_revision
+                FROM entries WHERE uuid IN ({placeholders})
+                """,
+                chunk,
+            )
+            records.extend(
+                SyncRecord(row[0], row[1], row[2], False, row[3], row[4], row[5], row[6], row[7], row[8], row[9])
+                for row in cur
+            )
+            cur = self.conn.execute(
+                f"SELECT uuid, revision, deleted_at, synced_revision FROM tombstones WHERE uuid IN ({placeholders})",
+                chunk,
+            )
+            records.extend(SyncRecord(row[0], row[1], row[2], True, synced_revision=row[3]) for row in cur)
+        return records
+
+    @traced("db.apply_sync_records")
+    def apply_sync_records(self, records: Sequence[SyncRecord]) -> int:
+        """Stores merged entries and tombstones exactly as given, in one transaction.
+
+        Unlike the regular writers this keeps the records' revisions and
+        timestamps. Listeners get a single ``RELOADED`` change.
+        """
+        if not records:
+            return 0
+        deleted = [record for record in records if record.deleted]
+        kept = [record for record in records if not record.deleted]
+        with self._bulk_insert():
+            self.conn.executemany("DELETE FROM entries WHERE uuid = ?", [(record.uuid,) for record in deleted])
+            self.conn.executemany(
+                """
+                INSERT INTO tombstones (uuid, revision, deleted_at) VALUES (?, ?, ?)
+                ON CONFLICT (uuid) DO UPDATE SET revision = excluded.revision, deleted_at = excluded.deleted_at
+                """,
+                [(record.uuid, record.revision, record.modified_at) for record in deleted],
+            )
+            self.conn.executemany("DELETE FROM tombstones WHERE uuid = ?", [(record.uuid,) for record in kept])
+            self.conn.executemany(
+                """
+                INSERT INTO entries (
+                    uuid, revision, title, title_key, username, password_encrypted, url, url_host, notes,
+                    created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (uuid) DO UPDATE SET
+                    revision = excluded.revision, title = excluded.title, title_key = excluded.title_key,
+                    username = excluded.username, password_encrypted = excluded.password_encrypted,
+                    url = excluded.url, url_host = excluded.url_host, notes = excluded.notes,
+                    created_at = excluded.created_at, updated_at = excluded.updated_at
+                """,
+                [
+                    (
+                        record.uuid,
+                        record.revision,
+                        record.title,
+                        sort_text(record.title),
+                        record.username,
+                        record.password_encrypted,
+                        record.url,
+                        url_host(record.url),
+                        record.notes,
+                        record.created_at,
+                        record.modified_at,
+                    )
+                    for record in kept
+                ],
+            )
+        self._notify(RELOADED, 0)
+        return len(records)
+
+    @traced("db.mark_synced")
+    def mark_synced(self, uuids: Optional[Sequence[str]] = None, keep: Sequence[str] = ()) -> None:
+        """Records the current revision of ``uuids``, or of every row, as agreed by the last merge.
+
+        Rows in ``keep`` are left alone when marking every row.
+        """
+        with self.conn:
+            for table in ("entries", "tombstones"):
+                if uuids is None:
+                    self.conn.execute(
+                        f"""
+                        UPDATE {table} SET synced_revision = revision
+                        WHERE synced_revision IS NOT revision AND uuid NOT IN (SELECT value FROM json_each(?))
+                        """,
+                        (json.dumps(list(keep)),),
+                    )
+                else:
+                    self.conn.executemany(
+                        f"UPDATE {table} SET synced_revision = revision WHERE uuid = ?", [(uuid,) for uuid in uuids]
+                    )
+
+    def rekey_state(self) -> Optional[RekeyState]:
+        row = self.conn.execute(
+            "SELECT new_config, bridge_key, last_id, completed FROM rekey_journal WHERE id = 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return RekeyState(row["new_config"], row["bridge_key"], row["last_id"], bool(row["completed"]))
+
+    def begin_rekey(self, new_config: str, bridge_key: bytes) -> None:
+        """Journals a new change; raises :class:`sqlite3.IntegrityError` while another is journaled."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO rekey_journal (id, new_config, bridge_key, last_id, completed) VALUES (1, ?, ?, 0, 0)",
+                (new_config, bridge_key),
+            )
+
+    def list_ciphertexts(self, after_id: int, limit: int) -> List[Tuple[int, bytes]]:
+        cur = self.conn.execute(
+            "SELECT id, password_encrypted FROM entries WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        )
+        return [(row["id"], row["password_encrypted"]) for row in cur.fetchall()]
+
+    @traced("db.apply_rekey_batch")
+    def apply_rekey_batch(self, ciphertexts: Sequence[Tuple[int, bytes]]) -> None:
+        """Stores re-encrypted passwords and advances the journal in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE entries SET password_encrypted = ? WHERE id = ?",
+                [(ciphertext, entry_id) for entry_id, ciphertext in ciphertexts],
+            )
+            self.conn.execute("UPDATE rekey_journal SET last_id = ? WHERE id = 1", (ciphertexts[-1][0],))
+
+    def complete_rekey(self) -> None:
+        with self.conn:
+            self.conn.execute("UPDATE rekey_journal SET completed = 1 WHERE id = 1")
+
+    def clear_rekey(self) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM rekey_journal")
 
     def close(self) -> None:
+        if self._readers is not None:
+            self._readers.close()
         self.conn.close()
+
+
+def _iter_pages(fetch, order_by: str, descending: bool, batch_size: int) -> Iterator:
+    after_key: Optional[PageKey] = None
+    while True:
+        page = fetch(after_key, batch_size, order_by, descending)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_key = page_key(page[-1], order_by)
+
+
+def _sort_expression(order_by: str) -> str:
+    try:
+        return SORT_COLUMNS[order_by]
+    except KeyError:
+        raise ValueError(f"Cannot order entries by {order_by!r}.") from None
@@ -0,0 +1,356 @@
+"""Portable, password-protected export files streamed chunk by chunk.
+
+Layout::
+
+    MAGIC | uint32 header length | header (JSON) | chunk | chunk | ...
+
+The header records the format version, the KDF and its parameters, the
+salt, a password verifier and the chunk size. Entries are written as JSON
+lines into a plaintext stream that is cut into ``chunk_size`` pieces. Each
+piece is sealed with AES-256-GCM as ``uint32 length | ciphertext``. Nonces
+follow the STREAM construction: a random prefix, a chunk counter, and a
+final-chunk flag. Reordered, dropped or truncated chunks therefore fail to
+decrypt. The header is bound to every chunk as associated data.
+"""
+from __future__ import annotations
+
+import base64
+import hmac
+import json
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .database import StorageProfile, VaultDatabase
+from .importers import ImportRecord, ImportReport, import_records
+from .security import KdfParams, calibrate_kdf, decrypt, derive_master_key, generate_salt, kdf_in_bounds
+
+ProgressCallback = Callable[[int, int], None]
+
+MAGIC = b"KPVAULTX"
+FORMAT_VERSION = 1
+EXPORT_SUFFIX = ".kpvx"
+CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+
+_NONCE_PREFIX_SIZE = 7
+_LENGTH = struct.Struct(">I")
+_VERIFIER_INFO = b"kakhas-vault/export/v1/verifier"
+_CONTENT_INFO = b"kakhas-vault/export/v1/content"
+
+
+@dataclass
+class ExportHeader:
+    version: int
+    kdf: KdfParams
+    salt: bytes
+    verifier: bytes
+    nonce_prefix: bytes
+    chunk_size: int
+
+    def to_bytes(self) -> bytes:
+        data = {
+            "version": self.version,
+            "cipher": "aes-256-gcm",
+            "kdf": self.kdf.to_config(),
+            "salt": base64.b64encode(self.salt).decode("ascii"),
+            "verifier": base64.b64encode(self.verifier).decode("ascii"),
+            "nonce_prefix": base64.b64encode(self.nonce_prefix).decode("ascii"),
+            "chunk_size": self.chunk_size,
+        }
+        return json.dumps(data, sort_keys=True).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "ExportHeader":
+        data = json.loads(raw.decode("utf-8"))
+        if data.get("version") != FORMAT_VERSION or data.get("cipher") != "aes-256-gcm":
+            raise ValueError("This export was written by an unsupported version of the vault.")
+        try:
+            header = cls(
+                FORMAT_VERSION,
+                KdfParams(**data["kdf"]),
+                base64.b64decode(data["salt"]),
+                base64.b64decode(data["verifier"]),
+                base64.b64decode(data["nonce_prefix"]),
+                int(data["chunk_size"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("The export header is corrupted.") from None
+        if len(header.nonce_prefix) != _NONCE_PREFIX_SIZE or not 0 < header.chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("The export header is corrupted.")
+        # The header is only authenticated once a key is derived from it.
+        if not kdf_in_bounds(header.kdf):
+            raise ValueError("The export asks for key derivation settings this vault does not accept.")
+        return header
+
+
+def _derive_keys(password: str, header: ExportHeader) -> tuple:
+    master = derive_master_key(password, header.salt, header.kdf)
+
+    def expand(info: bytes) -> bytes:
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master)
+
+    return expand(_VERIFIER_INFO), AESGCM(expand(_CONTENT_INFO))
+
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+
+class ExportWriter:
+    """Writes records to ``fp``, sealing one chunk whenever ``chunk_size`` bytes are buffered."""
+
+    def __init__(
+        self,
+        fp: BinaryIO,
+        password: str,
+        params: Optional[KdfParams] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self._fp = fp
+        header = ExportHeader(
+            version=FORMAT_VERSION,
+            kdf=params or calibrate_kdf(),
+            salt=generate_salt(),
+            verifier=b"",
+            nonce_prefix=os.urandom(_NONCE_PREFIX_SIZE),
+            chunk_size=chunk_size,
+        )
+        header.verifier, self._aead = _derive_keys(password, header)
+        self._header = header
+        self._associated = header.to_bytes()
+        self._buffer = bytearray()
+        self._counter = 0
+        self.bytes_written = 0
+        fp.write(MAGIC + _LENGTH.pack(len(self._associated)) + self._associated)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._buffer += json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        size = self._header.chunk_size
+        while len(self._buffer) > size:
+            # Keep at least one byte back so the final chunk is never empty
+            # unless the whole export is.
+            self._seal(bytes(self._buffer[:size]), last=False)
+            del self._buffer[:size]
+
+    def close(self) -> None:
+        self._seal(bytes(self._buffer), last=True)
+        self._buffer.clear()
+
+    def _seal(self, plaintext: bytes, last: bool) -> None:
+        nonce = _nonce(self._header.nonce_prefix, self._counter, last)
+        sealed = self._aead.encrypt(nonce, plaintext, self._associated)
+        self._fp.write(_LENGTH.pack(len(sealed)) + sealed)
+        self._counter += 1
+        self.bytes_written += len(plaintext)
+
+
+def read_header(fp: BinaryIO) -> tuple:
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("This file is not a vault export.")
+    (length,) = _LENGTH.unpack(_read_exactly(fp, _LENGTH.size))
+    if length > MAX_HEADER_SIZE:
+        raise ValueError("The export header is corrupted.")
+    raw = _read_exactly(fp, length)
+    return ExportHeader.from_bytes(raw), raw
+
+
+def read_records(fp: BinaryIO, password: str) -> Iterator[Dict[str, Any]]:
+    """Verifies and decrypts an export chunk by chunk, yielding one record at a time.
+
+    Raises :class:`ValueError` for a wrong password, and for a file that
+    was modified or cut short. Records already yielded came from
+    authenticated chunks.
+    """
+    header, associated = read_header(fp)
+    verifier, aead = _derive_keys(password, header)
+    if not hmac.compare_digest(verifier, header.verifier):
+        raise ValueError("The export password is incorrect.")
+    pending = b""
+    counter = 0
+    while True:
+        prefix = fp.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            raise ValueError("The export file is incomplete.")
+        (length,) = _LENGTH.unpack(prefix)
+        if length > header.chunk_size + 16:
+            raise ValueError("The export file is corrupted.")
+        sealed = _read_exactly(fp, length)
+        last = False
+        try:
+            plaintext = aead.decrypt(_nonce(header.nonce_prefix, counter, False), sealed, associated)
+        except InvalidTag:
+            try:
+                plaintext = aead.decrypt(_nonce(header.nonce_prefix, counter, True), sealed, associated)
+            except InvalidTag:
+                raise ValueError(f"Chunk {counter} of the export is corrupted.") from None
+            last = True
+        counter += 1
+        lines = (pending + plaintext).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield json.loads(line)
+        if last:
+            if pending:
+                raise ValueError("The export file ends in the middle of an entry.")
+            if fp.read(1):
+                raise ValueError("The export file has data after its final chunk.")
+            return
+
+
+def _read_exactly(fp: BinaryIO, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError("The export file is incomplete.")
+    return data
+
+
+def export_vault(
+    database: VaultDatabase,
+    fernet: Fernet,
+    path: Path,
+    password: str,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+    params: Optional[KdfParams] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Writes every entry to ``path`` and returns how many were exported.
+
+    The file is written next to ``path`` and renamed into place at the end,
+    so a cancelled or failed export never leaves a partial file behind.
+    """
+    total = database.count_entries()
+    partial = path.with_name(path.name + ".partial")
+    exported = 0
+    try:
+        with partial.open("wb") as fp:
+            writer = ExportWriter(fp, password, params, chunk_size)
+            for entry in database.iter_entries():
+                if cancel is not None and cancel.is_set():
+                    raise InterruptedError("The export was cancelled.")
+                writer.write(
+                    {
+                        "title": entry.title,
+                        "username": entry.username,
+                        "password": decrypt(fernet, entry.password_encrypted),
+                        "url": entry.url,
+                        "notes": entry.notes,
+                        "created_at": entry.created_at,
+                        "updated_at": entry.updated_at,
+                    }
+                )
+                exported += 1
+                if progress is not None and exported % 500 == 0:
+                    progress(exported, max(total, exported))
+            writer.close()
+        os.replace(partial, path)
+    finally:
+        if partial.exists():
+            partial.unlink()
+    if progress is not None:
+        progress(exported, max(total, exported))
+    return exported
+
+
+def read_export(path: Path, password: str) -> Iterator[ImportRecord]:
+    with path.open("rb") as fp:
+        for record in read_records(fp, password):
+            yield ImportRecord(
+                record["title"],
+                record["username"],
+                record["password"],
+                record.get("url"),
+                record.get("notes"),
+                record.get("created_at"),
+                record.get("updated_at"),
+            )
+
+
+def export_file(
+    database_path: Path,
+    fernet: Fernet,
+    path: Path,
+    password: str,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+    params: Optional[KdfParams] = None,
+) -> int:
+    """Runs :func:`export_vault` on its own read-only connection, for use from a worker thread."""
+    database = VaultDatabase(database_path)
+    try:
+        with database.reader() as reader:
+            # One read transaction gives the export a consistent snapshot
+            # while the app keeps writing.
+            reader.conn.execute("BEGIN")
+            return export_vault(reader, fernet, path, password, cancel, progress, params)
+    finally:
+        database.close()
+
+
+def import_export_file(
+    path: Path,
+    password: str,
+    database_path: Path,
+    fernet: Fernet,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> ImportReport:
+    """Restores the entries of an export file into the vault at ``database_path``.
+
+    A restore is all or nothing. Entries are first staged in a scratch vault
+    next to the real one, so every chunk is authenticated, up to and
+    including the final one, before the vault is touched. The staged rows
+    are then copied over in a single transaction. A wrong password, a
+    damaged or truncated file, or a cancel leaves the vault as it was.
+    """
+    staging_path = database_path.with_name(database_path.name + ".restore")
+    _remove_database(staging_path)
+    try:
+        staging = VaultDatabase(staging_path, StorageProfile(synchronous="OFF", readers=1))
+        try:
+            report = import_records(staging, fernet, read_export(path, password), 0, cancel, progress)
+        finally:
+            staging.close()
+        if report.cancelled:
+            report.imported = 0
+            return report
+        database = VaultDatabase(database_path)
+        try:
+            report.imported = database.add_entries_from(staging_path)
+        finally:
+            database.close()
+        return report
+    finally:
+        _remove_database(staging_path)
+
+
+def _remove_database(path: Path) -> None:
+    for leftover in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+        if leftover.exists():
+            leftover.unlink()
+
+
+__all__ = [
+    "CHUNK_SIZE",
+    "EXPORT_SUFFIX",
+    "ExportHeader",
+    "ExportWriter",
+    "FORMAT_VERSION",
+    "export_file",
+    "export_vault",
+    "import_export_file",
+    "read_export",
+    "read_header",
+    "read_records",
+]
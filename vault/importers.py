@@ -0,0 +1,331 @@
+"""Streaming import of exports from browsers and other password managers.
+
+Each reader yields :class:`ImportRecord` objects, or :class:`RowError` for
+rows it cannot use, while holding only the current row in memory:
+
+* ``read_browser_csv``: Chrome (``name,url,username,password,note``) and
+  Firefox (``url,username,password,...``) password exports.
+* ``read_bitwarden_json``: unencrypted Bitwarden JSON exports. The ``items``
+  array is decoded one object at a time instead of loading the document.
+* ``read_keepass_xml``: KeePass 2 XML exports, parsed with ``iterparse``.
+
+:func:`import_records` encrypts batches on a thread pool and inserts each
+batch with a single ``executemany`` transaction.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Union
+
+from cryptography.fernet import Fernet
+
+from .database import VaultDatabase
+from .search import url_host
+from .security import encrypt
+
+ProgressCallback = Callable[[int, int], None]
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+CHROME_CSV = "chrome-csv"
+FIREFOX_CSV = "firefox-csv"
+BITWARDEN_JSON = "bitwarden-json"
+KEEPASS_XML = "keepass-xml"
+
+
+@dataclass
+class ImportRecord:
+    title: str
+    username: str
+    password: str
+    url: Optional[str]
+    notes: Optional[str]
+    # Set when restoring an export; other sources are stamped with the import time.
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+@dataclass
+class RowError:
+    """A row that was skipped; ``position`` is a line (CSV) or item number."""
+
+    position: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    cancelled: bool = False
+    errors: List[RowError] = field(default_factory=list)
+
+
+ParsedRow = Union[ImportRecord, RowError]
+
+_EXTRA_COLUMNS = "\0extra"
+
+
+def _record(
+    position: int,
+    title: Optional[str],
+    username: Optional[str],
+    password: Optional[str],
+    url: Optional[str],
+    notes: Optional[str],
+) -> ParsedRow:
+    title = (title or "").strip() or url_host(url) or (username or "").strip()
+    if not title:
+        return RowError(position, "The row has no title, URL or username.")
+    return ImportRecord(title, username or "", password or "", url or None, notes or None)
+
+
+def read_browser_csv(fp: TextIO) -> Iterator[ParsedRow]:
+    reader = csv.DictReader(fp, restkey=_EXTRA_COLUMNS)
+    fields = {name.strip().lower() for name in reader.fieldnames or ()}
+    if not {"url", "username", "password"} <= fields:
+        raise ValueError("This CSV file is not a Chrome or Firefox password export.")
+    for row in reader:
+        if _EXTRA_COLUMNS in row:
+            yield RowError(reader.line_num, "The row has more columns than the header.")
+            continue
+        row = {key.strip().lower(): value for key, value in row.items()}
+        yield _record(
+            reader.line_num, row.get("name"), row.get("username"), row.get("password"), row.get("url"), row.get("note")
+        )
+
+
+def read_bitwarden_json(fp: TextIO, chunk_size: int = 64 * 1024) -> Iterator[ParsedRow]:
+    for position, item in enumerate(_iter_json_array(fp, "items", chunk_size), start=1):
+        if not isinstance(item, dict):
+            yield RowError(position, "The item is not a JSON object.")
+            continue
+        if item.get("type") == 2:
+            # Secure notes carry no login but are still worth keeping.
+            yield _record(position, item.get("name"), "", "", None, item.get("notes"))
+            continue
+        login = item.get("login")
+        if item.get("type") != 1 or not isinstance(login, dict):
+            yield RowError(position, f"Skipped {item.get('name') or 'an item'}: only logins and notes are supported.")
+            continue
+        uris = login.get("uris") or []
+        url = next((uri.get("uri") for uri in uris if isinstance(uri, dict) and uri.get("uri")), None)
+        yield _record(position, item.get("name"), login.get("username"), login.get("password"), url, item.get("notes"))
+
+
+def read_keepass_xml(fp) -> Iterator[ParsedRow]:
+    position = 0
+    history_depth = 0
+    # Open elements, so every finished Entry, Group and History can be dropped from its parent.
+    open_elements: List[ElementTree.Element] = []
+    for event, element in ElementTree.iterparse(fp, events=("start", "end")):
+        if event == "start":
+            open_elements.append(element)
+            history_depth += element.tag == "History"
+            continue
+        open_elements.pop()
+        if element.tag not in ("Entry", "Group", "History"):
+            continue
+        record = None
+        if element.tag == "History":
+            history_depth -= 1
+        elif element.tag == "Entry" and not history_depth:
+            position += 1
+            values: Dict[str, str] = {}
+            for string in element.findall("String"):
+                values[string.findtext("Key", "")] = string.findtext("Value", "")
+            record = _record(
+                position,
+                values.get("Title"),
+                values.get("UserName"),
+                values.get("Password"),
+                values.get("URL"),
+                values.get("Notes"),
+            )
+        element.clear()
+        if open_elements:
+            open_elements[-1].remove(element)
+        if record is not None:
+            yield record
+
+
+def detect_format(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix == ".json":
+        return BITWARDEN_JSON
+    if suffix == ".xml":
+        return KEEPASS_XML
+    if suffix == ".csv":
+        with path.open("r", encoding="utf-8-sig", newline="") as fp:
+            header = fp.readline().lower()
+        return CHROME_CSV if header.startswith("name") else FIREFOX_CSV
+    raise ValueError(f"Unsupported import file type {suffix or path.name!r}.")
+
+
+def read_file(path: Path, file_format: Optional[str] = None) -> Iterator[ParsedRow]:
+    """Streams the records of an export file, detecting its format from the name."""
+    file_format = file_format or detect_format(path)
+    if file_format == KEEPASS_XML:
+        with path.open("rb") as fp:
+            yield from read_keepass_xml(fp)
+        return
+    # utf-8-sig drops the byte order mark some exporters write.
+    with path.open("r", encoding="utf-8-sig", newline="") as fp:
+        if file_format in (CHROME_CSV, FIREFOX_CSV):
+            yield from read_browser_csv(fp)
+        elif file_format == BITWARDEN_JSON:
+            yield from read_bitwarden_json(fp)
+        else:
+            raise ValueError(f"Unsupported import format {file_format!r}.")
+
+
+def import_records(
+    database: VaultDatabase,
+    fernet: Fernet,
+    rows: Iterable[ParsedRow],
+    total: int = 0,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+    batch_size: int = BATCH_SIZE,
+    workers: Optional[int] = None,
+) -> ImportReport:
+    """Encrypts and stores ``rows`` batch by batch.
+
+    ``total`` is only used for progress reporting; pass 0 when unknown.
+    Cancelling keeps the batches already committed.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    workers = workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if cancel is not None and cancel.is_set():
+                report.cancelled = True
+                break
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            records: List[ImportRecord] = []
+            for row in batch:
+                if isinstance(row, RowError):
+                    report.failed += 1
+                    if len(report.errors) < MAX_REPORTED_ERRORS:
+                        report.errors.append(row)
+                else:
+                    records.append(row)
+            # One task per worker keeps executor overhead off the per-row path.
+            step = -(-len(records) // workers) or 1
+            chunks = pool.map(
+                lambda chunk: [encrypt(fernet, record.password) for record in chunk],
+                [records[start : start + step] for start in range(0, len(records), step)],
+            )
+            ciphertexts = (ciphertext for chunk in chunks for ciphertext in chunk)
+            report.imported += database.add_entries(
+                (record.title, record.username, ciphertext, record.url, record.notes, record.created_at, record.updated_at)
+                for record, ciphertext in zip(records, ciphertexts)
+            )
+            if progress is not None:
+                done = report.imported + report.failed
+                progress(done, max(total, done))
+    return report
+
+
+def import_file(
+    path: Path,
+    database_path: Path,
+    fernet: Fernet,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> ImportReport:
+    """Imports ``path`` on its own connection, for use from a worker thread."""
+    database = VaultDatabase(database_path)
+    try:
+        return import_records(database, fernet, read_file(path), _estimate_rows(path), cancel, progress)
+    finally:
+        database.close()
+
+
+def _estimate_rows(path: Path) -> int:
+    # A cheap upper bound for the progress bar: CSV exports hold one entry
+    # per line. JSON and XML sizes say little about the entry count.
+    if path.suffix.lower() != ".csv":
+        return 0
+    with path.open("rb") as fp:
+        return max(sum(chunk.count(b"\n") for chunk in iter(lambda: fp.read(1 << 20), b"")) - 1, 0)
+
+
+def _iter_json_array(fp: TextIO, key: str, chunk_size: int) -> Iterator[object]:
+    """Yields the elements of the array stored under ``key`` one at a time."""
+    decoder = json.JSONDecoder()
+    marker = json.dumps(key)
+    buffer = ""
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, eof
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        return not eof
+
+    # Find `"items": [`, reading on until the text after the key decides it.
+    while True:
+        start = buffer.find(marker)
+        if start < 0:
+            buffer = buffer[-len(marker) :]
+        else:
+            rest = buffer[start + len(marker) :].lstrip()
+            if rest.startswith(":") and rest[1:].lstrip().startswith("["):
+                buffer = rest[1:].lstrip()[1:]
+                break
+            if rest and rest.rstrip() != ":":
+                # The marker was a string value or another kind of member.
+                buffer = buffer[start + len(marker) :]
+                continue
+        if not fill():
+            raise ValueError(f"The JSON file has no {key!r} array.")
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            value, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof or not fill():
+                raise ValueError("The JSON file ended in the middle of an item.") from None
+            continue
+        # A number may continue past the chunk boundary; make sure it ended.
+        if end == len(buffer) and not eof and fill():
+            continue
+        yield value
+        buffer = buffer[end:]
+
+
+__all__ = [
+    "BITWARDEN_JSON",
+    "CHROME_CSV",
+    "FIREFOX_CSV",
+    "KEEPASS_XML",
+    "ImportRecord",
+    "ImportReport",
+    "RowError",
+    "detect_format",
+    "import_file",
+    "import_records",
+    "read_bitwarden_json",
+    "read_browser_csv",
+    "read_file",
+    "read_keepass_xml",
+]
@@ -0,0 +1,299 @@
+"""Merge of vault copies, diffed with a Merkle tree over entry versions.
+
+Every entry and tombstone is a leaf keyed by its UUID; the leaf hash covers
+the UUID, revision, modification time and whether it is a deletion. Each
+vault keeps the XOR of the leaf hashes under every ``SYNC_PREFIX``-digit
+UUID prefix in ``sync_buckets``, updated by triggers on every write, so a
+merge reads a few thousand bucket hashes instead of hashing every entry.
+Inner nodes hash their children, one hex digit per level, and equal
+subtrees are skipped by comparing one hash. Only the buckets under
+differing nodes are compared entry by entry, which finds ``k`` changes in
+``O(k · log n)`` comparisons.
+
+A merge records each row's revision as ``synced_revision`` where both
+copies agree, which makes it the common ancestor of the next merge; the
+later of the two copies' ancestors is used, since either copy may have
+moved on to the other's version by merging from one side only. A
+differing entry that only one copy changed since then takes that copy's
+version. When both copies changed it, by however many edits each, the
+entry is resolved last-writer-wins on ``modified_at``, with ties going to
+the higher revision, and reported as a :class:`MergeConflict`. Entries
+never merged before have no known ancestor; for them, equal revisions
+with different contents count as a conflict.
+
+:func:`merge_vaults` brings both copies to the same entries and
+tombstones. :func:`merge_files` only reads the other copy, which may sit
+on removable or shared storage: entries where this copy is newer are
+reported as ``kept`` and reach the other copy when it merges from this one.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from .config import CONFIG_PATH, ConfigManager
+from .database import SyncRecord, VaultDatabase
+from .migrations import SCHEMA_VERSION, SYNC_PREFIX
+from .security import unlock
+
+ProgressCallback = Callable[[int, int], None]
+
+BATCH_SIZE = 500
+
+_HEX = "0123456789abcdef"
+_EMPTY = b""
+
+LOCAL = "local"
+REMOTE = "remote"
+
+
+class MerkleTree:
+    """A hash tree over the bucket hashes of :meth:`VaultDatabase.sync_buckets`."""
+
+    def __init__(self, buckets: Dict[str, int]) -> None:
+        # levels[k] maps every non-empty prefix of length k to its hash.
+        self.levels: List[Dict[str, bytes]] = [dict() for _ in range(SYNC_PREFIX + 1)]
+        self.levels[SYNC_PREFIX] = {
+            prefix: value.to_bytes(8, "big", signed=True) for prefix, value in buckets.items() if value
+        }
+        for level in range(SYNC_PREFIX, 0, -1):
+            parents: Dict[str, List[bytes]] = {}
+            for prefix in sorted(self.levels[level]):
+                parents.setdefault(prefix[:-1], []).append(prefix[-1].encode("ascii") + self.levels[level][prefix])
+            self.levels[level - 1] = {prefix: _digest(b"".join(children)) for prefix, children in parents.items()}
+
+    @property
+    def root(self) -> bytes:
+        return self.levels[0].get("", _EMPTY)
+
+    def node(self, prefix: str) -> bytes:
+        return self.levels[len(prefix)].get(prefix, _EMPTY)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def diff_trees(local: MerkleTree, remote: MerkleTree) -> Tuple[List[str], int]:
+    """Returns the bucket prefixes whose hashes differ and how many nodes were compared."""
+    differing: List[str] = []
+    compared = 0
+    pending = [""]
+    while pending:
+        prefix = pending.pop()
+        compared += 1
+        if local.node(prefix) == remote.node(prefix):
+            continue
+        if len(prefix) < SYNC_PREFIX:
+            pending.extend(prefix + digit for digit in _HEX)
+        else:
+            differing.append(prefix)
+    return sorted(differing), compared
+
+
+def diff_buckets(local: VaultDatabase, remote: VaultDatabase, prefixes: Sequence[str]) -> List[str]:
+    """Returns the UUIDs under ``prefixes`` whose versions differ between the copies."""
+    differing: List[str] = []
+    for prefix in prefixes:
+        ours = {state[0]: state for state in local.sync_state(prefix)}
+        theirs = {state[0]: state for state in remote.sync_state(prefix)}
+        differing.extend(uuid for uuid in ours.keys() | theirs.keys() if ours.get(uuid) != theirs.get(uuid))
+    return sorted(differing)
+
+
+@dataclass
+class MergeConflict:
+    """An entry both copies changed; ``kept`` says whose version won."""
+
+    uuid: str
+    title: str
+    local: SyncRecord
+    remote: SyncRecord
+    kept: str
+
+
+@dataclass
+class MergeReport:
+    pulled: int = 0
+    pushed: int = 0
+    # Entries where this copy's version won; pushed too unless the merge only pulled.
+    kept: int = 0
+    compared_nodes: int = 0
+    conflicts: List[MergeConflict] = field(default_factory=list)
+
+
+def _resolve(local: SyncRecord, remote: SyncRecord) -> Tuple[str, bool]:
+    """Returns whose version to keep and whether both copies changed the entry."""
+    known = [revision for revision in (local.synced_revision, remote.synced_revision) if revision is not None]
+    if not known:
+        return _winner(local, remote), local.revision == remote.revision
+    ancestor = max(known)
+    ours = local.revision != ancestor
+    theirs = remote.revision != ancestor
+    if ours != theirs:
+        return (LOCAL if ours else REMOTE), False
+    return _winner(local, remote), ours and theirs
+
+
+def _winner(local: SyncRecord, remote: SyncRecord) -> str:
+    ours, theirs = (local.modified_at, local.revision), (remote.modified_at, remote.revision)
+    if ours != theirs:
+        return LOCAL if ours > theirs else REMOTE
+    # Equal stamps can only differ in being deleted; the deletion wins on
+    # both sides of the merge.
+    return LOCAL if local.deleted else REMOTE
+
+
+def _transcode(record: SyncRecord, source: Optional[Fernet], target: Optional[Fernet]) -> SyncRecord:
+    if record.deleted or source is None or target is None or source is target:
+        return record
+    return SyncRecord(
+        record.uuid,
+        record.revision,
+        record.modified_at,
+        record.deleted,
+        record.title,
+        record.username,
+        target.encrypt(source.decrypt(record.password_encrypted)),
+        record.url,
+        record.notes,
+        record.created_at,
+    )
+
+
+def merge_vaults(
+    local: VaultDatabase,
+    remote: VaultDatabase,
+    fernet: Optional[Fernet] = None,
+    remote_fernet: Optional[Fernet] = None,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+    push: bool = True,
+) -> MergeReport:
+    """Brings ``local`` and ``remote`` to the same contents.
+
+    Pass both keys when the copies use different data keys (one of them
+    changed its master password); passwords are then re-encrypted on the
+    way across. With ``push`` false ``remote`` is only read. Cancelling
+    stops between batches; every batch applied so far leaves both copies
+    consistent.
+    """
+    prefixes, compared = diff_trees(MerkleTree(local.sync_buckets()), MerkleTree(remote.sync_buckets()))
+    uuids = diff_buckets(local, remote, prefixes)
+    report = MergeReport(compared_nodes=compared)
+    kept: List[str] = []
+    for start in range(0, len(uuids), BATCH_SIZE):
+        if cancel is not None and cancel.is_set():
+            break
+        batch = uuids[start : start + BATCH_SIZE]
+        ours = {record.uuid: record for record in local.get_sync_records(batch)}
+        theirs = {record.uuid: record for record in remote.get_sync_records(batch)}
+        pull: List[SyncRecord] = []
+        push_records: List[SyncRecord] = []
+        for uuid in batch:
+            mine, other = ours.get(uuid), theirs.get(uuid)
+            if other is None:
+                kept.append(uuid)
+                push_records.append(_transcode(mine, fernet, remote_fernet))
+                continue
+            if mine is None:
+                pull.append(_transcode(other, remote_fernet, fernet))
+                continue
+            winner, conflict = _resolve(mine, other)
+            if conflict:
+                report.conflicts.append(MergeConflict(uuid, mine.title or other.title, mine, other, winner))
+            if winner == LOCAL:
+                kept.append(uuid)
+                push_records.append(_transcode(mine, fernet, remote_fernet))
+            else:
+                pull.append(_transcode(other, remote_fernet, fernet))
+        report.pulled += local.apply_sync_records(pull)
+        if push:
+            report.pushed += remote.apply_sync_records(push_records)
+            local.mark_synced(batch)
+            remote.mark_synced(batch)
+        else:
+            local.mark_synced([record.uuid for record in pull])
+        if progress is not None:
+            progress(min(start + BATCH_SIZE, len(uuids)), len(uuids))
+    else:
+        # Every other row matches the other copy, including those the diff skipped.
+        if push:
+            local.mark_synced()
+            remote.mark_synced()
+        else:
+            local.mark_synced(keep=kept)
+    report.kept = len(kept)
+    return report
+
+
+def merge_files(
+    local_path: Path,
+    remote_path: Path,
+    fernet: Fernet,
+    remote_password: Optional[str] = None,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> MergeReport:
+    """Merges the copy at ``remote_path`` into the vault at ``local_path``, for use from a worker thread.
+
+    The copy is opened read-only and never changed, not even migrated, so
+    it must use this app's schema version. ``remote_password`` unlocks the
+    copy's own ``config.json`` when it has a different master key; without
+    it the copy must share ``fernet``.
+    """
+    remote_fernet = _unlock_copy(remote_path, remote_password) if remote_password is not None else None
+    remote = VaultDatabase.open_read_only(remote_path)
+    try:
+        if remote.schema_version != SCHEMA_VERSION:
+            raise ValueError(
+                "The other vault was last opened by a different version of the app; "
+                "open it with this version once before merging."
+            )
+        if remote_fernet is None:
+            _check_shared_key(remote, fernet)
+        local = VaultDatabase(local_path)
+        try:
+            return merge_vaults(local, remote, fernet, remote_fernet, cancel, progress, push=False)
+        finally:
+            local.close()
+    finally:
+        remote.close()
+
+
+def _unlock_copy(path: Path, password: str) -> Fernet:
+    config = ConfigManager(path.with_name(CONFIG_PATH.name))
+    if not config.exists():
+        raise ValueError(f"No {CONFIG_PATH.name} was found next to the other vault.")
+    unlocked = unlock(password, config.read())
+    if unlocked is None:
+        raise ValueError("The master password of the other vault is incorrect.")
+    return unlocked[0]
+
+
+def _check_shared_key(remote: VaultDatabase, fernet: Fernet) -> None:
+    row = remote.conn.execute("SELECT password_encrypted FROM entries LIMIT 1").fetchone()
+    if row is None:
+        return
+    try:
+        fernet.decrypt(row[0])
+    except InvalidToken:
+        raise ValueError("The other vault uses a different master key; its master password is needed.") from None
+
+
+__all__ = [
+    "LOCAL",
+    "REMOTE",
+    "MergeConflict",
+    "MergeReport",
+    "MerkleTree",
+    "diff_buckets",
+    "diff_trees",
+    "merge_files",
+    "merge_vaults",
+]
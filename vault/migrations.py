@@ -0,0 +1,253 @@
+"""Ordered schema migrations for ``vault.db``, tracked in ``PRAGMA user_version``.
+
+Migration ``n`` (1-based) brings a database from version ``n - 1`` to ``n``.
+Each runs in its own write transaction together with the version bump, so a
+crash leaves the database at the last fully applied version. Migrations are
+append-only: once released, a step never changes, and fixes go into a new
+step at the end of :data:`MIGRATIONS`.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import unicodedata
+import uuid
+from typing import Callable, Dict, Iterable, Tuple
+
+from .search import sort_text, url_host
+
+Migration = Callable[[sqlite3.Connection], None]
+
+# Hex digits of the UUID that pick an entry's row in sync_buckets.
+SYNC_PREFIX = 3
+
+
+def sync_leaf(uuid: str, revision: int, modified_at: str, deleted: bool) -> int:
+    """Hashes one version of an entry or tombstone to a signed 64-bit integer."""
+    data = f"{uuid}|{revision}|{modified_at}|{int(deleted)}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+
+def _sync_mix(bucket: int, uuid: str, revision: int, modified_at: str, deleted: int) -> int:
+    return bucket ^ sync_leaf(uuid, revision, modified_at, bool(deleted))
+
+
+def add_sync_leaves(conn: sqlite3.Connection, states: Iterable[Tuple[str, int, str, bool]]) -> None:
+    """Mixes ``(uuid, revision, modified_at, deleted)`` leaves into ``sync_buckets`` in one pass.
+
+    Bulk inserts use this instead of the per-row trigger.
+    """
+    changed: Dict[str, int] = {}
+    for state in states:
+        prefix = state[0][:SYNC_PREFIX]
+        changed[prefix] = changed.get(prefix, 0) ^ sync_leaf(*state)
+    if not changed:
+        return
+    current = dict(conn.execute("SELECT prefix, hash FROM sync_buckets").fetchall())
+    conn.executemany(
+        "INSERT INTO sync_buckets (prefix, hash) VALUES (?, ?) ON CONFLICT (prefix) DO UPDATE SET hash = excluded.hash",
+        [(prefix, current.get(prefix, 0) ^ value) for prefix, value in changed.items()],
+    )
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """Defines the SQL functions the sync triggers call; every writing connection needs them."""
+    conn.create_function("sync_mix", 5, _sync_mix, deterministic=True)
+
+
+def _create_tables(conn: sqlite3.Connection) -> None:
+    # Vaults created before versioning already have these tables.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            username TEXT NOT NULL,
+            password_encrypted BLOB NOT NULL,
+            url TEXT,
+            notes TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rekey_journal (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            new_config TEXT NOT NULL,
+            bridge_key BLOB NOT NULL,
+            last_id INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+def _create_sort_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_title ON entries (title COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_username ON entries (username COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_url ON entries (IFNULL(url, '') COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_updated_at ON entries (updated_at)")
+
+
+def _add_url_host(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE entries ADD COLUMN url_host TEXT NOT NULL DEFAULT ''")
+    rows = conn.execute("SELECT id, url FROM entries WHERE url IS NOT NULL AND url != ''").fetchall()
+    conn.executemany(
+        "UPDATE entries SET url_host = ? WHERE id = ?",
+        [(url_host(row[1]), row[0]) for row in rows],
+    )
+    conn.execute("CREATE INDEX idx_entries_url_host ON entries (url_host)")
+
+
+def _store_title_keys(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, title FROM entries").fetchall()
+    conn.executemany(
+        "UPDATE entries SET title_key = ? WHERE id = ?",
+        [(sort_text(row[1]), row[0]) for row in rows],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO vault_meta (key, value) VALUES ('sort_unicode_version', ?)",
+        (unicodedata.unidata_version,),
+    )
+
+
+def _add_title_key(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE entries ADD COLUMN title_key TEXT NOT NULL DEFAULT ''")
+    conn.execute("CREATE TABLE vault_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    _store_title_keys(conn)
+    conn.execute("CREATE INDEX idx_entries_title_key ON entries (title_key)")
+    conn.execute("DROP INDEX IF EXISTS idx_entries_title")
+
+
+# Fixed so that copies of one vault made before this migration derive the
+# same entry UUIDs when each copy is upgraded, and still merge cleanly.
+_LEGACY_UUID_NAMESPACE = uuid.UUID("5b0f7c1e-3d2a-4c8e-9f61-2a7d4e9b8c10")
+
+
+def _bucket_triggers(table: str, modified_at: str, deleted: int) -> Tuple[str, ...]:
+    """Triggers that keep ``sync_buckets`` equal to the XOR of the leaves of ``table``.
+
+    The outer statement's conflict clause overrides one inside a trigger, so
+    an upsert would turn ``INSERT OR IGNORE`` into a failure; the bucket row
+    is inserted only when it is missing instead.
+    """
+
+    def mix(row: str) -> str:
+        return f"""
+            INSERT INTO sync_buckets (prefix, hash) SELECT substr({row}.uuid, 1, {SYNC_PREFIX}), 0
+            WHERE NOT EXISTS (SELECT 1 FROM sync_buckets WHERE prefix = substr({row}.uuid, 1, {SYNC_PREFIX}));
+            UPDATE sync_buckets SET hash = sync_mix(hash, {row}.uuid, {row}.revision, {row}.{modified_at}, {deleted})
+            WHERE prefix = substr({row}.uuid, 1, {SYNC_PREFIX});
+        """
+
+    return (
+        f"CREATE TRIGGER {table}_sync_insert AFTER INSERT ON {table} BEGIN {mix('new')} END",
+        f"CREATE TRIGGER {table}_sync_delete AFTER DELETE ON {table} BEGIN {mix('old')} END",
+        f"""
+        CREATE TRIGGER {table}_sync_update AFTER UPDATE OF uuid, revision, {modified_at} ON {table}
+        BEGIN {mix('old')} {mix('new')} END
+        """,
+    )
+
+
+def _add_sync_metadata(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE entries ADD COLUMN uuid TEXT NOT NULL DEFAULT ''")
+    conn.execute("ALTER TABLE entries ADD COLUMN revision INTEGER NOT NULL DEFAULT 1")
+    # The revision both copies agreed on at their last merge; NULL until then.
+    conn.execute("ALTER TABLE entries ADD COLUMN synced_revision INTEGER")
+    rows = conn.execute("SELECT id, created_at FROM entries").fetchall()
+    conn.executemany(
+        "UPDATE entries SET uuid = ? WHERE id = ?",
+        [(uuid.uuid5(_LEGACY_UUID_NAMESPACE, f"{row[0]}:{row[1]}").hex, row[0]) for row in rows],
+    )
+    conn.execute("CREATE UNIQUE INDEX idx_entries_uuid ON entries (uuid)")
+    conn.execute(
+        """
+        CREATE TABLE tombstones (
+            uuid TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL,
+            synced_revision INTEGER
+        ) WITHOUT ROWID
+        """
+    )
+    # The leaves of the merge's Merkle tree, kept up to date by triggers so
+    # a merge reads one row per bucket instead of hashing every entry.
+    conn.execute("CREATE TABLE sync_buckets (prefix TEXT PRIMARY KEY, hash INTEGER NOT NULL) WITHOUT ROWID")
+    rows = conn.execute("SELECT uuid, revision, updated_at FROM entries")
+    add_sync_leaves(conn, ((row[0], row[1], row[2], False) for row in rows))
+    for trigger in _bucket_triggers("entries", "updated_at", 0) + _bucket_triggers("tombstones", "deleted_at", 1):
+        conn.execute(trigger)
+
+
+ENTRY_SYNC_INSERT_TRIGGER = _bucket_triggers("entries", "updated_at", 0)[0]
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    _create_tables,
+    _create_sort_indexes,
+    _add_url_host,
+    _add_title_key,
+    _add_sync_metadata,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def refresh_sort_keys(conn: sqlite3.Connection) -> bool:
+    """Recomputes ``title_key`` if it was written with other Unicode tables.
+
+    Python upgrades can change case-folding and normalization data, and
+    keys computed at query time must match the stored ones for keyset
+    paging to work. Returns whether the keys were rewritten.
+    """
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'sort_unicode_version'").fetchone()
+    if row is not None and row[0] == unicodedata.unidata_version:
+        return False
+    with conn:
+        _store_title_keys(conn)
+    return True
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def migrate(conn: sqlite3.Connection, migrations: Tuple[Migration, ...] = MIGRATIONS) -> int:
+    """Applies every pending migration and returns the resulting version."""
+    version = schema_version(conn)
+    if version > len(migrations):
+        raise RuntimeError(
+            f"The vault database uses schema version {version}, "
+            f"but this version of the app only supports up to {len(migrations)}."
+        )
+    while version < len(migrations):
+        # IMMEDIATE takes the write lock up front, so a second connection
+        # opening at the same time waits and then sees the new version.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version < len(migrations):
+                migrations[version](conn)
+                version += 1
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return version
+
+
+__all__ = [
+    "ENTRY_SYNC_INSERT_TRIGGER",
+    "MIGRATIONS",
+    "SCHEMA_VERSION",
+    "SYNC_PREFIX",
+    "add_sync_leaves",
+    "migrate",
+    "refresh_sort_keys",
+    "register_functions",
+    "schema_version",
+    "sync_leaf",
+]
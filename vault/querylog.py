@@ -0,0 +1,332 @@
+"""Per-statement counters and a slow-query log for the vault's connections.
+
+Connections opened with ``factory=ProfiledConnection`` and attached to a
+:class:`QueryLog` record every ``execute``/``executemany`` as soon as it
+returns, so a cursor that is never fetched is still counted. Later fetches
+from the cursor add their time and rows to the same statement, so a
+``SELECT`` is charged for the rows it steps through and not only for its
+first step. Iterating a cursor fetches in batches as the loop advances, so
+a loop that stops early is charged only for what it read.
+
+Statements are grouped by their normalized SQL: literals become ``?`` and
+``IN (?, ?, ...)`` lists collapse, so the same query with different
+parameters shares one counter.
+
+Statements that reach ``threshold_ms`` are written to
+``LOG_DIR/slow-queries.log`` with their duration, row count and
+``EXPLAIN QUERY PLAN``, and a plan that scans a whole table is flagged. A
+statement is logged once per execution, when its execute and fetches
+together first reach the threshold.
+
+SQLite's trace callback sees the statements that never pass through
+``execute``: the ``COMMIT`` issued when a ``with conn:`` block exits and each
+statement of an ``executescript``. Those are counted, untimed.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import LOG_DIR
+
+ENV_VAR = "KAKHAS_VAULT_SLOW_QUERY_MS"
+SLOW_QUERY_MS = 50.0
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_BLOB = re.compile(r"\b[xX]'[0-9a-fA-F]*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?!.*\bUSING\b)")
+
+_logger = logging.getLogger("vault.sql")
+_logger.propagate = False
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace and replaces literals so equivalent statements match."""
+    sql = _BLOB.sub("?", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip().rstrip(";")
+    return _IN_LIST.sub("(?...)", sql)
+
+
+@dataclass
+class QueryStats:
+    """Counters for one normalized statement; ``plan`` is kept from its last slow run."""
+
+    sql: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    slow: int = 0
+    plan: List[str] = field(default_factory=list)
+    full_scan: bool = False
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+class QueryLog:
+    """Collects :class:`QueryStats` from any number of connections and threads."""
+
+    def __init__(self, threshold_ms: Optional[float] = None, log_dir: Optional[Path] = LOG_DIR) -> None:
+        if threshold_ms is None:
+            threshold_ms = float(os.environ.get(ENV_VAR) or SLOW_QUERY_MS)
+        self.threshold_ms = threshold_ms
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self._stats: Dict[str, QueryStats] = {}
+        # Statement text repeats, so it is normalized once per distinct string.
+        self._keys: Dict[str, str] = {}
+
+    def attach(self, conn: "ProfiledConnection") -> None:
+        conn.query_log = self
+        conn.set_trace_callback(conn._trace)
+
+    def key(self, sql: str) -> str:
+        key = self._keys.get(sql)
+        if key is None:
+            key = self._keys[sql] = normalize_sql(sql)
+        return key
+
+    def record(self, conn: "ProfiledConnection", sql: str, params: Any, elapsed_ns: int, rows: int) -> None:
+        """Counts one execution of ``sql`` that took ``elapsed_ns`` and stepped through ``rows``."""
+        self._charge(conn, sql, params, 1, elapsed_ns, elapsed_ns, rows, rows)
+
+    def extend(
+        self,
+        conn: "ProfiledConnection",
+        sql: str,
+        params: Any,
+        added_ns: int,
+        total_ns: int,
+        rows: int,
+        total_rows: int,
+    ) -> None:
+        """Adds a fetch to the execution last recorded for ``sql``; ``total_ns`` and ``total_rows`` include it."""
+        self._charge(conn, sql, params, 0, added_ns, total_ns, rows, total_rows)
+
+    def _charge(
+        self,
+        conn: "ProfiledConnection",
+        sql: str,
+        params: Any,
+        calls: int,
+        added_ns: int,
+        total_ns: int,
+        rows: int,
+        total_rows: int,
+    ) -> None:
+        added_ms, total_ms = added_ns / 1e6, total_ns / 1e6
+        key = self.key(sql)
+        # Only the step that carries an execution over the threshold logs it.
+        slow = total_ms >= self.threshold_ms and (calls or total_ms - added_ms < self.threshold_ms)
+        plan = _explain(conn, sql, params) if slow else None
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.calls += calls
+            stats.total_ms += added_ms
+            stats.max_ms = max(stats.max_ms, total_ms)
+            stats.rows += rows
+            if plan is not None:
+                stats.slow += 1
+                stats.plan = plan
+                stats.full_scan = any(_FULL_SCAN.match(step.strip()) for step in plan)
+        if slow:
+            self._log_slow(stats, total_ms, total_rows, plan or [])
+
+    def count(self, sql: str) -> None:
+        """Counts an untimed statement reported by the trace callback."""
+        key = self.key(sql) if len(sql) < 256 else normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.calls += 1
+
+    def stats(self) -> List[QueryStats]:
+        """Returns a snapshot of every statement's counters, most total time first."""
+        with self._lock:
+            snapshot = [
+                QueryStats(s.sql, s.calls, s.total_ms, s.max_ms, s.rows, s.slow, list(s.plan), s.full_scan)
+                for s in self._stats.values()
+            ]
+        return sorted(snapshot, key=lambda stats: stats.total_ms, reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def _log_slow(self, stats: QueryStats, elapsed_ms: float, rows: int, plan: List[str]) -> None:
+        if self.log_dir is None:
+            return
+        _ensure_handler(self.log_dir)
+        lines = [f"{elapsed_ms:10.1f} ms  rows={rows}  {stats.sql}"]
+        lines.extend(f"    {step}" for step in plan)
+        if stats.full_scan:
+            lines.append("    ! full table scan")
+        _logger.warning("\n".join(lines))
+
+
+_handlers: Dict[Path, logging.Handler] = {}
+_handlers_lock = threading.Lock()
+
+
+def _ensure_handler(log_dir: Path) -> None:
+    with _handlers_lock:
+        if log_dir in _handlers:
+            return
+        log_dir.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            log_dir / "slow-queries.log", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.WARNING)
+        _handlers[log_dir] = handler
+
+
+def _explain(conn: "ProfiledConnection", sql: str, params: Any) -> List[str]:
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    conn._active = True
+    try:
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as exc:
+        return [f"(no plan: {exc})"]
+    finally:
+        conn._active = False
+    # Rows are (id, parent, notused, detail); indent each step under its parent.
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        node, parent, detail = row[0], row[1], row[3]
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Records its statement when executed and charges it for every later fetch."""
+
+    FETCH_SIZE = 256
+
+    _sql: Optional[str] = None
+
+    def _executed(self, sql: str, params: Any, elapsed_ns: int, rows: int) -> None:
+        self._sql, self._params, self._elapsed, self._rows = sql, params, elapsed_ns, rows
+        self.connection.query_log.record(self.connection, sql, params, elapsed_ns, rows)
+
+    def _fetched(self, started: int, rows: int) -> None:
+        elapsed = time.perf_counter_ns() - started
+        if self._sql is not None:
+            self._elapsed += elapsed
+            self._rows += rows
+            self.connection.query_log.extend(
+                self.connection, self._sql, self._params, elapsed, self._elapsed, rows, self._rows
+            )
+
+    def execute(self, sql: str, parameters: Any = ()) -> "ProfiledCursor":
+        conn = self.connection
+        conn._active = True
+        started = time.perf_counter_ns()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            conn._active = False
+        self._executed(sql, parameters, elapsed, max(self.rowcount, 0) if self.description is None else 0)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> "ProfiledCursor":
+        self.connection._active = True
+        started = time.perf_counter_ns()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.connection._active = False
+        self._executed(sql, (), elapsed, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self) -> Any:
+        started = time.perf_counter_ns()
+        row = super().fetchone()
+        self._fetched(started, int(row is not None))
+        return row
+
+    def fetchmany(self, size: int = -1) -> List[Any]:
+        if size < 0:
+            size = self.arraysize
+        started = time.perf_counter_ns()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        started = time.perf_counter_ns()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            rows = self.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                return
+            yield from rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose statements are timed once a :class:`QueryLog` is attached."""
+
+    query_log: Optional[QueryLog] = None
+    _active = False
+
+    def _trace(self, sql: str) -> None:
+        # Statements run by execute() are timed there; this sees the rest.
+        if not self._active:
+            self.query_log.count(sql)
+
+    def cursor(self, factory: Any = None) -> sqlite3.Cursor:
+        if factory is None and self.query_log is not None:
+            factory = ProfiledCursor
+        return super().cursor(factory) if factory is not None else super().cursor()
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        if self.query_log is None:
+            return super().execute(sql, parameters)
+        return super().cursor(ProfiledCursor).execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> sqlite3.Cursor:
+        if self.query_log is None:
+            return super().executemany(sql, seq_of_parameters)
+        return super().cursor(ProfiledCursor).executemany(sql, seq_of_parameters)
+
+
+__all__ = [
+    "ENV_VAR",
+    "ProfiledConnection",
+    "ProfiledCursor",
+    "QueryLog",
+    "QueryStats",
+    "SLOW_QUERY_MS",
+    "normalize_sql",
+]
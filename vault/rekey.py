@@ -0,0 +1,170 @@
+"""Master password change with streaming, resumable re-encryption.
+
+A change generates a fresh data key and seals it under the new password.
+Both the sealed configuration and a *bridge* (the new data key encrypted
+under the current one) go into the ``rekey_journal`` table before any entry
+is touched. Entries are then rotated in id order, one batch per transaction,
+and each transaction also advances the journal's watermark. If the run is
+interrupted, the next unlock with the current password can decrypt the
+bridge and pick up after the watermark. ``config.json`` is only replaced
+once every entry has been rotated.
+
+Upgrading a version 1 config leaves a rotation to a fresh data key in the
+config (see ``security.unlock``); :meth:`RekeyJob.resume` journals and runs
+it like a paused change.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from cryptography.fernet import Fernet, MultiFernet
+
+from .config import ConfigManager
+from .database import VaultDatabase
+from .security import PENDING_REKEY, seal_data_key, unlock
+
+ProgressCallback = Callable[[int, int], None]
+
+BATCH_SIZE = 500
+
+
+class RekeyJob:
+    def __init__(self, database: VaultDatabase, config: ConfigManager, old_fernet: Fernet, new_key: bytes) -> None:
+        self.database = database
+        self.config = config
+        self.old_fernet = old_fernet
+        self.new_fernet = Fernet(new_key)
+        # Rotating through a MultiFernet accepts rows already re-encrypted by
+        # an earlier run, or written by the app with the new key meanwhile.
+        self.fernet = MultiFernet([self.new_fernet, old_fernet])
+        self.completed = False
+
+    @classmethod
+    def begin(
+        cls,
+        database: VaultDatabase,
+        config: ConfigManager,
+        current_password: str,
+        new_password: str,
+    ) -> "RekeyJob":
+        """Verifies ``current_password`` and journals a change to ``new_password``.
+
+        Only one change can be journaled at a time; a paused one has to be
+        resumed to completion first. The bridge is sealed under the data key
+        ``current_password`` unlocks, since that is the key a later
+        :meth:`resume` will have.
+        """
+        if database.rekey_state() is not None:
+            raise ValueError("An earlier master password change has not finished yet.")
+        unlocked = unlock(current_password, config.read())
+        if unlocked is None:
+            raise ValueError("The current master password is incorrect.")
+        fernet = unlocked[0]
+        new_key = Fernet.generate_key()
+        new_config = seal_data_key(new_password, new_key)
+        database.begin_rekey(json.dumps(new_config), fernet.encrypt(new_key))
+        return cls(database, config, fernet, new_key)
+
+    @classmethod
+    def resume(cls, database: VaultDatabase, config: ConfigManager, fernet: Fernet) -> Optional["RekeyJob"]:
+        """Returns the journaled or pending change, if any, that ``fernet`` can continue."""
+        state = database.rekey_state()
+        if state is None:
+            pending = config.read().get(PENDING_REKEY)
+            if pending is None:
+                return None
+            database.begin_rekey(json.dumps(pending["config"]), pending["bridge"].encode("utf-8"))
+            state = database.rekey_state()
+        if state.completed and config.read() == json.loads(state.new_config):
+            # The config swap happened too, so ``fernet`` already is the new key.
+            database.clear_rekey()
+            return None
+        job = cls(database, config, fernet, fernet.decrypt(state.bridge_key))
+        if state.completed:
+            job._finish(state.new_config)
+        return job
+
+    def run(
+        self,
+        progress: Optional[ProgressCallback] = None,
+        cancel: Optional[threading.Event] = None,
+        batch_size: int = BATCH_SIZE,
+        workers: Optional[int] = None,
+    ) -> bool:
+        """Rotates the remaining entries and returns whether the change finished.
+
+        Setting ``cancel`` stops after the current batch; the journal keeps the
+        position so a later :meth:`resume` continues from there.
+        """
+        if self.completed:
+            return True
+        state = self.database.rekey_state()
+        if state is None:
+            raise RuntimeError("No master password change is in progress.")
+        total = self.database.count_entries()
+        done = self.database.count_entries(up_to_id=state.last_id)
+        last_id = state.last_id
+        with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    return False
+                batch = self.database.list_ciphertexts(last_id, batch_size)
+                if not batch:
+                    break
+                tokens = pool.map(self.fernet.rotate, [ciphertext for _, ciphertext in batch])
+                self.database.apply_rekey_batch(
+                    [(entry_id, token) for (entry_id, _), token in zip(batch, tokens)]
+                )
+                last_id = batch[-1][0]
+                done += len(batch)
+                if progress is not None:
+                    progress(done, max(total, done))
+        self.database.complete_rekey()
+        self._finish(state.new_config)
+        return True
+
+    def _finish(self, new_config: str) -> None:
+        self.config.write(json.loads(new_config))
+        self.database.clear_rekey()
+        self.completed = True
+
+
+def change_master_password(
+    path: Path,
+    config: ConfigManager,
+    current_password: str,
+    new_password: str,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> RekeyJob:
+    """Runs a complete change on its own connection, for use from a worker thread."""
+    database = VaultDatabase(path)
+    try:
+        job = RekeyJob.begin(database, config, current_password, new_password)
+        job.run(progress, cancel)
+        return job
+    finally:
+        database.close()
+
+
+def resume_master_password_change(
+    path: Path,
+    config: ConfigManager,
+    fernet: Fernet,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Optional[RekeyJob]:
+    """Continues a journaled change; ``fernet`` is the data key ``config`` currently unlocks."""
+    database = VaultDatabase(path)
+    try:
+        job = RekeyJob.resume(database, config, fernet)
+        if job is not None:
+            job.run(progress, cancel)
+        return job
+    finally:
+        database.close()
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import islice
+from math import ceil
+from sys import intern
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Case-folds ``text`` and strips accents so "Café" and "cafe" index alike."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+# Cyrillic letters in alphabet order, merging the Russian, Ukrainian,
+# Belarusian, Serbian and Macedonian alphabets. Code point order puts
+# letters such as "ё", "є", "і" and "ї" after "я".
+_CYRILLIC_ORDER = "абвгґдђѓеёєжзѕиіїйјклљмнњопрстћќуўфхцчџшщъыьэюя"
+_CYRILLIC = {letter: chr(0x0430 + rank) for rank, letter in enumerate(_CYRILLIC_ORDER)}
+# Grave accents only mark stress.
+_CYRILLIC.update({"ѐ": _CYRILLIC["е"], "ѝ": _CYRILLIC["и"]})
+
+
+def sort_text(text: str) -> str:
+    """Returns the stored sort key for ``text``.
+
+    Case-folding and compatibility normalization make "ＡＢＣ", "ABC" and
+    "abc" sort together in any script. Accents are dropped from Latin
+    letters, so "École" files under "e". Cyrillic letters are renumbered
+    into alphabet order, so "ё" follows "е" and "ї" precedes "й"; stress
+    marks on them are dropped. The key is only meant for comparison.
+    """
+    kept = []
+    strip_marks = False
+    for char in unicodedata.normalize("NFKC", text.casefold()):
+        if unicodedata.combining(char):
+            if not strip_marks:
+                kept.append(char)
+        elif char < "\u0250":
+            kept.append(unicodedata.normalize("NFD", char)[0])
+            strip_marks = True
+        elif char in _CYRILLIC:
+            kept.append(_CYRILLIC[char])
+            strip_marks = True
+        else:
+            kept.append(char)
+            strip_marks = False
+    return "".join(kept)
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def url_host(url: Optional[str]) -> str:
+    if not url:
+        return ""
+    host = urlsplit(url if "//" in url else f"//{url}").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def trigrams(word: str, prefix: bool = False) -> Set[str]:
+    """Returns the trigrams of ``word`` padded with two leading spaces.
+
+    The padding gives the first letters trigrams of their own. A ``prefix``
+    word gets no trailing pad so a half-typed word still matches.
+    """
+    padded = f"  {word}" if prefix else f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """In-memory, typo-tolerant index over entry titles, usernames and hosts.
+
+    The index works on the vocabulary rather than on entries. A sorted word
+    list answers prefix lookups. When a term matches nothing literally,
+    trigram postings over the alphabetic words answer typo-tolerant lookups
+    such as "gthub" -> "github". Each matched word is then expanded to the
+    entries containing it. Vaults repeat words like "gmail" or "github"
+    constantly, so the vocabulary stays far smaller than the entry count and
+    queries touch only a bounded number of words.
+
+    The index lives as long as the vault is open, so it is kept compact:
+    each word's entries are a sorted ``array`` of ids rather than a set, so
+    removing an entry is a binary search per word, and an entry's words are
+    one flat tuple of interned strings in which an empty string separates
+    the title words from the others.
+    """
+
+    MIN_SIMILARITY = 0.5
+    MAX_WORD_MATCHES = 256
+    MAX_CANDIDATES = 1024
+
+    def __init__(self) -> None:
+        self._vocabulary: List[str] = []
+        self._grams: Dict[str, Set[str]] = {}
+        self._entries: Dict[str, "array[int]"] = {}
+        self._documents: Dict[int, Tuple[str, ...]] = {}
+
+    @classmethod
+    def build(cls, entries: Iterable) -> "TrigramIndex":
+        index = cls()
+        index.extend(entries)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, entry_id: int, title: str, username: str, url: Optional[str]) -> None:
+        """Indexes an entry, replacing whatever was indexed for it before."""
+        self.remove(entry_id)
+        for word in self._insert(entry_id, title, username, url):
+            insort(self._vocabulary, word)
+
+    def extend(self, entries: Iterable) -> None:
+        """Indexes a batch of entries, sorting the vocabulary once for the whole batch."""
+        new_words = []
+        for entry in entries:
+            self.remove(entry.id)
+            new_words.extend(self._insert(entry.id, entry.title, entry.username, entry.url))
+        if new_words:
+            self._vocabulary.extend(word for word in dict.fromkeys(new_words) if word in self._entries)
+            self._vocabulary.sort()
+
+    def remove(self, entry_id: int) -> None:
+        document = self._documents.pop(entry_id, None)
+        if document is None:
+            return
+        for word in set(document):
+            if not word:
+                continue
+            postings = self._entries[word]
+            del postings[bisect_left(postings, entry_id)]
+            if not postings:
+                del self._entries[word]
+                self._forget_word(word)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def search(self, query: str, limit: int = 50) -> List[int]:
+        """Returns the ids of the best matching entries, best first.
+
+        Every query word must match some word of an entry. A prefix match
+        scores above a typo-tolerant match, and a title match counts double.
+        """
+        terms = words(query)
+        if not terms:
+            return []
+        matches = [self._match_word(term, prefix=i == len(terms) - 1) for i, term in enumerate(terms)]
+        if not all(matches):
+            return []
+        candidates = self._candidates(sorted(matches, key=self._estimate))
+        scored = []
+        for entry_id in candidates:
+            document = self._documents[entry_id]
+            score = 0.0
+            for similarity in matches:
+                best = 0.0
+                weight = 2.0
+                for word in document:
+                    if not word:
+                        weight = 1.0
+                        continue
+                    best = max(best, similarity.get(word, 0.0) * weight)
+                if not best:
+                    break
+                score += best
+            else:
+                scored.append((-score, document.index(""), entry_id))
+        scored.sort()
+        return [entry_id for _, _, entry_id in scored[:limit]]
+
+    def _insert(self, entry_id: int, title: str, username: str, url: Optional[str]) -> List[str]:
+        title_words = [intern(word) for word in words(title)]
+        other_words = [intern(word) for word in words(f"{username} {url_host(url)}")]
+        self._documents[entry_id] = (*title_words, "", *other_words)
+        new_words = []
+        for word in dict.fromkeys(title_words + other_words):
+            postings = self._entries.get(word)
+            if postings is None:
+                postings = self._entries[word] = array("q")
+                new_words.append(word)
+                for gram in _fuzzy_trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            # Ids mostly arrive in ascending order, so this is usually an append.
+            if not postings or postings[-1] < entry_id:
+                postings.append(entry_id)
+            else:
+                insort(postings, entry_id)
+        return new_words
+
+    def _forget_word(self, word: str) -> None:
+        position = bisect_left(self._vocabulary, word)
+        if position < len(self._vocabulary) and self._vocabulary[position] == word:
+            del self._vocabulary[position]
+        for gram in _fuzzy_trigrams(word):
+            _discard(self._grams, gram, word)
+
+    def _match_word(self, term: str, prefix: bool) -> Dict[str, float]:
+        """Maps vocabulary words to how well they match ``term`` (0..1]."""
+        similarity: Dict[str, float] = {}
+        if prefix:
+            position = bisect_left(self._vocabulary, term)
+            while position < len(self._vocabulary) and len(similarity) < self.MAX_WORD_MATCHES:
+                word = self._vocabulary[position]
+                if not word.startswith(term):
+                    break
+                similarity[word] = 0.75 + 0.25 * len(term) / len(word)
+                position += 1
+        elif term in self._entries:
+            similarity[term] = 1.0
+        # Typo tolerance only kicks in once the term matches nothing literally.
+        if similarity or len(term) < 3:
+            return similarity
+        grams = trigrams(term, prefix)
+        required = max(1, ceil(len(grams) * self.MIN_SIMILARITY))
+        known = sorted((self._grams[gram] for gram in grams if gram in self._grams), key=len)
+        if len(known) < required:
+            return similarity
+        # A word sharing ``required`` trigrams must appear in one of the
+        # ``len(known) - required + 1`` rarest posting lists, so the very
+        # common trigrams never have to be walked to find candidates.
+        candidates = set().union(*known[: len(known) - required + 1])
+        shared = Counter()
+        for postings in known:
+            shared.update(candidates.intersection(postings))
+        fuzzy = [(count, word) for word, count in shared.items() if count >= required]
+        fuzzy.sort(reverse=True)
+        for count, word in fuzzy[: self.MAX_WORD_MATCHES]:
+            if word not in similarity:
+                similarity[word] = 0.7 * count / max(len(grams), len(word) + 1)
+        return similarity
+
+    def _estimate(self, similarity: Dict[str, float]) -> int:
+        return sum(len(self._entries[word]) for word in similarity)
+
+    def _candidates(self, matches: List[Dict[str, float]]) -> Set[int]:
+        """Intersects the entries of each term, most selective term first.
+
+        When even the intersection is too large to score, the pool is filled
+        from the best matching words of the most selective term.
+        """
+        candidates: Optional[Set[int]] = None
+        for similarity in matches:
+            entries = set().union(*(self._entries[word] for word in similarity))
+            candidates = entries if candidates is None else candidates & entries
+            if len(candidates) <= self.MAX_CANDIDATES:
+                return candidates
+        pool: Set[int] = set()
+        for word in sorted(matches[0], key=matches[0].__getitem__, reverse=True):
+            remaining = self.MAX_CANDIDATES - len(pool)
+            postings = self._entries[word]
+            # With a single term every posting is already a candidate.
+            pool.update(islice(postings if len(matches) == 1 else candidates.intersection(postings), remaining))
+            if len(pool) >= self.MAX_CANDIDATES:
+                break
+        return pool
+
+
+def _fuzzy_trigrams(word: str) -> Set[str]:
+    # Typos in numbers ("user1234" vs "user1243") are not worth indexing, and
+    # numeric tokens would otherwise dominate the trigram postings.
+    if any(char.isdigit() for char in word):
+        return set()
+    return trigrams(word)
+
+
+def _discard(postings: Dict[str, Set], key: str, value) -> None:
+    values = postings.get(key)
+    if values is None:
+        return
+    values.discard(value)
+    if not values:
+        del postings[key]
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import hmac
 import os
+import time
 from dataclasses import dataclass
 from hashlib import pbkdf2_hmac
-from typing import Tuple
+from typing import Any, Dict, Optional, Tuple
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .tracing import traced
 
 
 @dataclass
@@ -17,36 +24,215 @@ class MasterSecret:
 
 PBKDF2_ITERATIONS = 390000
 
+PBKDF2_SHA256 = "pbkdf2-sha256"
+SCRYPT = "scrypt"
 
-def generate_salt(length: int = 16) -> bytes:
-    return os.urandom(length)
 
+@dataclass(frozen=True)
+class KdfParams:
+    """Names a key derivation function and its cost parameters.
+
+    ``iterations`` applies to PBKDF2; ``n``, ``r`` and ``p`` apply to scrypt.
+    """
 
-def _pbkdf2(password: str, salt: bytes) -> bytes:
-    return pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS, dklen=32)
+    name: str = PBKDF2_SHA256
+    iterations: int = 0
+    n: int = 0
+    r: int = 8
+    p: int = 1
 
+    @classmethod
+    def from_config(cls, data: Optional[Dict[str, Any]]) -> "KdfParams":
+        # Configurations written before KDFs were pluggable used fixed PBKDF2.
+        if not data:
+            return LEGACY_KDF
+        return cls(**data)
 
-def hash_password(password: str, salt: bytes) -> bytes:
-    return _pbkdf2(password, salt)
+    def to_config(self) -> Dict[str, Any]:
+        if self.name == SCRYPT:
+            return {"name": self.name, "n": self.n, "r": self.r, "p": self.p}
+        return {"name": self.name, "iterations": self.iterations}
 
 
-def verify_password(password: str, salt: bytes, expected_hash: bytes) -> bool:
-    return _pbkdf2(password, salt) == expected_hash
+LEGACY_KDF = KdfParams(PBKDF2_SHA256, iterations=PBKDF2_ITERATIONS)
 
+# New and upgraded vaults use scrypt tuned to KDF_TARGET_SECONDS on the machine
+# that creates them, but never weaker than these floors.
+PREFERRED_KDF = SCRYPT
+KDF_TARGET_SECONDS = 0.3
+SCRYPT_MIN_N = 2**14
+SCRYPT_MAX_N = 2**20
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_MIN_ITERATIONS = 200000
+PBKDF2_MAX_ITERATIONS = 20000000
 
-def derive_encryption_key(password: str, salt: bytes) -> bytes:
-    raw_key = _pbkdf2(password, salt)
-    return base64.urlsafe_b64encode(raw_key)
+# Version 1 stored the raw PBKDF2 output as "password_hash" and used that same
+# output as the Fernet key. Version 2 runs the KDF once and splits the result
+# with HKDF into a verifier and a key-encryption key that wraps a random data
+# key, so nothing stored on disk can decrypt the vault by itself.
+KEY_SCHEDULE_VERSION = 2
 
+# Config key of a rotation to a fresh data key that has to run before the
+# vault is considered upgraded.
+PENDING_REKEY = "pending_rekey"
 
-def build_fernet(password: str, salt: bytes) -> Fernet:
-    key = derive_encryption_key(password, salt)
-    return Fernet(key)
+_VERIFIER_INFO = b"kakhas-vault/v2/verifier"
+_WRAPPING_INFO = b"kakhas-vault/v2/key-wrapping"
+
+
+def generate_salt(length: int = 16) -> bytes:
+    return os.urandom(length)
 
 
+@traced("crypto.kdf")
+def derive_master_key(password: str, salt: bytes, params: KdfParams) -> bytes:
+    secret = password.encode("utf-8")
+    if params.name == PBKDF2_SHA256:
+        return pbkdf2_hmac("sha256", secret, salt, params.iterations, dklen=32)
+    if params.name == SCRYPT:
+        maxmem = 128 * params.r * (params.n + params.p + 2) + 1024 * 1024
+        return hashlib.scrypt(
+            secret, salt=salt, n=params.n, r=params.r, p=params.p, maxmem=maxmem, dklen=32
+        )
+    raise ValueError(f"Unsupported key derivation function {params.name!r}.")
+
+
+@traced("crypto.calibrate_kdf")
+def calibrate_kdf(name: str = PREFERRED_KDF, target_seconds: float = KDF_TARGET_SECONDS) -> KdfParams:
+    """Benchmarks this machine and returns parameters that take about ``target_seconds``."""
+    salt = generate_salt()
+    if name == PBKDF2_SHA256:
+        probe = KdfParams(PBKDF2_SHA256, iterations=50000)
+        elapsed = _time_derivation(salt, probe)
+        iterations = int(probe.iterations * target_seconds / max(elapsed, 1e-6))
+        return KdfParams(PBKDF2_SHA256, iterations=min(max(iterations, PBKDF2_MIN_ITERATIONS), PBKDF2_MAX_ITERATIONS))
+    if name == SCRYPT:
+        # scrypt cost scales linearly with n, so double it until the next step
+        # would overshoot the target.
+        params = KdfParams(SCRYPT, n=SCRYPT_MIN_N, r=SCRYPT_R, p=SCRYPT_P)
+        elapsed = _time_derivation(salt, params)
+        while params.n < SCRYPT_MAX_N and elapsed * 2 <= target_seconds:
+            params = KdfParams(SCRYPT, n=params.n * 2, r=SCRYPT_R, p=SCRYPT_P)
+            elapsed = _time_derivation(salt, params)
+        return params
+    raise ValueError(f"Unsupported key derivation function {name!r}.")
+
+
+def kdf_in_bounds(params: KdfParams) -> bool:
+    """Whether ``params`` lies within what :func:`calibrate_kdf` can produce.
+
+    Parameters read from an untrusted file are checked with this before any
+    key is derived, so they can neither be too weak to matter nor ask for
+    hours of work or gigabytes of memory.
+    """
+    if params.name == SCRYPT:
+        power_of_two = params.n & (params.n - 1) == 0
+        return power_of_two and SCRYPT_MIN_N <= params.n <= SCRYPT_MAX_N and (params.r, params.p) == (SCRYPT_R, SCRYPT_P)
+    if params.name == PBKDF2_SHA256:
+        return PBKDF2_MIN_ITERATIONS <= params.iterations <= PBKDF2_MAX_ITERATIONS
+    return False
+
+
+def needs_upgrade(params: KdfParams) -> bool:
+    return params.name != PREFERRED_KDF or not kdf_in_bounds(params)
+
+
+def _time_derivation(salt: bytes, params: KdfParams) -> float:
+    started = time.perf_counter()
+    derive_master_key("calibration", salt, params)
+    return time.perf_counter() - started
+
+
+def _hkdf(master: bytes, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master)
+
+
+def split_master_key(master: bytes) -> Tuple[bytes, Fernet]:
+    """Splits one KDF output into a password verifier and a key-wrapping cipher."""
+    verifier = _hkdf(master, _VERIFIER_INFO)
+    wrapping_key = base64.urlsafe_b64encode(_hkdf(master, _WRAPPING_INFO))
+    return verifier, Fernet(wrapping_key)
+
+
+def _seal(master: bytes, salt: bytes, params: KdfParams, data_key: bytes) -> Dict[str, Any]:
+    verifier, wrapping = split_master_key(master)
+    return {
+        "version": KEY_SCHEDULE_VERSION,
+        "kdf": params.to_config(),
+        "salt": base64.b64encode(salt).decode("utf-8"),
+        "verifier": base64.b64encode(verifier).decode("utf-8"),
+        "wrapped_key": wrapping.encrypt(data_key).decode("utf-8"),
+    }
+
+
+@traced("crypto.seal_data_key")
+def seal_data_key(password: str, data_key: bytes, params: Optional[KdfParams] = None) -> Dict[str, Any]:
+    """Returns a configuration payload that unlocks ``data_key`` with ``password``."""
+    params = params or calibrate_kdf()
+    salt = generate_salt()
+    return _seal(derive_master_key(password, salt, params), salt, params, data_key)
+
+
+def create_master_config(password: str, params: Optional[KdfParams] = None) -> Dict[str, Any]:
+    """Returns the configuration payload for a new vault protected by ``password``.
+
+    Without explicit ``params`` the KDF is calibrated on this machine first.
+    """
+    return seal_data_key(password, Fernet.generate_key(), params)
+
+
+@traced("crypto.unlock")
+def unlock(password: str, config: Dict[str, Any]) -> Optional[Tuple[Fernet, Optional[Dict[str, Any]]]]:
+    """Checks ``password`` against ``config`` with a single KDF run.
+
+    Returns ``None`` for a wrong password. Otherwise returns the vault cipher
+    and, when the configuration used an older key schedule or weaker KDF
+    parameters, the upgraded payload that should replace it on disk.
+    """
+    salt = base64.b64decode(config["salt"])
+    params = KdfParams.from_config(config.get("kdf"))
+    master = derive_master_key(password, salt, params)
+    legacy = config.get("version", 1) < KEY_SCHEDULE_VERSION
+    if legacy:
+        # The legacy hash doubles as the data key, so existing entries stay
+        # readable once it is wrapped under the new schedule.
+        if not hmac.compare_digest(master, base64.b64decode(config["password_hash"])):
+            return None
+        data_key = base64.urlsafe_b64encode(master)
+    else:
+        verifier, wrapping = split_master_key(master)
+        if not hmac.compare_digest(verifier, base64.b64decode(config["verifier"])):
+            return None
+        try:
+            data_key = wrapping.decrypt(config["wrapped_key"].encode("utf-8"))
+        except InvalidToken:
+            return None
+    upgrade = needs_upgrade(params)
+    if not (legacy or upgrade):
+        return Fernet(data_key), None
+    if upgrade:
+        params = calibrate_kdf()
+        salt = generate_salt()
+        master = derive_master_key(password, salt, params)
+    upgraded = _seal(master, salt, params, data_key)
+    if legacy:
+        # The legacy hash is still in old copies of config.json and in
+        # backups, so the vault moves to a fresh data key as soon as it is
+        # open (see vault.rekey). The bridge is that key under the old one.
+        fresh_key = Fernet.generate_key()
+        upgraded[PENDING_REKEY] = {
+            "config": _seal(master, salt, params, fresh_key),
+            "bridge": Fernet(data_key).encrypt(fresh_key).decode("utf-8"),
+        }
+    return Fernet(data_key), upgraded
+
+
+@traced("crypto.encrypt")
 def encrypt(fernet: Fernet, plaintext: str) -> bytes:
     return fernet.encrypt(plaintext.encode("utf-8"))
 
 
+@traced("crypto.decrypt")
 def decrypt(fernet: Fernet, ciphertext: bytes) -> str:
     return fernet.decrypt(ciphertext).decode("utf-8")
@@ -0,0 +1,462 @@
+"""Deduplicated, encrypted snapshots of the vault's entries.
+
+A snapshot writes every entry and tombstone of ``vault.db`` as one JSON line,
+in UUID order, cuts the lines into content-defined chunks and stores each
+distinct chunk once. A chunk ends after a line whose UUID hashes below a
+threshold proportional to the line's length, within minimum and maximum
+sizes. Editing, adding or deleting an entry therefore changes the chunk
+holding it and at most the one after it, so a snapshot costs in proportion
+to what changed rather than to the size of the file. Indexes and the search
+index are rebuilt on restore instead of being stored.
+
+Layout under ``SNAPSHOT_DIR``::
+
+    chunks/ab/ab12...      zlib-compressed, AES-256-GCM sealed chunks
+    manifests/<id>.json    ordered chunk ids, config.json and wrapped store key
+
+Entries are encrypted with a data key that only ``config.json`` holds, and a
+master password change replaces both. Each manifest therefore keeps the
+``config.json`` of its moment, like the plain backups, together with the
+store key wrapped by the data key that config unlocks, and a MAC over all
+of it. A snapshot is restored with the master password it was taken under.
+Chunk ids are HMAC-SHA256 of the plaintext under the store key, so identical
+content is only recognisable to someone who holds the key. Snapshots taken
+under the same data key share one store key and therefore their chunks.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .config import CONFIG_PATH, DB_PATH, SNAPSHOT_DIR
+from .database import SyncRecord, VaultDatabase
+from .security import unlock
+
+ProgressCallback = Callable[[int, int], None]
+
+MANIFEST_VERSION = 1
+MIN_CHUNK = 4 * 1024
+AVERAGE_CHUNK = 16 * 1024
+MAX_CHUNK = 64 * 1024
+SNAPSHOT_KEEP = 30
+
+_BATCH_SIZE = 2000
+
+
+@dataclass
+class SnapshotInfo:
+    id: str
+    created_at: str
+    size: int
+    chunks: int
+    records: int = 0
+    new_chunks: int = 0
+    new_bytes: int = 0
+
+
+@dataclass
+class GarbageReport:
+    chunks: int = 0
+    bytes: int = 0
+
+
+def encode_record(record: SyncRecord) -> bytes:
+    fields: List[Any] = [record.uuid, record.revision, record.modified_at, record.deleted]
+    if not record.deleted:
+        password = base64.b64encode(record.password_encrypted).decode("ascii")
+        fields += [record.title, record.username, password, record.url, record.notes, record.created_at]
+    return json.dumps(fields, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode_record(line: bytes) -> SyncRecord:
+    fields = json.loads(line)
+    if fields[3]:
+        return SyncRecord(*fields[:4])
+    return SyncRecord(*fields[:6], base64.b64decode(fields[6]), *fields[7:])
+
+
+def iter_chunks(
+    lines: Iterable[Tuple[str, bytes]],
+    min_size: int = MIN_CHUNK,
+    average_size: int = AVERAGE_CHUNK,
+    max_size: int = MAX_CHUNK,
+) -> Iterator[bytes]:
+    """Groups ``(uuid, line)`` pairs into content-defined chunks of whole lines.
+
+    Each line past ``min_size`` ends its chunk with a probability
+    proportional to its length, so chunks average ``average_size`` bytes
+    however long the lines are.
+    """
+    span = max(average_size - min_size, 1)
+    pending: List[bytes] = []
+    size = 0
+    for uuid, line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= max_size or (size >= min_size and zlib.crc32(uuid.encode("ascii")) % span < len(line)):
+            yield b"".join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b"".join(pending)
+
+
+class _StoreKey:
+    def __init__(self, key_id: str, material: bytes) -> None:
+        self.id = key_id
+        self._mac_key = material[:32]
+        self._aead = AESGCM(material[32:])
+
+    def chunk_id(self, data: bytes) -> str:
+        return hmac.new(self._mac_key, data, hashlib.sha256).hexdigest()
+
+    def mac(self, data: bytes) -> str:
+        return hmac.new(self._mac_key, b"manifest\x00" + data, hashlib.sha256).hexdigest()
+
+    def seal(self, chunk_id: str, data: bytes) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + self._aead.encrypt(nonce, zlib.compress(data, 1), chunk_id.encode("ascii"))
+
+    def open(self, chunk_id: str, sealed: bytes) -> bytes:
+        try:
+            data = zlib.decompress(self._aead.decrypt(sealed[:12], sealed[12:], chunk_id.encode("ascii")))
+        except (InvalidTag, zlib.error):
+            raise ValueError(f"Snapshot chunk {chunk_id[:12]} is corrupted.") from None
+        if not hmac.compare_digest(self.chunk_id(data), chunk_id):
+            raise ValueError(f"Snapshot chunk {chunk_id[:12]} is corrupted.")
+        return data
+
+
+def _canonical(manifest: Dict) -> bytes:
+    body = {key: value for key, value in manifest.items() if key != "mac"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _read_config(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise ValueError(f"{path.name} was not found; the vault cannot be snapshotted without it.") from None
+
+
+class SnapshotStore:
+    """Writes, restores and garbage-collects snapshots in ``directory``.
+
+    One instance serialises its own operations; garbage collection must not
+    run from another process while a snapshot is being written.
+    """
+
+    def __init__(self, directory: Path = SNAPSHOT_DIR) -> None:
+        self.directory = directory
+        self._chunks = directory / "chunks"
+        self._manifests = directory / "manifests"
+        self._lock = threading.Lock()
+
+    # -- keys -------------------------------------------------------------
+
+    def _key_for(self, fernet: Fernet) -> Tuple[_StoreKey, str]:
+        """The newest store key ``fernet`` can unwrap, or a new one, and its wrapped form."""
+        for manifest in reversed(list(self._iter_manifests())):
+            try:
+                material = fernet.decrypt(manifest["key"]["wrapped"].encode("ascii"))
+            except InvalidToken:
+                continue
+            return _StoreKey(manifest["key"]["id"], material), manifest["key"]["wrapped"]
+        material = os.urandom(64)
+        return _StoreKey(secrets.token_hex(8), material), fernet.encrypt(material).decode("ascii")
+
+    def _unwrap(self, manifest: Dict, fernet: Fernet) -> _StoreKey:
+        try:
+            key = _StoreKey(manifest["key"]["id"], fernet.decrypt(manifest["key"]["wrapped"].encode("ascii")))
+        except InvalidToken:
+            raise ValueError("This snapshot was taken under another master password; enter that password.") from None
+        if not hmac.compare_digest(key.mac(_canonical(manifest)), manifest.get("mac", "")):
+            raise ValueError(f"The manifest of snapshot {manifest['id']} is corrupted.")
+        return key
+
+    # -- snapshots --------------------------------------------------------
+
+    def snapshot(
+        self,
+        source: Path,
+        config: Path,
+        fernet: Fernet,
+        cancel: Optional[threading.Event] = None,
+        progress: Optional[ProgressCallback] = None,
+    ) -> SnapshotInfo:
+        """Stores the entries of the live vault at ``source`` from one read transaction.
+
+        ``fernet`` is the data key ``config`` unlocks. The config is read
+        before and after; if a master password change replaced it meanwhile
+        the snapshot fails rather than pairing entries with the wrong key.
+        """
+        config_data = _read_config(config)
+        database = VaultDatabase(source)
+        try:
+            with database.reader() as reader:
+                reader.conn.execute("BEGIN")
+                if reader.rekey_state() is not None:
+                    raise ValueError("Finish the master password change before taking a snapshot.")
+                with self._lock:
+                    key, wrapped = self._key_for(fernet)
+                    info, chunk_ids = self._store_records(reader, key, fernet, cancel, progress)
+                    if _read_config(config) != config_data:
+                        raise ValueError("The master password changed during the snapshot; take it again.")
+                    manifest = {
+                        "version": MANIFEST_VERSION,
+                        "id": info.id,
+                        "created_at": info.created_at,
+                        "size": info.size,
+                        "records": info.records,
+                        "config": config_data,
+                        "key": {"id": key.id, "wrapped": wrapped},
+                        "chunks": chunk_ids,
+                    }
+                    manifest["mac"] = key.mac(_canonical(manifest))
+                    self._manifests.mkdir(parents=True, exist_ok=True)
+                    _write_atomic(self._manifests / f"{info.id}.json", json.dumps(manifest).encode("utf-8"))
+        finally:
+            database.close()
+        return info
+
+    def _store_records(
+        self,
+        reader: VaultDatabase,
+        key: _StoreKey,
+        fernet: Fernet,
+        cancel: Optional[threading.Event],
+        progress: Optional[ProgressCallback],
+    ) -> Tuple[SnapshotInfo, List[str]]:
+        created_at = datetime.now()
+        info = SnapshotInfo(f"{created_at:%Y%m%d-%H%M%S-%f}-{secrets.token_hex(2)}", created_at.isoformat(), 0, 0)
+        uuids = [state[0] for state in reader.sync_state()]
+
+        def lines() -> Iterator[Tuple[str, bytes]]:
+            for start in range(0, len(uuids), _BATCH_SIZE):
+                if cancel is not None and cancel.is_set():
+                    raise InterruptedError("The snapshot was cancelled.")
+                records = sorted(reader.get_sync_records(uuids[start : start + _BATCH_SIZE]), key=_uuid)
+                if start == 0:
+                    _check_key(records, fernet)
+                for record in records:
+                    yield record.uuid, encode_record(record)
+                info.records += len(records)
+                if progress is not None:
+                    progress(info.records, len(uuids))
+
+        chunk_ids: List[str] = []
+        for data in iter_chunks(lines()):
+            chunk_id = key.chunk_id(data)
+            chunk_path = self._chunk_path(chunk_id)
+            if not chunk_path.exists():
+                chunk_path.parent.mkdir(parents=True, exist_ok=True)
+                sealed = key.seal(chunk_id, data)
+                _write_atomic(chunk_path, sealed)
+                info.new_chunks += 1
+                info.new_bytes += len(sealed)
+            chunk_ids.append(chunk_id)
+            info.size += len(data)
+        info.chunks = len(chunk_ids)
+        return info, chunk_ids
+
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        """Returns every snapshot, oldest first."""
+        return [
+            SnapshotInfo(
+                manifest["id"], manifest["created_at"], manifest["size"], len(manifest["chunks"]), manifest["records"]
+            )
+            for manifest in self._iter_manifests()
+        ]
+
+    def snapshot_config(self, snapshot_id: str) -> Dict[str, Any]:
+        """The ``config.json`` a snapshot was taken with; its master password restores it."""
+        return self._read_manifest(snapshot_id)["config"]
+
+    def restore(
+        self,
+        snapshot_id: str,
+        directory: Path,
+        fernet: Optional[Fernet] = None,
+        password: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Path:
+        """Rebuilds the vault of ``snapshot_id`` as ``vault.db`` and ``config.json`` in ``directory``.
+
+        ``password`` is the master password the snapshot was taken under;
+        without it ``fernet`` must be that moment's data key. The result
+        opens with that password, and can be merged into the live vault.
+        Every chunk is authenticated before its entries are written, and the
+        database only appears under its name once all of them were.
+        """
+        manifest = self._read_manifest(snapshot_id)
+        if password is not None:
+            unlocked = unlock(password, manifest["config"])
+            if unlocked is None:
+                raise ValueError("The master password of this snapshot is incorrect.")
+            fernet = unlocked[0]
+        if fernet is None:
+            raise ValueError("A master password is needed to restore a snapshot.")
+        key = self._unwrap(manifest, fernet)
+        target, config = directory / DB_PATH.name, directory / CONFIG_PATH.name
+        if target.exists() or config.exists():
+            raise ValueError(f"{directory} already holds a vault; choose an empty folder.")
+        directory.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + ".partial")
+        try:
+            database = VaultDatabase(partial)
+            try:
+                restored = self._restore_records(manifest, key, database, cancel, progress)
+            finally:
+                database.close()
+            _write_atomic(config, json.dumps(manifest["config"], indent=2).encode("utf-8"))
+            os.replace(partial, target)
+        finally:
+            for leftover in directory.glob(f"{partial.name}*"):
+                leftover.unlink()
+        if progress is not None:
+            progress(restored, restored)
+        return target
+
+    def _restore_records(
+        self,
+        manifest: Dict,
+        key: _StoreKey,
+        database: VaultDatabase,
+        cancel: Optional[threading.Event],
+        progress: Optional[ProgressCallback],
+    ) -> int:
+        restored = 0
+        batch: List[SyncRecord] = []
+        for chunk_id in manifest["chunks"]:
+            if cancel is not None and cancel.is_set():
+                raise InterruptedError("The restore was cancelled.")
+            try:
+                sealed = self._chunk_path(chunk_id).read_bytes()
+            except FileNotFoundError:
+                raise ValueError(f"Snapshot chunk {chunk_id[:12]} is missing.") from None
+            batch.extend(decode_record(line) for line in key.open(chunk_id, sealed).splitlines())
+            if len(batch) >= _BATCH_SIZE:
+                restored += database.apply_sync_records(batch)
+                batch = []
+                if progress is not None:
+                    progress(restored, manifest["records"])
+        restored += database.apply_sync_records(batch)
+        if restored != manifest["records"]:
+            raise ValueError(f"Snapshot {manifest['id']} is incomplete.")
+        return restored
+
+    def delete(self, snapshot_id: str) -> None:
+        """Removes a manifest; its chunks go at the next :meth:`collect_garbage`."""
+        with self._lock:
+            self._manifest_path(snapshot_id).unlink()
+
+    def prune(self, keep: int) -> List[str]:
+        """Deletes all but the newest ``keep`` snapshots and returns their ids."""
+        removed = [info.id for info in self.list_snapshots()[: -max(keep, 1)]]
+        for snapshot_id in removed:
+            self.delete(snapshot_id)
+        return removed
+
+    def collect_garbage(self) -> GarbageReport:
+        """Deletes chunks that no manifest references any more."""
+        report = GarbageReport()
+        with self._lock:
+            live = set()
+            for manifest in self._iter_manifests():
+                live.update(manifest["chunks"])
+            if not self._chunks.exists():
+                return report
+            for path in self._chunks.glob("*/*"):
+                if path.name not in live:
+                    report.chunks += 1
+                    report.bytes += path.stat().st_size
+                    path.unlink()
+        return report
+
+    # -- files ------------------------------------------------------------
+
+    def _chunk_path(self, chunk_id: str) -> Path:
+        return self._chunks / chunk_id[:2] / chunk_id
+
+    def _manifest_path(self, snapshot_id: str) -> Path:
+        if not snapshot_id or "/" in snapshot_id or "\\" in snapshot_id or snapshot_id.startswith("."):
+            raise ValueError(f"Invalid snapshot id {snapshot_id!r}.")
+        return self._manifests / f"{snapshot_id}.json"
+
+    def _read_manifest(self, snapshot_id: str) -> Dict:
+        try:
+            manifest = json.loads(self._manifest_path(snapshot_id).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise ValueError(f"Snapshot {snapshot_id} does not exist.") from None
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Snapshot {snapshot_id} was written by an unsupported version of the vault.")
+        return manifest
+
+    def _iter_manifests(self) -> Iterator[Dict]:
+        if not self._manifests.exists():
+            return
+        for path in sorted(self._manifests.glob("*.json")):
+            yield self._read_manifest(path.stem)
+
+
+def _uuid(record: SyncRecord) -> str:
+    return record.uuid
+
+
+def _check_key(records: List[SyncRecord], fernet: Fernet) -> None:
+    entry = next((record for record in records if not record.deleted), None)
+    if entry is None:
+        return
+    try:
+        fernet.decrypt(entry.password_encrypted)
+    except InvalidToken:
+        raise ValueError("The key given for the snapshot does not open the vault's entries.") from None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    partial = path.with_name(path.name + ".partial")
+    partial.write_bytes(data)
+    os.replace(partial, path)
+
+
+def take_snapshot(
+    database_path: Path,
+    config_path: Path,
+    fernet: Fernet,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[ProgressCallback] = None,
+    directory: Path = SNAPSHOT_DIR,
+    keep: int = SNAPSHOT_KEEP,
+) -> SnapshotInfo:
+    """Stores a snapshot, keeps the newest ``keep`` and drops unreferenced chunks; for a worker thread."""
+    store = SnapshotStore(directory)
+    info = store.snapshot(database_path, config_path, fernet, cancel, progress)
+    store.prune(keep)
+    store.collect_garbage()
+    return info
+
+
+__all__ = [
+    "GarbageReport",
+    "SNAPSHOT_KEEP",
+    "SnapshotInfo",
+    "SnapshotStore",
+    "decode_record",
+    "encode_record",
+    "iter_chunks",
+    "take_snapshot",
+]
@@ -0,0 +1,250 @@
+"""Lightweight timing spans for the vault's hot paths.
+
+Tracing is off until :func:`enable` is called; the app does that at startup
+when the ``KAKHAS_VAULT_TRACE`` environment variable is set to ``1``. While it is off, :func:`span` returns a
+shared no-op object and :func:`traced` wrappers cost one flag check per call.
+While it is on, every finished span goes into a per-name histogram with
+power-of-two buckets. Spans of at least ``LOG_THRESHOLD_MS`` are also written
+to a rotating log, ``LOG_DIR/trace.log``.
+
+Synchronous code uses ``with span("db.search"):`` or ``@traced("db.search")``.
+Work that completes in a callback keeps the object that :func:`span` returned
+and calls :meth:`Span.finish` when done.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from .config import LOG_DIR
+
+ENV_VAR = "KAKHAS_VAULT_TRACE"
+LOG_THRESHOLD_MS = 1.0
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+RECENT_SPANS = 256
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_enabled = False
+_lock = threading.Lock()
+_histograms: Dict[str, "Histogram"] = {}
+_recent: Deque[Tuple[float, str, float]] = deque(maxlen=RECENT_SPANS)
+_logger = logging.getLogger("vault.trace")
+_logger.propagate = False
+_handler: Optional[logging.Handler] = None
+
+
+class Histogram:
+    """Counts durations in buckets ``[2**(i-1), 2**i)`` nanoseconds."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns: int) -> None:
+        self.buckets[min(elapsed_ns.bit_length(), 63)] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.max_ns = max(self.max_ns, elapsed_ns)
+
+    def percentile(self, fraction: float) -> int:
+        """An upper bound, within a factor of two, of the ``fraction`` quantile."""
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min(1 << index, self.max_ns)
+        return self.max_ns
+
+
+@dataclass
+class SpanStats:
+    name: str
+    count: int
+    total_ms: float
+    p50_ms: float
+    p95_ms: float
+    max_ms: float
+
+
+class Span:
+    __slots__ = ("name", "_started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._started = time.perf_counter_ns()
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.finish()
+
+    def finish(self) -> None:
+        _record(self.name, time.perf_counter_ns() - self._started)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str):
+    """Starts timing ``name``; use it as a context manager or call ``finish()``."""
+    if not _enabled:
+        return _NOOP
+    return Span(name)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorates a function so each call is recorded as a span called ``name``."""
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter_ns() - started)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def _record(name: str, elapsed_ns: int) -> None:
+    elapsed_ms = elapsed_ns / 1e6
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(elapsed_ns)
+        if elapsed_ms >= LOG_THRESHOLD_MS:
+            _recent.append((time.monotonic(), name, elapsed_ms))
+    if elapsed_ms >= LOG_THRESHOLD_MS and _handler is not None:
+        _logger.debug("%-28s %10.3f ms  [%s]", name, elapsed_ms, threading.current_thread().name)
+
+
+def stats() -> List[SpanStats]:
+    """Returns a summary per span name, slowest total first."""
+    with _lock:
+        summaries = [
+            SpanStats(
+                name,
+                histogram.count,
+                histogram.total_ns / 1e6,
+                histogram.percentile(0.5) / 1e6,
+                histogram.percentile(0.95) / 1e6,
+                histogram.max_ns / 1e6,
+            )
+            for name, histogram in _histograms.items()
+        ]
+    return sorted(summaries, key=lambda summary: summary.total_ms, reverse=True)
+
+
+def recent_spans(seconds: float) -> List[Tuple[str, float]]:
+    """Returns ``(name, ms)`` for logged spans that finished in the last ``seconds``."""
+    cutoff = time.monotonic() - seconds
+    with _lock:
+        return [(name, elapsed_ms) for finished, name, elapsed_ms in _recent if finished >= cutoff]
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _recent.clear()
+
+
+def write_summary() -> None:
+    if _handler is None:
+        return
+    for summary in stats():
+        _logger.info(
+            "summary %-28s n=%-8d total=%.1f ms p50=%.3f ms p95=%.3f ms max=%.3f ms",
+            summary.name,
+            summary.count,
+            summary.total_ms,
+            summary.p50_ms,
+            summary.p95_ms,
+            summary.max_ms,
+        )
+
+
+def enable(log_dir: Optional[Path] = LOG_DIR) -> None:
+    """Turns tracing on, logging to ``log_dir`` unless it is ``None``."""
+    global _enabled, _handler
+    if log_dir is not None and _handler is None:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        _handler = RotatingFileHandler(
+            log_dir / "trace.log", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+        _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger.addHandler(_handler)
+        _logger.setLevel(logging.DEBUG)
+    _enabled = True
+
+
+def disable() -> None:
+    """Turns tracing off, closing the log after a final summary."""
+    global _enabled, _handler
+    _enabled = False
+    if _handler is not None:
+        write_summary()
+        _logger.removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+
+def enable_from_environment() -> bool:
+    """Calls :func:`enable` if ``ENV_VAR`` asks for tracing; returns whether it is on."""
+    if os.environ.get(ENV_VAR, "").strip().lower() in ("1", "true", "yes", "on"):
+        enable()
+    return _enabled
+
+
+__all__ = [
+    "ENV_VAR",
+    "Histogram",
+    "Span",
+    "SpanStats",
+    "disable",
+    "enable",
+    "enable_from_environment",
+    "is_enabled",
+    "recent_spans",
+    "reset",
+    "span",
+    "stats",
+    "traced",
+    "write_summary",
+]
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QPaintEvent
+from PyQt6.QtWidgets import (
+    QDockWidget,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QPushButton,
+    QTableView,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from .. import tracing
+
+_HEADERS = ("Span", "Count", "Total ms", "p50 ms", "p95 ms", "Max ms")
+
+
+class TracedTableView(QTableView):
+    """A table view that records each repaint as a ``ui.table.paint`` span."""
+
+    def paintEvent(self, event: QPaintEvent) -> None:
+        with tracing.span("ui.table.paint"):
+            super().paintEvent(event)
+
+
+class TraceDock(QDockWidget):
+    """Developer view of the span histograms, refreshed once a second."""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, parent=None) -> None:
+        super().__init__("Timings", parent)
+        self.setObjectName("TraceDock")
+        body = QWidget()
+        layout = QVBoxLayout(body)
+        self.table = QTableWidget(0, len(_HEADERS))
+        self.table.setHorizontalHeaderLabels(_HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+
+        buttons = QHBoxLayout()
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self._reset)
+        buttons.addStretch()
+        buttons.addWidget(reset_btn)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.setWidget(body)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._toggle_timer)
+
+    def _toggle_timer(self, visible: bool) -> None:
+        if visible:
+            self.refresh()
+            self._timer.start()
+        else:
+            self._timer.stop()
+
+    def _reset(self) -> None:
+        tracing.reset()
+        self.refresh()
+
+    def refresh(self) -> None:
+        summaries = tracing.stats()
+        self.table.setRowCount(len(summaries))
+        for row, summary in enumerate(summaries):
+            values = (
+                summary.name,
+                str(summary.count),
+                f"{summary.total_ms:.1f}",
+                f"{summary.p50_ms:.3f}",
+                f"{summary.p95_ms:.3f}",
+                f"{summary.max_ms:.3f}",
+            )
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+
+class TraceStatusLabel(QLabel):
+    """Status-bar overlay naming the slowest span of the last few seconds."""
+
+    WINDOW_SECONDS = 5.0
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setObjectName("TraceStatusLabel")
+        self._timer = QTimer(self)
+        self._timer.setInterval(500)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start()
+        self.refresh()
+
+    def refresh(self) -> None:
+        recent = tracing.recent_spans(self.WINDOW_SECONDS)
+        if not recent:
+            self.setText("Tracing on")
+            return
+        name, elapsed_ms = max(recent, key=lambda item: item[1])
+        self.setText(f"Slowest: {name} {elapsed_ms:.1f} ms ({len(recent)} slow spans)")
+
+
+__all__ = ["TraceDock", "TraceStatusLabel", "TracedTableView"]
@@ -1,21 +1,23 @@
 from __future__ import annotations
 
-import base64
 from typing import Optional
 
 from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtGui import QFont
+from PyQt6.QtGui import QCloseEvent, QFont
 from PyQt6.QtWidgets import (
     QLabel,
     QLineEdit,
+    QProgressBar,
     QPushButton,
     QStackedWidget,
     QVBoxLayout,
     QWidget,
 )
 
+from .. import tracing
 from ..config import ConfigManager
-from ..security import build_fernet, generate_salt, hash_password, verify_password
+from ..security import create_master_config, unlock
+from .tasks import TaskThread
 
 
 class LoginWindow(QWidget):
@@ -51,6 +53,21 @@ class LoginWindow(QWidget):
     def _handle_setup_complete(self) -> None:
         self.stack.setCurrentWidget(self.login_widget)
 
+    def closeEvent(self, event: QCloseEvent) -> None:
+        # Key derivation threads must not outlive the widgets they report to.
+        self.setup_widget.wait_for_task()
+        self.login_widget.wait_for_task()
+        super().closeEvent(event)
+
+
+def _busy_indicator() -> QProgressBar:
+    indicator = QProgressBar()
+    indicator.setRange(0, 0)
+    indicator.setTextVisible(False)
+    indicator.setMaximumHeight(6)
+    indicator.hide()
+    return indicator
+
 
 class SetupWidget(QWidget):
     setup_complete = pyqtSignal()
@@ -82,6 +99,10 @@ class SetupWidget(QWidget):
 
         self.button = QPushButton("Establish Vault")
         self.button.clicked.connect(self._save_master_password)
+        self.confirm_password.returnPressed.connect(self._save_master_password)
+
+        self.busy_indicator = _busy_indicator()
+        self._task: Optional[TaskThread] = None
 
         layout = QVBoxLayout(self)
         layout.setSpacing(16)
@@ -91,10 +112,22 @@ class SetupWidget(QWidget):
         layout.addWidget(self.password)
         layout.addWidget(self.confirm_password)
         layout.addWidget(self.button)
+        layout.addWidget(self.busy_indicator)
         layout.addWidget(self.error_label)
         layout.addStretch()
 
+    def wait_for_task(self) -> None:
+        if self._task is not None:
+            self._task.wait()
+
+    def _set_busy(self, busy: bool) -> None:
+        for widget in (self.password, self.confirm_password, self.button):
+            widget.setEnabled(not busy)
+        self.busy_indicator.setVisible(busy)
+
     def _save_master_password(self) -> None:
+        if self._task is not None:
+            return
         password = self.password.text().strip()
         confirm = self.confirm_password.text().strip()
 
@@ -105,18 +138,30 @@ class SetupWidget(QWidget):
             self.error_label.setText("Passwords do not match. Try again.")
             return
 
-        salt = generate_salt()
-        password_hash = hash_password(password, salt)
-        config_payload = {
-            "salt": base64.b64encode(salt).decode("utf-8"),
-            "password_hash": base64.b64encode(password_hash).decode("utf-8"),
-        }
+        self.error_label.setText("Securing your vault...")
+        self._set_busy(True)
+        self._task = TaskThread(create_master_config, password, parent=self)
+        self._task.succeeded.connect(self._store_master_config)
+        self._task.failed.connect(self._handle_task_error)
+        self._task.finished.connect(self._finish_task)
+        self._task.start()
+
+    def _store_master_config(self, config_payload: dict) -> None:
         self.config.write(config_payload)
         self.password.clear()
         self.confirm_password.clear()
         self.error_label.setText("")
         self.setup_complete.emit()
 
+    def _handle_task_error(self, exc: Exception) -> None:
+        self.error_label.setText(f"Could not create the vault: {exc}")
+
+    def _finish_task(self) -> None:
+        if self._task is not None:
+            self._task.deleteLater()
+            self._task = None
+        self._set_busy(False)
+
 
 class MasterLoginWidget(QWidget):
     authenticated = pyqtSignal(object)
@@ -144,6 +189,10 @@ class MasterLoginWidget(QWidget):
 
         self.button = QPushButton("Unlock")
         self.button.clicked.connect(self._authenticate)
+        self.password.returnPressed.connect(self._authenticate)
+
+        self.busy_indicator = _busy_indicator()
+        self._task: Optional[TaskThread] = None
 
         layout = QVBoxLayout(self)
         layout.setSpacing(16)
@@ -152,10 +201,22 @@ class MasterLoginWidget(QWidget):
         layout.addSpacing(16)
         layout.addWidget(self.password)
         layout.addWidget(self.button)
+        layout.addWidget(self.busy_indicator)
         layout.addWidget(self.error_label)
         layout.addStretch()
 
+    def wait_for_task(self) -> None:
+        if self._task is not None:
+            self._task.wait()
+
+    def _set_busy(self, busy: bool) -> None:
+        self.password.setEnabled(not busy)
+        self.button.setEnabled(not busy)
+        self.busy_indicator.setVisible(busy)
+
     def _authenticate(self) -> None:
+        if self._task is not None:
+            return
         try:
             data = self.config.read()
         except FileNotFoundError:
@@ -163,19 +224,40 @@ class MasterLoginWidget(QWidget):
             return
 
         password = self.password.text()
-        salt = base64.b64decode(data["salt"])
-        expected_hash = base64.b64decode(data["password_hash"])
 
-        if not verify_password(password, salt, expected_hash):
+        self.error_label.setText("Unlocking...")
+        self._set_busy(True)
+        self._unlock_span = tracing.span("ui.login.unlock")
+        self._task = TaskThread(unlock, password, data, parent=self)
+        self._task.succeeded.connect(self._handle_unlock_result)
+        self._task.failed.connect(self._handle_unlock_error)
+        self._task.finished.connect(self._finish_task)
+        self._task.start()
+
+    def _handle_unlock_result(self, result) -> None:
+        if result is None:
             self.error_label.setText("Incorrect master password.")
-            self.password.selectAll()
             return
-
-        fernet = build_fernet(password, salt)
+        fernet, upgraded_config = result
+        if upgraded_config is not None:
+            self.config.write(upgraded_config)
         self.password.clear()
         self.error_label.setText("")
         self.authenticated.emit(fernet)
 
+    def _handle_unlock_error(self, exc: Exception) -> None:
+        self.error_label.setText(f"Could not unlock the vault: {exc}")
+
+    def _finish_task(self) -> None:
+        self._unlock_span.finish()
+        if self._task is not None:
+            self._task.deleteLater()
+            self._task = None
+        self._set_busy(False)
+        if self.error_label.text():
+            self.password.setFocus()
+            self.password.selectAll()
+
 
 _LOGIN_STYLES = """
 #LoginWindow {
@@ -217,6 +299,17 @@ QPushButton:pressed {
     background-color: #18a0b3;
 }
 
+QProgressBar {
+    border: none;
+    border-radius: 3px;
+    background: rgba(255, 255, 255, 0.12);
+}
+
+QProgressBar::chunk {
+    background-color: #21c1d6;
+    border-radius: 3px;
+}
+
 #ErrorLabel {
     color: #ff9f9f;
     min-height: 22px;
@@ -1,31 +1,50 @@
 from __future__ import annotations
 
+import threading
 from datetime import datetime
-from typing import Optional
+from functools import partial
+from pathlib import Path
+from typing import Callable, List, Optional
 
-from PyQt6.QtCore import Qt, QTimer, QSize
-from PyQt6.QtGui import QAction, QClipboard
+from PyQt6.QtCore import QPoint, Qt, QTimer, QSize
+from PyQt6.QtGui import QAction, QClipboard, QCloseEvent, QKeySequence
 from PyQt6.QtWidgets import (
     QApplication,
     QDialog,
+    QDockWidget,
+    QFileDialog,
     QFormLayout,
     QHBoxLayout,
     QHeaderView,
+    QInputDialog,
     QLabel,
     QLineEdit,
     QMainWindow,
     QMessageBox,
+    QProgressDialog,
     QPushButton,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QTextEdit,
     QToolBar,
     QVBoxLayout,
     QWidget,
 )
 
-from ..database import VaultDatabase, VaultEntry
-from ..security import decrypt, encrypt
+from .. import tracing
+from ..cache import SecretCache
+from ..config import CONFIG_PATH, ConfigManager
+from ..database import RELOADED, EntryChange, EntrySummary, VaultDatabase, VaultEntry
+from ..export import EXPORT_SUFFIX, export_file, import_export_file
+from ..importers import ImportReport, import_file
+from ..merge import LOCAL, MergeReport, merge_files
+from ..search import TrigramIndex
+from ..rekey import change_master_password, resume_master_password_change
+from ..security import PENDING_REKEY, decrypt, encrypt
+from ..snapshots import SnapshotInfo, SnapshotStore, take_snapshot
+from ..worker import AsyncVaultDatabase
+from .debug import TraceDock, TraceStatusLabel, TracedTableView
+from .models import EntryFilterProxyModel, EntryTableModel
+from .tasks import TaskThread
 
 
 class EntryDialog(QDialog):
@@ -84,12 +103,127 @@ class EntryDialog(QDialog):
         }
 
 
+class ChangePasswordDialog(QDialog):
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Change Master Password")
+        self.setModal(True)
+        self.resize(420, 220)
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+
+        self.current_edit = QLineEdit()
+        self.new_edit = QLineEdit()
+        self.confirm_edit = QLineEdit()
+        for edit in (self.current_edit, self.new_edit, self.confirm_edit):
+            edit.setEchoMode(QLineEdit.EchoMode.Password)
+
+        form.addRow("Current password", self.current_edit)
+        form.addRow("New password", self.new_edit)
+        form.addRow("Confirm new password", self.confirm_edit)
+        layout.addLayout(form)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        cancel_btn = QPushButton("Cancel")
+        save_btn = QPushButton("Change")
+        cancel_btn.clicked.connect(self.reject)
+        save_btn.clicked.connect(self._validate)
+        buttons_layout.addWidget(cancel_btn)
+        buttons_layout.addWidget(save_btn)
+        layout.addLayout(buttons_layout)
+
+    def _validate(self) -> None:
+        new_password = self.new_edit.text().strip()
+        if not self.current_edit.text():
+            QMessageBox.warning(self, "Validation", "Enter your current master password.")
+            return
+        if len(new_password) < 8:
+            QMessageBox.warning(self, "Validation", "Master password must be at least 8 characters long.")
+            return
+        if new_password != self.confirm_edit.text().strip():
+            QMessageBox.warning(self, "Validation", "Passwords do not match. Try again.")
+            return
+        self.accept()
+
+    def get_data(self) -> dict:
+        return {"current": self.current_edit.text(), "new": self.new_edit.text().strip()}
+
+
+class ExportPasswordDialog(QDialog):
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Export Vault")
+        self.setModal(True)
+        self.resize(420, 180)
+        layout = QVBoxLayout(self)
+        hint = QLabel("The export is encrypted with its own password. You need it to restore the file.")
+        hint.setWordWrap(True)
+        form = QFormLayout()
+
+        self.password_edit = QLineEdit()
+        self.confirm_edit = QLineEdit()
+        for edit in (self.password_edit, self.confirm_edit):
+            edit.setEchoMode(QLineEdit.EchoMode.Password)
+
+        form.addRow("Export password", self.password_edit)
+        form.addRow("Confirm password", self.confirm_edit)
+        layout.addWidget(hint)
+        layout.addLayout(form)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        cancel_btn = QPushButton("Cancel")
+        export_btn = QPushButton("Export")
+        cancel_btn.clicked.connect(self.reject)
+        export_btn.clicked.connect(self._validate)
+        buttons_layout.addWidget(cancel_btn)
+        buttons_layout.addWidget(export_btn)
+        layout.addLayout(buttons_layout)
+
+    def _validate(self) -> None:
+        if len(self.password_edit.text()) < 8:
+            QMessageBox.warning(self, "Validation", "Export password must be at least 8 characters long.")
+            return
+        if self.password_edit.text() != self.confirm_edit.text():
+            QMessageBox.warning(self, "Validation", "Passwords do not match. Try again.")
+            return
+        self.accept()
+
+    def password(self) -> str:
+        return self.password_edit.text()
+
+
 class MainWindow(QMainWindow):
-    def __init__(self, database: VaultDatabase, fernet) -> None:
+    SEARCH_DEBOUNCE_MS = 120
+    INDEX_CHUNK = 2000
+
+    def __init__(self, database: AsyncVaultDatabase, fernet, config: Optional[ConfigManager] = None) -> None:
         super().__init__()
         self.database = database
+        self.database.failed.connect(self._handle_database_error)
         self.fernet = fernet
-        self._entries_cache: dict[int, VaultEntry] = {}
+        # The plain data key config.json unlocks. While a master password
+        # change is paused, self.fernet also accepts the new key.
+        self._data_fernet = fernet
+        self.config = config or ConfigManager()
+        self._rekey_task: Optional[TaskThread] = None
+        self._rekey_cancel = threading.Event()
+        self._rekey_progress: Optional[QProgressDialog] = None
+        self._transfer_task: Optional[TaskThread] = None
+        self._transfer_cancel = threading.Event()
+        self._transfer_progress: Optional[QProgressDialog] = None
+        # The index is only ever updated on the database thread, which also
+        # orders its updates after the writes they mirror. Searches run on
+        # the reader pool and take the lock to query it.
+        self._index_lock = threading.Lock()
+        self.quick_index = TrigramIndex()
+        self._index_ready = False
+        self._index_build = 0
+        self.database.call(self._build_index)
+        self.database.call(self._watch_index)
+        self.database.entry_changed.connect(self._apply_change)
+        self.secret_cache = SecretCache()
         self.setWindowTitle("Kakha's Password Vault")
         self.setObjectName("MainWindow")
         self.resize(960, 640)
@@ -99,8 +233,17 @@ class MainWindow(QMainWindow):
 
         self.status_bar = self.statusBar()
         self.status_bar.showMessage("Vault ready.")
+        self._trace_dock: Optional[TraceDock] = None
+        self._trace_label: Optional[TraceStatusLabel] = None
+        timings_action = QAction("Developer Timings", self)
+        timings_action.setShortcut(QKeySequence("Ctrl+Shift+T"))
+        timings_action.setCheckable(True)
+        timings_action.toggled.connect(self._set_timings)
+        self.addAction(timings_action)
+        timings_action.setChecked(tracing.is_enabled())
         self._refresh_table()
         self._apply_styles()
+        self.database.request("rekey_state", on_result=self._check_pending_rekey)
 
     def _setup_toolbar(self) -> None:
         toolbar = QToolBar("Actions")
@@ -117,8 +260,32 @@ class MainWindow(QMainWindow):
         copy_action.triggered.connect(self._copy_password)
         reveal_action = QAction("Reveal Password", self)
         reveal_action.triggered.connect(self._reveal_password)
-
-        for action in (add_action, edit_action, delete_action, copy_action, reveal_action):
+        import_action = QAction("Import", self)
+        import_action.triggered.connect(self._import_entries)
+        export_action = QAction("Export", self)
+        export_action.triggered.connect(self._export_entries)
+        merge_action = QAction("Merge Vault", self)
+        merge_action.triggered.connect(self._merge_vault)
+        snapshot_action = QAction("Snapshot", self)
+        snapshot_action.triggered.connect(self._take_snapshot)
+        restore_action = QAction("Restore Snapshot", self)
+        restore_action.triggered.connect(self._restore_snapshot)
+        rekey_action = QAction("Change Master Password", self)
+        rekey_action.triggered.connect(self._change_master_password)
+
+        for action in (
+            add_action,
+            edit_action,
+            delete_action,
+            copy_action,
+            reveal_action,
+            import_action,
+            export_action,
+            merge_action,
+            snapshot_action,
+            restore_action,
+            rekey_action,
+        ):
             toolbar.addAction(action)
 
     def _setup_table(self) -> None:
@@ -131,17 +298,39 @@ class MainWindow(QMainWindow):
         header.setObjectName("HeaderLabel")
         header.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
 
-        self.table = QTableWidget(0, 4)
-        self.table.setHorizontalHeaderLabels(["Title", "Username", "URL", "Updated"])
+        self.model = EntryTableModel(self.database, self, search=self._search_entries)
+        # The row on top when a write arrives, kept in view once rows settle.
+        self._top_id: Optional[int] = None
+        self.model.refreshed.connect(self._keep_top_row)
+        self.proxy = EntryFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+
+        self.table = TracedTableView()
+        self.table.setModel(self.proxy)
         self.table.verticalHeader().setVisible(False)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(46)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.table.setAlternatingRowColors(True)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.AscendingOrder)
         self.table.setSortingEnabled(True)
 
+        self.search_edit = QLineEdit()
+        self.search_edit.setObjectName("SearchEdit")
+        self.search_edit.setPlaceholderText("Search titles, usernames, URLs and notes")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self._schedule_search)
+
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self._apply_search)
+
         layout.addWidget(header)
+        layout.addWidget(self.search_edit)
         layout.addWidget(self.table)
 
         self.setCentralWidget(central)
@@ -150,72 +339,190 @@ class MainWindow(QMainWindow):
         self.setStyleSheet(_MAIN_STYLES)
 
     def _refresh_table(self) -> None:
-        self.table.setSortingEnabled(False)
-        entries = self.database.list_entries()
-        self._entries_cache = {entry.id: entry for entry in entries}
-        self.table.setRowCount(len(entries))
-        for row_index, entry in enumerate(entries):
-            title_item = QTableWidgetItem(entry.title)
-            title_item.setData(Qt.ItemDataRole.UserRole, entry.id)
-            self.table.setItem(row_index, 0, title_item)
-            self.table.setItem(row_index, 1, QTableWidgetItem(entry.username))
-            self.table.setItem(row_index, 2, QTableWidgetItem(entry.url or "-"))
-            timestamp = datetime.fromisoformat(entry.updated_at)
-            pretty = timestamp.strftime("%b %d, %Y %H:%M")
-            self.table.setItem(row_index, 3, QTableWidgetItem(pretty))
-            self.table.setRowHeight(row_index, 46)
-        self.table.setSortingEnabled(True)
-        self.table.sortItems(0)
-
-    def _get_selected_entry(self) -> Optional[VaultEntry]:
-        selected = self.table.currentRow()
-        if selected < 0:
-            return None
-        item = self.table.item(selected, 0)
-        if item is None:
-            return None
-        entry_id = item.data(Qt.ItemDataRole.UserRole)
-        if entry_id is None:
+        self.model.reload()
+
+    def _set_timings(self, enabled: bool) -> None:
+        if not enabled:
+            if self._trace_dock is not None:
+                self._trace_dock.hide()
+                self._trace_label.hide()
+            # Writes the summary and closes the trace log.
+            tracing.disable()
+            return
+        tracing.enable()
+        if self._trace_dock is None:
+            self._trace_dock = TraceDock(self)
+            # The shortcut is the only switch, so tracing never runs with the dock closed.
+            self._trace_dock.setFeatures(
+                QDockWidget.DockWidgetFeature.DockWidgetMovable | QDockWidget.DockWidgetFeature.DockWidgetFloatable
+            )
+            self._trace_label = TraceStatusLabel(self)
+            self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self._trace_dock)
+            self.status_bar.addPermanentWidget(self._trace_label)
+        self._trace_dock.show()
+        self._trace_label.show()
+
+    def _schedule_search(self) -> None:
+        self._search_timer.start()
+
+    def _apply_search(self) -> None:
+        self.model.set_search(self.search_edit.text())
+
+    def _handle_database_error(self, exc: Exception) -> None:
+        QMessageBox.warning(self, "Vault Database", str(exc))
+
+    def _build_index(self, database: VaultDatabase) -> None:
+        """Starts indexing the vault from scratch, ``INDEX_CHUNK`` entries per queued call.
+
+        Each chunk goes to the back of the database queue, so writes and
+        page loads wait for one chunk at most rather than the whole vault.
+        Searches use full-text search alone until the index is complete.
+        """
+        with self._index_lock:
+            self.quick_index = TrigramIndex()
+            self._index_ready = False
+        self._index_build += 1
+        self._index_chunk(database, self._index_build, 0)
+
+    def _index_chunk(self, database: VaultDatabase, build: int, after_id: int) -> None:
+        if build != self._index_build:
+            return
+        summaries = database.list_summaries_by_id(after_id, self.INDEX_CHUNK)
+        # Entries written since the build started are already indexed by
+        # _index_change; extend() replaces them rather than adding them twice.
+        with self._index_lock:
+            self.quick_index.extend(summaries)
+            if len(summaries) < self.INDEX_CHUNK:
+                self._index_ready = True
+                return
+        self.database.call(self._index_chunk, build, summaries[-1].id)
+
+    def _watch_index(self, database: VaultDatabase) -> None:
+        database.add_listener(partial(self._index_change, database))
+
+    def _index_change(self, database: VaultDatabase, change: EntryChange) -> None:
+        if change.kind == RELOADED:
+            self._build_index(database)
+            return
+        with self._index_lock:
+            if change.summary is None:
+                self.quick_index.remove(change.entry_id)
+            else:
+                summary = change.summary
+                self.quick_index.add(summary.id, summary.title, summary.username, summary.url)
+
+    def _apply_change(self, change: EntryChange) -> None:
+        """Applies one write to the table while keeping the same rows in view."""
+        top = self.table.indexAt(QPoint(0, 0))
+        self._top_id = self.model.id_at(self.proxy.mapToSource(top).row()) if top.isValid() else None
+        self.model.apply_change(change)
+
+    def _keep_top_row(self) -> None:
+        top_id, self._top_id = self._top_id, None
+        row = self.model.row_of(top_id) if top_id is not None else None
+        if row is not None:
+            source = self.model.index(row, 0)
+            self.table.scrollTo(self.proxy.mapFromSource(source), QTableView.ScrollHint.PositionAtTop)
+
+    def _search_entries(self, database: VaultDatabase, query: str, limit: int) -> List[EntrySummary]:
+        """Typo-tolerant matches first, then full-text hits such as notes."""
+        with self._index_lock:
+            ids = self.quick_index.search(query, limit) if self._index_ready else None
+        if ids is None:
+            return database.search(query, limit)
+        results = database.get_summaries(ids)
+        if len(results) < limit:
+            seen = {summary.id for summary in results}
+            for summary in database.search(query, limit):
+                if summary.id not in seen and len(results) < limit:
+                    results.append(summary)
+        return results
+
+    def _selected_id(self) -> Optional[int]:
+        """The id of the current row; its payload may have been evicted from the model's cache."""
+        index = self.table.currentIndex()
+        if not index.isValid():
             return None
-        return self._entries_cache.get(entry_id)
+        return self.model.id_at(self.proxy.mapToSource(index).row())
+
+    def _password_for(self, entry: VaultEntry) -> str:
+        password = self.secret_cache.get(entry.id)
+        if password is None:
+            password = decrypt(self.fernet, entry.password_encrypted)
+            self.secret_cache.put(entry.id, password)
+        return password
+
+    def _with_password(self, entry_id: int, callback: Callable[[Optional[str]], None]) -> None:
+        """Passes the secret to ``callback`` from the cache, or once it is fetched."""
+        password = self.secret_cache.get(entry_id)
+        if password is not None:
+            callback(password)
+            return
+
+        def fetched(entry: Optional[VaultEntry]) -> None:
+            if entry is None:
+                callback(None)
+                return
+            password = decrypt(self.fernet, entry.password_encrypted)
+            self.secret_cache.put(entry_id, password)
+            callback(password)
+
+        self.database.read(VaultDatabase.get_entry, entry_id, on_result=fetched)
 
     def _add_entry(self) -> None:
         dialog = EntryDialog(self, title="Add Credential")
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.get_data()
             encrypted_password = encrypt(self.fernet, data["password"])
-            self.database.add_entry(
-                data["title"], data["username"], encrypted_password, data["url"], data["notes"]
+            self.database.request(
+                "add_entry",
+                data["title"],
+                data["username"],
+                encrypted_password,
+                data["url"],
+                data["notes"],
+                on_result=lambda _: self.status_bar.showMessage("Credential saved.", 4000),
             )
-            self._refresh_table()
-            self.status_bar.showMessage("Credential saved.", 4000)
 
     def _edit_entry(self) -> None:
-        entry = self._get_selected_entry()
-        if entry is None:
+        entry_id = self._selected_id()
+        if entry_id is None:
             QMessageBox.information(self, "Edit Entry", "Select an entry to edit.")
             return
-        password = decrypt(self.fernet, entry.password_encrypted)
+        self.database.read(VaultDatabase.get_entry, entry_id, on_result=self._open_edit_dialog)
+
+    def _open_edit_dialog(self, entry: Optional[VaultEntry]) -> None:
+        if entry is None:
+            self._refresh_table()
+            return
+        password = self._password_for(entry)
         dialog = EntryDialog(self, title="Edit Credential", entry=entry, password=password)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.get_data()
             encrypted_password = encrypt(self.fernet, data["password"])
-            self.database.update_entry(
+            self.secret_cache.invalidate(entry.id)
+            self.database.request(
+                "update_entry",
                 entry.id,
                 data["title"],
                 data["username"],
                 encrypted_password,
                 data["url"],
                 data["notes"],
+                on_result=lambda _: self.status_bar.showMessage("Credential updated.", 4000),
             )
-            self._refresh_table()
-            self.status_bar.showMessage("Credential updated.", 4000)
 
     def _delete_entry(self) -> None:
-        entry = self._get_selected_entry()
-        if entry is None:
+        entry_id = self._selected_id()
+        if entry_id is None:
             QMessageBox.information(self, "Delete Entry", "Select an entry to delete.")
             return
+        self.database.read(VaultDatabase.get_entry, entry_id, on_result=self._confirm_delete)
+
+    def _confirm_delete(self, entry: Optional[VaultEntry]) -> None:
+        if entry is None:
+            self._refresh_table()
+            return
         confirm = QMessageBox.question(
             self,
             "Delete Credential",
@@ -223,16 +530,23 @@ class MainWindow(QMainWindow):
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
         )
         if confirm == QMessageBox.StandardButton.Yes:
-            self.database.delete_entry(entry.id)
-            self._refresh_table()
-            self.status_bar.showMessage("Credential removed.", 4000)
+            self.secret_cache.invalidate(entry.id)
+            self.database.request(
+                "delete_entry",
+                entry.id,
+                on_result=lambda _: self.status_bar.showMessage("Credential removed.", 4000),
+            )
 
     def _copy_password(self) -> None:
-        entry = self._get_selected_entry()
-        if entry is None:
+        entry_id = self._selected_id()
+        if entry_id is None:
             QMessageBox.information(self, "Copy Password", "Select an entry to copy.")
             return
-        password = decrypt(self.fernet, entry.password_encrypted)
+        self._with_password(entry_id, self._put_on_clipboard)
+
+    def _put_on_clipboard(self, password: Optional[str]) -> None:
+        if password is None:
+            return
         QApplication.clipboard().setText(password, mode=QClipboard.Mode.Clipboard)
         self.status_bar.showMessage("Password copied to clipboard for 30 seconds.", 4000)
         QTimer.singleShot(30000, self._clear_clipboard)
@@ -242,12 +556,333 @@ class MainWindow(QMainWindow):
         clipboard.clear(mode=QClipboard.Mode.Clipboard)
 
     def _reveal_password(self) -> None:
-        entry = self._get_selected_entry()
-        if entry is None:
+        entry_id = self._selected_id()
+        if entry_id is None:
             QMessageBox.information(self, "Reveal Password", "Select an entry to reveal.")
             return
-        password = decrypt(self.fernet, entry.password_encrypted)
-        QMessageBox.information(self, "Password", f"<b>{entry.title}</b><br><br>{password}")
+        self.database.read(VaultDatabase.get_entry, entry_id, on_result=self._show_password)
+
+    def _show_password(self, entry: Optional[VaultEntry]) -> None:
+        if entry is None:
+            self._refresh_table()
+            return
+        QMessageBox.information(self, "Password", f"<b>{entry.title}</b><br><br>{self._password_for(entry)}")
+
+    def _import_entries(self) -> None:
+        if self._transfer_task is not None:
+            return
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Import Passwords",
+            "",
+            f"Password exports (*.csv *.json *.xml *{EXPORT_SUFFIX});;All files (*)",
+        )
+        if not filename:
+            return
+        path = Path(filename)
+        if path.suffix.lower() != EXPORT_SUFFIX:
+            self._start_transfer(
+                "Import Passwords", "Importing entries...", import_file, path, self.database.path, self.fernet
+            )
+            return
+        password, accepted = QInputDialog.getText(
+            self, "Restore Export", "Password of the export file", QLineEdit.EchoMode.Password
+        )
+        if accepted and password:
+            self._start_transfer(
+                "Import Passwords",
+                "Restoring entries...",
+                import_export_file,
+                path,
+                password,
+                self.database.path,
+                self.fernet,
+            )
+
+    def _export_entries(self) -> None:
+        if self._transfer_task is not None:
+            return
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Export Vault", f"vault{EXPORT_SUFFIX}", f"Vault exports (*{EXPORT_SUFFIX})"
+        )
+        if not filename:
+            return
+        path = Path(filename)
+        if path.suffix.lower() != EXPORT_SUFFIX:
+            path = path.with_name(path.name + EXPORT_SUFFIX)
+        dialog = ExportPasswordDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self._start_transfer(
+                "Export Vault",
+                "Exporting entries...",
+                export_file,
+                self.database.path,
+                self.fernet,
+                path,
+                dialog.password(),
+            )
+
+    def _merge_vault(self) -> None:
+        if self._transfer_task is not None:
+            return
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Merge Vault", "", "Vault databases (*.db);;All files (*)"
+        )
+        if not filename:
+            return
+        path = Path(filename)
+        if path.resolve() == self.database.path.resolve():
+            QMessageBox.warning(self, "Merge Vault", "Choose another copy of the vault, not the open one.")
+            return
+        password = None
+        other_config = ConfigManager(path.with_name(CONFIG_PATH.name))
+        if other_config.exists() and other_config.read() != self.config.read():
+            password, accepted = QInputDialog.getText(
+                self, "Merge Vault", "Master password of the other vault", QLineEdit.EchoMode.Password
+            )
+            if not accepted or not password:
+                return
+        self._start_transfer(
+            "Merge Vault", "Merging entries...", merge_files, self.database.path, path, self.fernet, password
+        )
+
+    def _take_snapshot(self) -> None:
+        if self._transfer_task is not None:
+            return
+        self._start_transfer(
+            "Snapshot Vault",
+            "Storing changed entries...",
+            take_snapshot,
+            self.database.path,
+            self.config.path,
+            self._data_fernet,
+        )
+
+    def _restore_snapshot(self) -> None:
+        if self._transfer_task is not None:
+            return
+        store = SnapshotStore()
+        snapshots = store.list_snapshots()[::-1]
+        if not snapshots:
+            QMessageBox.information(self, "Restore Snapshot", "No snapshots have been taken yet.")
+            return
+        labels = [
+            f"{datetime.fromisoformat(info.created_at):%b %d, %Y %H:%M:%S} ({info.records} records)"
+            for info in snapshots
+        ]
+        label, accepted = QInputDialog.getItem(self, "Restore Snapshot", "Snapshot to restore", labels, 0, False)
+        if not accepted:
+            return
+        info = snapshots[labels.index(label)]
+        directory = QFileDialog.getExistingDirectory(self, "Restore Snapshot Into an Empty Folder")
+        if not directory:
+            return
+        fernet, password = self._data_fernet, None
+        if store.snapshot_config(info.id) != self.config.read():
+            password, accepted = QInputDialog.getText(
+                self, "Restore Snapshot", "Master password when the snapshot was taken", QLineEdit.EchoMode.Password
+            )
+            if not accepted or not password:
+                return
+            fernet = None
+        self._start_transfer(
+            "Restore Snapshot", "Restoring entries...", store.restore, info.id, Path(directory), fernet, password
+        )
+
+    def _start_transfer(self, title: str, label: str, fn, *args) -> None:
+        """Runs an import or export on its own connection behind a progress dialog."""
+        self._transfer_cancel.clear()
+        self._transfer_progress = self._progress_dialog(title, label, self._transfer_cancel)
+        self._transfer_task = TaskThread(fn, *args, self._transfer_cancel, parent=self, with_progress=True)
+        self._transfer_task.progress.connect(partial(self._update_progress, self._transfer_progress))
+        self._transfer_task.succeeded.connect(self._handle_transfer_result)
+        self._transfer_task.failed.connect(partial(self._handle_transfer_error, title, fn))
+        self._transfer_task.finished.connect(self._finish_transfer)
+        self._transfer_task.start()
+        self._transfer_progress.show()
+
+    def _handle_transfer_result(self, result) -> None:
+        if isinstance(result, int):
+            self.status_bar.showMessage(f"Exported {result} entries.", 6000)
+            return
+        if isinstance(result, SnapshotInfo):
+            self.status_bar.showMessage(
+                f"Snapshot stored: {result.new_chunks} of {result.chunks} chunks were new.", 6000
+            )
+            return
+        if isinstance(result, Path):
+            QMessageBox.information(
+                self,
+                "Restore Snapshot",
+                f"The snapshot was restored to {result.parent}.\n"
+                "Use Merge Vault on its vault.db to bring entries back into this vault.",
+            )
+            return
+        self._reload_entries()
+        if isinstance(result, MergeReport):
+            self._show_merge_report(result)
+            return
+        report: ImportReport = result
+        summary = f"Imported {report.imported} entries."
+        if report.cancelled:
+            summary = f"Import cancelled after {report.imported} entries."
+        if report.failed:
+            lines = [f"Row {error.position}: {error.message}" for error in report.errors[:10]]
+            if report.failed > len(lines):
+                lines.append(f"...and {report.failed - len(lines)} more.")
+            QMessageBox.warning(
+                self, "Import Passwords", f"{summary}\n{report.failed} rows were skipped:\n\n" + "\n".join(lines)
+            )
+        self.status_bar.showMessage(summary, 6000)
+
+    def _show_merge_report(self, report: MergeReport) -> None:
+        summary = f"Merged vaults: {report.pulled} entries updated here."
+        if report.kept:
+            summary += f" {report.kept} are newer here; merge from this copy on the other machine to update it."
+        if report.conflicts:
+            lines = [
+                f"{conflict.title or conflict.uuid}: kept the {'local' if conflict.kept == LOCAL else 'other'} version"
+                for conflict in report.conflicts[:10]
+            ]
+            if len(report.conflicts) > len(lines):
+                lines.append(f"...and {len(report.conflicts) - len(lines)} more.")
+            QMessageBox.warning(
+                self,
+                "Merge Vault",
+                f"{summary}\n{len(report.conflicts)} entries were changed in both copies; "
+                "the most recent change won:\n\n" + "\n".join(lines),
+            )
+        self.status_bar.showMessage(summary, 6000)
+
+    def _handle_transfer_error(self, title: str, fn, exc: Exception) -> None:
+        # Imports commit in batches, so a failed or cancelled one may still
+        # have added rows.
+        if fn not in (export_file, take_snapshot):
+            self._reload_entries()
+        if isinstance(exc, InterruptedError):
+            self.status_bar.showMessage(str(exc), 6000)
+            return
+        QMessageBox.warning(self, title, str(exc))
+
+    def _reload_entries(self) -> None:
+        """Refreshes the table, the quick-filter index and the cached passwords after writes through another
+        connection."""
+        self.secret_cache.clear()
+        self.database.call(self._build_index)
+        self.model.reload()
+
+    def _finish_transfer(self) -> None:
+        if self._transfer_progress is not None:
+            self._transfer_progress.close()
+            self._transfer_progress.deleteLater()
+            self._transfer_progress = None
+        if self._transfer_task is not None:
+            self._transfer_task.deleteLater()
+            self._transfer_task = None
+
+    def _progress_dialog(
+        self, title: str, label: str, cancel: threading.Event, cancel_text: str = "Cancel"
+    ) -> QProgressDialog:
+        dialog = QProgressDialog(label, cancel_text, 0, 0, self)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        dialog.setMinimumDuration(0)
+        dialog.canceled.connect(cancel.set)
+        return dialog
+
+    def _update_progress(self, dialog: QProgressDialog, done: int, total: int) -> None:
+        dialog.setMaximum(total)
+        dialog.setValue(done)
+
+    def _change_master_password(self) -> None:
+        if self._rekey_task is not None:
+            return
+        self.database.request("rekey_state", on_result=self._open_change_password)
+
+    def _open_change_password(self, state) -> None:
+        if state is not None:
+            QMessageBox.information(
+                self,
+                "Change Master Password",
+                "An earlier master password change is still paused and resumes now. "
+                "Change the password again once it has finished.",
+            )
+            self._resume_master_password_change()
+            return
+        dialog = ChangePasswordDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            data = dialog.get_data()
+            self._start_rekey(change_master_password, data["current"], data["new"])
+
+    def _check_pending_rekey(self, state) -> None:
+        if state is not None:
+            self._resume_master_password_change()
+        elif self.config.exists() and PENDING_REKEY in self.config.read():
+            # First session after a version 1 upgrade: move off the legacy data key.
+            self._resume_master_password_change("Vault moved to a new encryption key.")
+
+    def _resume_master_password_change(self, done_message: str = "Master password changed.") -> None:
+        if self._rekey_task is None:
+            self._start_rekey(resume_master_password_change, self._data_fernet, done_message=done_message)
+
+    def _start_rekey(self, fn, *args, done_message: str = "Master password changed.") -> None:
+        self._rekey_cancel.clear()
+        self._rekey_progress = self._progress_dialog(
+            "Change Master Password", "Re-encrypting your vault...", self._rekey_cancel, "Pause"
+        )
+        self._rekey_task = TaskThread(
+            fn,
+            self.database.path,
+            self.config,
+            *args,
+            self._rekey_cancel,
+            parent=self,
+            with_progress=True,
+        )
+        self._rekey_task.progress.connect(partial(self._update_progress, self._rekey_progress))
+        self._rekey_task.succeeded.connect(partial(self._handle_rekey_result, done_message))
+        self._rekey_task.failed.connect(self._handle_rekey_error)
+        self._rekey_task.finished.connect(self._finish_rekey)
+        self._rekey_task.start()
+        self._rekey_progress.show()
+
+    def _handle_rekey_result(self, done_message: str, job) -> None:
+        if job is None:
+            return
+        if job.completed:
+            self.fernet = self._data_fernet = job.new_fernet
+            self.status_bar.showMessage(done_message, 6000)
+        else:
+            # Entries are split between both keys until the change resumes.
+            self.fernet = job.fernet
+            self._data_fernet = job.old_fernet
+            self.status_bar.showMessage(
+                "Master password change paused. It resumes the next time you unlock with your current password.",
+                8000,
+            )
+
+    def _handle_rekey_error(self, exc: Exception) -> None:
+        QMessageBox.warning(self, "Change Master Password", str(exc))
+
+    def _finish_rekey(self) -> None:
+        if self._rekey_progress is not None:
+            self._rekey_progress.close()
+            self._rekey_progress.deleteLater()
+            self._rekey_progress = None
+        if self._rekey_task is not None:
+            self._rekey_task.deleteLater()
+            self._rekey_task = None
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        if self._rekey_task is not None:
+            self._rekey_cancel.set()
+            self._rekey_task.wait()
+        if self._transfer_task is not None:
+            self._transfer_cancel.set()
+            self._transfer_task.wait()
+        self.secret_cache.clear()
+        tracing.disable()
+        super().closeEvent(event)
 
 
 _MAIN_STYLES = """
@@ -280,7 +915,7 @@ QToolButton:hover {
     font-weight: 700;
 }
 
-QTableWidget {
+QTableView {
     background: rgba(16, 40, 62, 0.8);
     border-radius: 12px;
     gridline-color: rgba(255, 255, 255, 0.05);
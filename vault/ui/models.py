@@ -0,0 +1,654 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt, pyqtSignal
+
+from .. import tracing
+from ..cache import EntryCache
+from ..database import (
+    DELETED,
+    INSERTED,
+    RELOADED,
+    EntryChange,
+    EntrySummary,
+    PageKey,
+    VaultDatabase,
+    page_key,
+    sort_key,
+)
+from ..worker import AsyncVaultDatabase
+
+COLUMNS = (
+    ("title", "Title"),
+    ("username", "Username"),
+    ("url", "URL"),
+    ("updated_at", "Updated"),
+)
+
+
+def _format_timestamp(value: str) -> str:
+    return datetime.fromisoformat(value).strftime("%b %d, %Y %H:%M")
+
+
+@dataclass(eq=False)
+class _Page:
+    """A run of loaded rows; no row of the page sorts before ``low``."""
+
+    low: PageKey
+    ids: "array[int]"
+    loading: bool = False
+
+
+@dataclass
+class _Slice:
+    """Pages read right after the loaded rows, plus where the next read resumes."""
+
+    pages: List[_Page]
+    summaries: List[EntrySummary]
+    after_key: Optional[PageKey]
+    last: Optional[PageKey]
+    complete: bool
+    count: Optional[int]
+
+
+def _read_slice(
+    database: VaultDatabase,
+    after_key: Optional[PageKey],
+    limit: int,
+    page_size: int,
+    order_by: str,
+    descending: bool,
+    with_count: bool,
+) -> _Slice:
+    """Reads the ids of up to ``limit`` rows after ``after_key`` in one index range scan.
+
+    Only the rows the model needs are read in full: the first of each page
+    for its separator, and the whole last page, which is the one the view
+    asked for and whose last row is where the next read resumes.
+    """
+    count = database.count_entries() if with_count else None
+    ids = database.list_ids(after_key, limit, order_by, descending)
+    tail = (len(ids) - 1) // page_size * page_size if ids else 0
+    summaries = database.get_summaries(list(dict.fromkeys([*ids[:tail:page_size], *ids[tail:]])))
+    by_id = {summary.id: summary for summary in summaries}
+    pages = [
+        _Page(sort_key(by_id[ids[start]], order_by), array("q", ids[start : start + page_size]))
+        for start in range(0, len(ids), page_size)
+    ]
+    if ids:
+        last = by_id[ids[-1]]
+        after_key, last_key = page_key(last, order_by), sort_key(last, order_by)
+    else:
+        last_key = None
+    return _Slice(pages, summaries, after_key, last_key, len(ids) < limit, count)
+
+
+class EntryTableModel(QAbstractTableModel):
+    """Table model over the whole vault that pages rows in as the view asks for them.
+
+    The row count comes from the database. The rows read so far are a
+    sorted prefix of the listing, kept as pages of ids; rows past it are
+    blank until the view reaches them, and are then read with a keyset query
+    that resumes after the last loaded row, so no read ever skips rows by
+    offset. Row payloads live in ``cache``, a bounded LRU
+    :class:`EntryCache`, and a page whose payloads were evicted reads them
+    back by id. Only the ids, and a map from each to its page, grow with
+    the vault.
+
+    Every page read goes through the database worker, which also runs the
+    writes, so results and the change feed arrive in the order they
+    happened. Changes that arrive while a reload is in flight are already
+    part of its result and are dropped. The rest are applied in arrival
+    order together with the pages read in between. A write that lands among
+    loaded rows whose payloads were evicted waits for them to be read back,
+    and everything behind it waits too. ``refreshed`` is emitted once a
+    write is applied.
+
+    Search results are at most ``SEARCH_LIMIT`` rows, ranked by relevance,
+    and are kept in full. They are read on a pooled read-only connection so
+    a search never holds up writes, and its snapshot may be older or newer
+    than the feed; changes that arrive before the results are held and
+    replayed over them, which is harmless since applying a change to
+    search results twice has no further effect.
+    """
+
+    refreshed = pyqtSignal()
+
+    BATCH_SIZE = 256
+    MAX_PAGE = 2 * BATCH_SIZE
+    SEARCH_LIMIT = 500
+    CACHE_SIZE = 4096
+
+    def __init__(
+        self,
+        database: AsyncVaultDatabase,
+        parent=None,
+        search: Optional[Callable[[VaultDatabase, str, int], List[EntrySummary]]] = None,
+        cache_size: int = CACHE_SIZE,
+    ) -> None:
+        super().__init__(parent)
+        self.database = database
+        self._search = search or VaultDatabase.search
+        # The rows on screen can span two pages of up to MAX_PAGE rows, which
+        # must fit in the cache together or they would keep evicting each other.
+        self.cache: EntryCache[EntrySummary] = EntryCache(max(cache_size, 2 * self.MAX_PAGE))
+        self._pages: List[_Page] = []
+        # The page holding each loaded id, so a change finds its row without
+        # scanning every page.
+        self._page_of: Dict[int, _Page] = {}
+        # First row of each page, rebuilt after rows are inserted or removed.
+        self._starts: Optional[List[int]] = None
+        self._loaded = 0
+        self._count = 0
+        self._after_key: Optional[PageKey] = None
+        self._last: Optional[PageKey] = None
+        self._complete = True
+        self._extending = False
+        self._reloading = False
+        self._steps: Deque[Callable[[], bool]] = deque()
+        self._waiting: Optional[_Page] = None
+        self._reread: Optional[_Page] = None
+        # Ids with a change still queued. Rows read back from the database
+        # already show those changes while the ids still sit where they were.
+        self._queued: Counter = Counter()
+        self._results: List[EntrySummary] = []
+        self._held: List[EntryChange] = []
+        self._order_by = "title"
+        self._descending = False
+        self._query = ""
+        self._generation = 0
+        self._reload_span = None
+        self.page_ins = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hits and misses by id, plus how many pages had to be read."""
+        return {**self.cache.stats(), "page_ins": self.page_ins}
+
+    def reload(self) -> None:
+        self._generation += 1
+        # Finishes once the first page or the search results are in the model.
+        self._reload_span = tracing.span("ui.table.reload")
+        self.beginResetModel()
+        self._pages = []
+        self._page_of = {}
+        self._starts = None
+        self._loaded = self._count = 0
+        self._after_key = self._last = None
+        self._complete = True
+        self._extending = False
+        self._steps.clear()
+        self._queued.clear()
+        self._waiting = None
+        self._results = []
+        self._held = []
+        self._reloading = True
+        self.endResetModel()
+        generation = self._generation
+        if self._query:
+            self.database.read(
+                self._search,
+                self._query,
+                self.SEARCH_LIMIT,
+                on_result=lambda entries: self._set_results(generation, entries),
+            )
+            return
+        self.database.call(
+            _read_slice,
+            None,
+            self.BATCH_SIZE,
+            self.BATCH_SIZE,
+            self._order_by,
+            self._descending,
+            True,
+            on_result=lambda result: self._set_first_page(generation, result),
+        )
+
+    def _set_results(self, generation: int, entries: List[EntrySummary]) -> None:
+        if generation != self._generation:
+            return
+        self._reloading = False
+        self.beginResetModel()
+        self._results = list(entries)
+        self.endResetModel()
+        held, self._held = self._held, []
+        for change in held:
+            self.apply_change(change)
+        self._finish_reload_span()
+
+    def _set_first_page(self, generation: int, result: _Slice) -> None:
+        if generation != self._generation:
+            return
+        self._reloading = False
+        if result.count:
+            self.beginInsertRows(QModelIndex(), 0, result.count - 1)
+            self._count = result.count
+            self.endInsertRows()
+        self._add_slice(result)
+        self._finish_reload_span()
+
+    def _finish_reload_span(self) -> None:
+        if self._reload_span is not None:
+            self._reload_span.finish()
+            self._reload_span = None
+
+    def set_search(self, query: str) -> None:
+        query = query.strip()
+        if query != self._query:
+            self._query = query
+            self.reload()
+
+    def entry_at(self, row: int) -> Optional[EntrySummary]:
+        """Returns the row if it is in memory, and otherwise starts paging it in."""
+        if self._query:
+            return self._results[row] if 0 <= row < len(self._results) else None
+        if not 0 <= row < self._count:
+            return None
+        if row >= self._loaded:
+            self._extend(row)
+            return None
+        index, offset = self._page_at(row)
+        page = self._pages[index]
+        entry = self.cache.get(page.ids[offset])
+        if entry is None:
+            self._load_page(page)
+        return entry
+
+    def id_at(self, row: int) -> Optional[int]:
+        """Returns the id of a loaded row, whether or not its payload is cached."""
+        if self._query:
+            return self._results[row].id if 0 <= row < len(self._results) else None
+        if not 0 <= row < self._loaded:
+            return None
+        index, offset = self._page_at(row)
+        return self._pages[index].ids[offset]
+
+    def _extend(self, row: int) -> None:
+        """Reads the rows after the loaded ones, through the page holding ``row``."""
+        if self._extending or self._reloading or self._complete:
+            return
+        self._extending = True
+        self.page_ins += 1
+        generation = self._generation
+        pages = (row - self._loaded) // self.BATCH_SIZE + 1
+        self.database.call(
+            _read_slice,
+            self._after_key,
+            pages * self.BATCH_SIZE,
+            self.BATCH_SIZE,
+            self._order_by,
+            self._descending,
+            False,
+            on_result=lambda result: self._queue(generation, lambda: self._add_slice(result)),
+        )
+
+    def _add_slice(self, result: _Slice) -> bool:
+        self._extending = False
+        self.cache.put_many((summary.id, summary) for summary in result.summaries)
+        first = self._loaded
+        self._pages.extend(result.pages)
+        for page in result.pages:
+            self._page_of.update(dict.fromkeys(page.ids, page))
+        self._starts = None
+        self._loaded += sum(len(page.ids) for page in result.pages)
+        self._after_key, self._last = result.after_key, result.last or self._last
+        self._complete = result.complete
+        # Only a write through another connection without a reload can get
+        # here; the listing itself is the truth.
+        if self._loaded > self._count or (self._complete and self._loaded < self._count):
+            self._resize_tail(self._loaded)
+        if self._loaded > first:
+            self.dataChanged.emit(self.index(first, 0), self.index(self._loaded - 1, len(COLUMNS) - 1))
+        return True
+
+    def _load_page(self, page: _Page) -> None:
+        if page.loading:
+            return
+        page.loading = True
+        self.page_ins += 1
+        generation = self._generation
+        self.database.call(
+            VaultDatabase.get_summaries,
+            list(page.ids),
+            on_result=lambda summaries: self._set_page(generation, page, summaries),
+        )
+
+    def _set_page(self, generation: int, page: _Page, summaries: List[EntrySummary]) -> None:
+        if generation != self._generation:
+            return
+        page.loading = False
+        self.cache.put_many((summary.id, summary) for summary in summaries)
+        index = self._index_of(page)
+        if index is not None:
+            first = self._page_start(index)
+            self.dataChanged.emit(self.index(first, 0), self.index(first + len(page.ids) - 1, len(COLUMNS) - 1))
+        if self._waiting is page:
+            # Ids whose rows are gone by now are left out of the comparison.
+            self._waiting, self._reread = None, page
+            self._drain()
+            self._reread = None
+
+    def _page_starts(self) -> List[int]:
+        if self._starts is None:
+            self._starts = []
+            start = 0
+            for page in self._pages:
+                self._starts.append(start)
+                start += len(page.ids)
+        return self._starts
+
+    def _page_start(self, index: int) -> int:
+        starts = self._page_starts()
+        return starts[index] if index < len(starts) else self._loaded
+
+    def _page_at(self, row: int) -> Tuple[int, int]:
+        starts = self._page_starts()
+        index = bisect_right(starts, row) - 1
+        return index, row - starts[index]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._results) if self._query else self._count
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def apply_change(self, change: EntryChange) -> None:
+        """Mirrors one committed write, in feed order, without re-reading the rows around it."""
+        if change.kind == RELOADED:
+            self.reload()
+            return
+        if self._reloading:
+            if self._query:
+                self._held.append(change)
+            return
+        if self._query:
+            # Search results keep their relevance order; new entries show up
+            # with the next query.
+            self.cache.invalidate(change.entry_id)
+            row = self.row_of(change.entry_id)
+            if row is not None:
+                if change.kind == DELETED:
+                    self.beginRemoveRows(QModelIndex(), row, row)
+                    del self._results[row]
+                    self.endRemoveRows()
+                else:
+                    self._results[row] = change.summary
+                    self._emit_row_changed(row)
+            self.refreshed.emit()
+            return
+        self._queued[change.entry_id] += 1
+        self._queue(self._generation, lambda: self._apply(change))
+
+    def _queue(self, generation: int, step: Callable[[], bool]) -> None:
+        if generation == self._generation:
+            self._steps.append(step)
+            self._drain()
+
+    def _drain(self) -> None:
+        """Runs queued steps in order until one has to wait for a page of payloads."""
+        while self._steps and self._waiting is None:
+            if not self._steps[0]():
+                return
+            self._steps.popleft()
+
+    def _apply(self, change: EntryChange) -> bool:
+        entry_id = change.entry_id
+        target = None
+        if change.kind != DELETED and self._in_prefix(sort_key(change.summary, self._order_by)):
+            target = self._position(change.summary)
+            if target is None:
+                return False
+        old = self._find(entry_id)
+        self._queued -= Counter((entry_id,))
+        if change.kind == DELETED:
+            self.cache.invalidate(entry_id)
+            self._remove_row(old)
+            self.refreshed.emit()
+            return True
+        self.cache.put(entry_id, change.summary)
+        if old is not None and target is not None:
+            self._move_row(old, target, entry_id)
+        elif old is not None:
+            # It now sorts past the loaded rows.
+            self._remove_row(old)
+            self._insert_virtual()
+        elif target is not None:
+            if change.kind != INSERTED:
+                self._remove_virtual()
+            self._insert_row(target, entry_id)
+        elif change.kind == INSERTED:
+            self._insert_virtual()
+        self.refreshed.emit()
+        return True
+
+    def _in_prefix(self, key: PageKey) -> bool:
+        """Whether a row with ``key`` belongs among the loaded rows."""
+        return self._complete or (self._last is not None and not self._sorts_before(self._last, key))
+
+    def _sorts_before(self, left: PageKey, right: PageKey) -> bool:
+        return left > right if self._descending else left < right
+
+    def _position(self, summary: EntrySummary) -> Optional[Tuple[int, int]]:
+        """Finds the page and offset ``summary`` sorts to, ignoring its current row.
+
+        Returns ``None`` after asking for the page's payloads if any are
+        missing from the cache. Rows with a change still queued are left out
+        of the comparison, since their cached payloads may be ahead of their
+        position.
+        """
+        if not self._pages:
+            return 0, 0
+        key = sort_key(summary, self._order_by)
+        index = self._page_for(key)
+        page = self._pages[index]
+        keys: List[Optional[PageKey]] = []
+        for entry_id in page.ids:
+            if entry_id == summary.id:
+                continue
+            entry = self.cache.get(entry_id)
+            if entry is None and page is not self._reread:
+                self._waiting = page
+                self._load_page(page)
+                return None
+            known = entry is not None and entry_id not in self._queued
+            keys.append(sort_key(entry, self._order_by) if known else None)
+        offset = len(keys)
+        for position, probe in enumerate(keys):
+            if probe is not None and self._sorts_before(key, probe):
+                offset = position
+                break
+        return index, offset
+
+    def _page_for(self, key: PageKey) -> int:
+        """The index of the last page whose ``low`` does not sort after ``key``, or 0."""
+        low, high = 0, len(self._pages)
+        while low < high:
+            middle = (low + high) // 2
+            if self._sorts_before(key, self._pages[middle].low):
+                high = middle
+            else:
+                low = middle + 1
+        return max(low - 1, 0)
+
+    def _index_of(self, page: _Page) -> Optional[int]:
+        """The index of ``page`` in ``_pages``, or ``None`` once it has been dropped.
+
+        Every page's ``low`` is a different row's key and sorts after the
+        ``low`` of the page before it, so a bisect by it lands on the page.
+        """
+        if not self._pages:
+            return None
+        index = self._page_for(page.low)
+        return index if self._pages[index] is page else None
+
+    def _find(self, entry_id: int) -> Optional[Tuple[int, int]]:
+        page = self._page_of.get(entry_id)
+        if page is None:
+            return None
+        return self._index_of(page), page.ids.index(entry_id)
+
+    def _insert_row(self, target: Tuple[int, int], entry_id: int) -> None:
+        index, offset = target
+        if not self._pages:
+            self._pages.append(_Page(sort_key(self.cache.get(entry_id), self._order_by), array("q")))
+        row = self._page_start(index) + offset
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._place(index, offset, entry_id)
+        self._count += 1
+        self.endInsertRows()
+
+    def _remove_row(self, located: Optional[Tuple[int, int]]) -> None:
+        if located is None:
+            self._remove_virtual()
+            return
+        index, offset = located
+        row = self._page_start(index) + offset
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self._take(index, offset)
+        self._count -= 1
+        self.endRemoveRows()
+
+    def _move_row(self, old: Tuple[int, int], target: Tuple[int, int], entry_id: int) -> None:
+        source = self._page_start(old[0]) + old[1]
+        # ``target`` counts rows without this one, so it shifts up a row
+        # when the entry currently sits on an earlier page.
+        row = self._page_start(target[0]) - (old[0] < target[0]) + target[1]
+        if row == source:
+            self._emit_row_changed(row)
+            return
+        # A move, unlike remove-and-insert, keeps the selection on the row.
+        self.beginMoveRows(QModelIndex(), source, source, QModelIndex(), row + 1 if row > source else row)
+        index, offset = target
+        empty = self._take(*old)
+        if empty and old[0] < index:
+            index -= 1
+        self._place(index, offset, entry_id)
+        self.endMoveRows()
+        self._emit_row_changed(row)
+
+    def _place(self, index: int, offset: int, entry_id: int) -> None:
+        page = self._pages[index]
+        page.ids.insert(offset, entry_id)
+        self._page_of[entry_id] = page
+        if index == 0 and offset == 0:
+            page.low = sort_key(self.cache.get(entry_id), self._order_by)
+        self._loaded += 1
+        self._starts = None
+        if len(page.ids) > self.MAX_PAGE:
+            self._split(index)
+
+    def _split(self, index: int) -> None:
+        """Halves a page grown by inserts, at the first row past the middle whose key is cached."""
+        page = self._pages[index]
+        for middle in range(len(page.ids) // 2, len(page.ids)):
+            entry = self.cache.get(page.ids[middle])
+            if entry is not None and page.ids[middle] not in self._queued:
+                tail = _Page(sort_key(entry, self._order_by), page.ids[middle:])
+                del page.ids[middle:]
+                self._page_of.update(dict.fromkeys(tail.ids, tail))
+                self._pages.insert(index + 1, tail)
+                return
+
+    def _take(self, index: int, offset: int) -> bool:
+        """Removes a loaded row; returns whether that emptied its page, which is then dropped."""
+        page = self._pages[index]
+        del self._page_of[page.ids[offset]]
+        del page.ids[offset]
+        self._loaded -= 1
+        self._starts = None
+        if page.ids:
+            return False
+        del self._pages[index]
+        return True
+
+    def _insert_virtual(self) -> None:
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded)
+        self._count += 1
+        self.endInsertRows()
+
+    def _remove_virtual(self) -> None:
+        if self._count > self._loaded:
+            self.beginRemoveRows(QModelIndex(), self._loaded, self._loaded)
+            self._count -= 1
+            self.endRemoveRows()
+
+    def _resize_tail(self, count: int) -> None:
+        if count > self._count:
+            self.beginInsertRows(QModelIndex(), self._count, count - 1)
+            self._count = count
+            self.endInsertRows()
+        elif count < self._count:
+            self.beginRemoveRows(QModelIndex(), count, self._count - 1)
+            self._count = count
+            self.endRemoveRows()
+
+    def row_of(self, entry_id: int) -> Optional[int]:
+        """The row of ``entry_id`` if it is among the loaded rows."""
+        if self._query:
+            for row, entry in enumerate(self._results):
+                if entry.id == entry_id:
+                    return row
+            return None
+        located = self._find(entry_id)
+        return self._page_start(located[0]) + located[1] if located is not None else None
+
+    def _emit_row_changed(self, row: int) -> None:
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.UserRole):
+            return None
+        entry = self.entry_at(index.row())
+        if entry is None:
+            return None
+        if role == Qt.ItemDataRole.UserRole:
+            return entry.id
+        key = COLUMNS[index.column()][0]
+        if key == "title":
+            return entry.title
+        if key == "username":
+            return entry.username
+        if key == "url":
+            return entry.url or "-"
+        return _format_timestamp(entry.updated_at)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section][1]
+        return None
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder) -> None:
+        self._order_by = COLUMNS[column][0]
+        self._descending = order == Qt.SortOrder.DescendingOrder
+        if not self._query:
+            self.reload()
+            return
+        self.layoutAboutToBeChanged.emit()
+        self._results.sort(key=lambda entry: sort_key(entry, self._order_by), reverse=self._descending)
+        self.layoutChanged.emit()
+
+
+class EntryFilterProxyModel(QSortFilterProxyModel):
+    """Filters the loaded rows while leaving ordering to the database."""
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.setFilterKeyColumn(-1)
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder) -> None:
+        source = self.sourceModel()
+        if source is not None:
+            source.sort(column, order)
+
+
+__all__ = ["EntryFilterProxyModel", "EntryTableModel"]
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class TaskThread(QThread):
+    """Runs a blocking callable off the GUI thread and reports back via signals."""
+
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, fn: Callable[..., Any], *args: Any, parent=None, with_progress: bool = False) -> None:
+        super().__init__(parent)
+        self._fn = fn
+        self._args = args
+        self._with_progress = with_progress
+
+    def run(self) -> None:
+        try:
+            if self._with_progress:
+                result = self._fn(*self._args, progress=self.progress.emit)
+            else:
+                result = self._fn(*self._args)
+        except Exception as exc:  # surfaced to the GUI thread via ``failed``
+            self.failed.emit(exc)
+            return
+        self.succeeded.emit(result)
+
+
+__all__ = ["TaskThread"]
@@ -0,0 +1,174 @@
+"""Runs every SQLite call on a dedicated thread so the GUI never waits on disk.
+
+``DatabaseWorker`` owns the UI's writable :class:`VaultDatabase` connection
+and executes queued requests strictly in submission order. That gives the
+caller read-your-writes ordering without any locking. Reads that need not
+be ordered against the change feed can go through
+:meth:`DatabaseWorker.read` instead, which runs them on the database's
+read-only connection pool: they still see every write queued before them,
+but no write queued after them waits for them. Each request returns a :class:`concurrent.futures.Future`.
+``AsyncVaultDatabase`` adds Qt delivery on top: result and error callbacks
+run on the thread that owns the object, normally the GUI thread.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .config import DB_PATH
+from .database import DEFAULT_STORAGE, StorageProfile, VaultDatabase
+
+_STOP = object()
+
+
+def _call_method(database: VaultDatabase, method: str, *args: Any) -> Any:
+    return getattr(database, method)(*args)
+
+
+def _nothing(database: VaultDatabase) -> None:
+    return None
+
+
+class DatabaseWorker:
+    def __init__(self, path: Path = DB_PATH, profile: StorageProfile = DEFAULT_STORAGE) -> None:
+        self.path = path
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._opened: Future = Future()
+        self._thread = threading.Thread(target=self._run, args=(profile,), name="vault-database", daemon=True)
+        self._thread.start()
+        # Surface schema or permission errors to the caller right away.
+        self._database: VaultDatabase = self._opened.result()
+        self._readers = ThreadPoolExecutor(max(profile.readers, 1), thread_name_prefix="vault-reader")
+
+    def call(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Queues ``fn(database, *args)`` and returns a future for its result."""
+        future: Future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def request(self, method: str, *args: Any) -> Future:
+        """Queues a :class:`VaultDatabase` method call by name."""
+        return self.call(_call_method, method, *args)
+
+    def read(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Runs ``fn(reader, *args)`` on a pooled read-only connection.
+
+        It starts once every call queued before it has finished, so it sees
+        their writes. Its snapshot may also include later writes.
+        """
+        return self._readers.submit(self._read, self.call(_nothing), fn, args)
+
+    def _read(self, queued: Future, fn: Callable[..., Any], args: tuple) -> Any:
+        queued.result()
+        with self._database.reader() as reader:
+            return fn(reader, *args)
+
+    def close(self) -> None:
+        self._readers.shutdown(wait=True)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self, profile: StorageProfile) -> None:
+        try:
+            database = VaultDatabase(self.path, profile)
+        except BaseException as exc:
+            self._opened.set_exception(exc)
+            return
+        self._opened.set_result(database)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                future, fn, args = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(database, *args))
+                except BaseException as exc:
+                    future.set_exception(exc)
+        finally:
+            database.close()
+
+
+class AsyncVaultDatabase(QObject):
+    """Qt front end for :class:`DatabaseWorker`.
+
+    ``on_result`` and ``on_error`` run on this object's thread. Errors without
+    an ``on_error`` handler are re-emitted through :attr:`failed`. Every
+    committed entry write is announced through :attr:`entry_changed` before
+    the result callback of the call that made it.
+    """
+
+    failed = pyqtSignal(object)
+    entry_changed = pyqtSignal(object)
+    _completed = pyqtSignal(object, object, object)
+
+    def __init__(self, path: Path = DB_PATH, parent=None, profile: StorageProfile = DEFAULT_STORAGE) -> None:
+        super().__init__(parent)
+        self._worker = DatabaseWorker(path, profile)
+        self._completed.connect(self._deliver)
+        # Queued ahead of any write, so no change can slip past the feed.
+        self._worker.request("add_listener", self.entry_changed.emit)
+
+    @property
+    def path(self) -> Path:
+        return self._worker.path
+
+    def call(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_result: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> Future:
+        return self._deliver_later(self._worker.call(fn, *args), on_result, on_error)
+
+    def request(
+        self,
+        method: str,
+        *args: Any,
+        on_result: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> Future:
+        return self.call(_call_method, method, *args, on_result=on_result, on_error=on_error)
+
+    def read(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_result: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> Future:
+        """Like :meth:`call`, but on a read-only connection outside the write queue."""
+        return self._deliver_later(self._worker.read(fn, *args), on_result, on_error)
+
+    def _deliver_later(self, future: Future, on_result, on_error) -> Future:
+        # Emitting from a worker thread queues delivery onto our own thread.
+        future.add_done_callback(lambda done: self._completed.emit(done, on_result, on_error))
+        return future
+
+    def close(self) -> None:
+        self._worker.close()
+
+    def _deliver(self, future: Future, on_result, on_error) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            if on_error is not None:
+                on_error(exc)
+            else:
+                self.failed.emit(exc)
+            return
+        if on_result is not None:
+            on_result(future.result())
+
+
+__all__ = ["AsyncVaultDatabase", "DatabaseWorker"]